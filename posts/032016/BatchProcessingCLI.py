@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python script running the resize and sepia tone effect batch processing with the PIL,
+# OpenCV or ImageMagick (Wand) implementation, chosen on the command line (developed with & tested
+# against Python 3.5)
+# Backend
+# Only the module of the chosen backend is imported, once the command line is parsed, and the
+# modules used by a single operation (such as SciPy for the sepia tone effect of PIL, listed by the
+# lazyDependencies of the backend) are only imported when that operation runs. The other options
+# (--input-dir, --output-dir, --operations, --resize-percentages, ...) are those of the backend.
+# Startup
+# --profile-startup imports the backend and the modules of the selected operations in a new
+# Python process run with -X importtime, and prints the import time per top level package.
+# Server
+# --serve imports the backend and the modules of the selected operations once, prints a ready line,
+# then runs a batch per line of options read from the standard input, keeping the imports, lookup
+# tables and scratch buffers of the backend warm between batches. A line ok (number of failed
+# images) or error (reason) is printed per batch, the output of the batches goes to the standard
+# error.
+#
+# Usage: python BatchProcessingCLI.py --backend pil --operations resize --input-dir ../images/in
+#        python BatchProcessingCLI.py --backend opencv --profile-startup
+#        python BatchProcessingCLI.py --backend opencv --serve < batches.txt
+# *****
+
+
+
+import os
+import sys
+import time
+import shlex
+import argparse
+import importlib
+import contextlib
+import subprocess
+from BatchProcessingDriver import batchOperations
+
+
+
+batchBackends = {"pil": "BatchProcessingPIL", "opencv": "BatchProcessingOpenCV", "wand": "BatchProcessingImageMagick"}
+serverReadyLine = "ready"       # Printed by --serve once the backend is imported
+
+
+
+# *****
+# GetOperationModuleNames
+#
+# Description: Names of the modules a backend imports only when running some operations
+#
+# Parameters:
+#    inBackendModule : Module of the backend
+#    inOperations : Operations run, see BatchProcessingDriver.batchOperations
+#
+# Returns: List of module names
+# *****
+def GetOperationModuleNames(inBackendModule, inOperations):
+
+    lazyDependencies = getattr(inBackendModule, "lazyDependencies", {})
+
+    return [moduleName for operation in inOperations for moduleName in lazyDependencies.get(operation, ())]
+
+
+# *****
+# LoadBackend
+#
+# Description: Imports the module of a backend, and optionally the modules of the operations it runs
+#
+# Parameters:
+#    inBackendName : One of batchBackends
+#    inOperations : Operations whose modules are imported right away, empty to import them when used
+#
+# Returns: Module of the backend
+# *****
+def LoadBackend(inBackendName, inOperations=()):
+
+    backendModule = importlib.import_module(batchBackends[inBackendName])
+
+    for moduleName in GetOperationModuleNames(backendModule, inOperations):
+        importlib.import_module(moduleName)
+
+    return backendModule
+
+
+# *****
+# ParseImportTimes
+#
+# Description: Sums the import times printed by python -X importtime per top level package
+#
+# Parameters:
+#    inImportTimeLines : Lines "import time: self [us] | cumulative | imported package"
+#
+# Returns: Dictionary of the import time in seconds per top level package, excluding the packages
+# it imports
+# *****
+def ParseImportTimes(inImportTimeLines):
+
+    packageSeconds = {}
+
+    for importTimeLine in inImportTimeLines:
+
+        if not importTimeLine.startswith("import time:"):
+            continue
+
+        importFields = importTimeLine[len("import time:"):].split("|")
+        if len(importFields) != 3 or not importFields[0].strip().isdigit():
+            continue
+
+        # The self time of every module, nested ones included, so that a package is not charged for
+        # the packages it imports
+        packageName = importFields[2].strip().split(".")[0]
+        packageSeconds[packageName] = packageSeconds.get(packageName, 0.0) + int(importFields[0]) / 1e6
+
+    return packageSeconds
+
+
+# *****
+# ProfileStartup
+#
+# Description: Prints the import time per top level package of a backend and of the modules of the
+# selected operations, measured in a new Python process
+#
+# Parameters:
+#    inBackendName : One of batchBackends
+#    inOperations : Operations whose modules are imported as well
+# *****
+def ProfileStartup(inBackendName, inOperations):
+
+    importCode = "import BatchProcessingCLI; BatchProcessingCLI.LoadBackend(" + repr(inBackendName) + ", " + repr(list(inOperations)) + ")"
+
+    startTime = time.perf_counter()
+    profileProcess = subprocess.run([sys.executable, "-X", "importtime", "-c", importCode], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    processSeconds = time.perf_counter() - startTime
+
+    if profileProcess.returncode != 0:
+        print("Unable to import the " + inBackendName + " backend:")
+        print(profileProcess.stderr)
+        return
+
+    packageSeconds = ParseImportTimes(profileProcess.stderr.splitlines())
+
+    print("Startup of the " + inBackendName + " backend for " + " ".join(inOperations) + ":")
+    for packageName, importSeconds in sorted(packageSeconds.items(), key=lambda packageItem: -packageItem[1]):
+        print("    {:<24} {:8.1f} ms".format(packageName, importSeconds * 1000))
+    print("    {:<24} {:8.1f} ms".format("total imports", sum(packageSeconds.values()) * 1000))
+    print("    {:<24} {:8.1f} ms".format("process", processSeconds * 1000))
+
+
+# *****
+# ServeBatches
+#
+# Description: Runs a batch per line of options read from a stream, with the backend kept imported
+#
+# Parameters:
+#    inBackendModule : Module of the backend, see LoadBackend
+#    inBackendArgv : Options of the backend common to all batches, those of a line are added to them
+#    inInputStream : Stream of the lines of options
+#    inOutputStream : Stream of the ready line and the line of the result of each batch
+# *****
+def ServeBatches(inBackendModule, inBackendArgv, inInputStream, inOutputStream):
+
+    print(serverReadyLine, file=inOutputStream, flush=True)
+
+    for batchLine in inInputStream:
+
+        try:
+            batchArgv = shlex.split(batchLine)
+        except ValueError as err:
+            print("error " + str(err), file=inOutputStream, flush=True)
+            continue
+
+        if not batchArgv:
+            continue
+
+        # The messages of the batch go to the standard error, the output stream only gets results
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                failedImages = inBackendModule.Main(inBackendArgv + batchArgv)
+            print("ok " + str(len(failedImages)), file=inOutputStream, flush=True)
+        except SystemExit as err:
+            print("error invalid options (exit status " + str(err.code) + ")", file=inOutputStream, flush=True)
+        except Exception as err:
+            print("error " + type(err).__name__ + ": " + str(err), file=inOutputStream, flush=True)
+
+
+# *****
+# Main
+#
+# Description: Runs the batch processing with the backend chosen on the command line
+#
+# Parameters:
+#    inArgv : Command line options, None for those of the script
+#
+# Returns: List of (path and file name, error) of the images that could not be processed, empty with
+# --profile-startup and --serve
+# *****
+def Main(inArgv=None):
+
+    # The options of the backend are only known once it is imported, they are passed through to it
+    parser = argparse.ArgumentParser(description="Resize jpg images by percentage and apply sepia tone effect using PIL, OpenCV or ImageMagick", add_help=False)
+    parser.add_argument("--backend", choices=sorted(batchBackends), default="opencv", help="Implementation processing the images (default: opencv)")
+    parser.add_argument("--operations", choices=batchOperations, nargs="+", default=list(batchOperations), help="Operations applied to the images, only their modules are imported (default: resize sepia)")
+    parser.add_argument("--profile-startup", action="store_true", help="Print the import time of the backend and of the modules of the operations per package")
+    parser.add_argument("--serve", action="store_true", help="Keep the backend imported and run a batch per line of options read from the standard input")
+    args, backendArgv = parser.parse_known_args(inArgv)
+    backendArgv = ["--operations"] + args.operations + backendArgv
+
+    if "-h" in backendArgv or "--help" in backendArgv:
+        parser.print_help()
+        print("\nOptions of the " + args.backend + " backend follow.\n")
+
+    if args.profile_startup:
+        ProfileStartup(args.backend, args.operations)
+        return []
+
+    if args.serve:
+        ServeBatches(LoadBackend(args.backend, args.operations), backendArgv, sys.stdin, sys.stdout)
+        return []
+
+    return LoadBackend(args.backend).Main(backendArgv)
+
+
+
+if __name__ == "__main__":
+
+    # Exit with an error status when images could not be processed
+    sys.exit(1 if Main() else 0)
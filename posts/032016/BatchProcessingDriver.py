@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module driving the batch processing of a directory of images, shared by the
+# PIL, OpenCV and ImageMagick scripts (developed with & tested against Python 3.5)
+# Driver
+# The images of the input directory (and of its subdirectories with --recursive) are processed one
+# after the other, across a pool of worker processes (--workers), across worker processes sharing
+# the decoded images (--shared-frames) or through an overlapped pipeline (--pipeline). With
+# --incremental, the images whose results are up to date are skipped and identical images are
+# copied rather than processed again. With --work-queue, the images are shared with the processes
+# of other runs and hosts through a work queue, claimed a few at a time. With --effect, the sepia
+# operation applies an effect of EffectChain.py instead of the sepia tone effect. With --multi-frame,
+# multi-page tif and animated gif and webp images are processed frame by frame, see MultiFrameImages.py.
+# Stage timings are reported with --report-json and --report-prometheus, per image with --report-records.
+#
+# Usage: Imported by BatchProcessingPIL.py, BatchProcessingOpenCV.py and BatchProcessingImageMagick.py,
+# which are run directly or through BatchProcessingCLI.py
+# *****
+
+
+
+import os
+import argparse
+import functools
+import itertools
+from BatchProcessingParallel import ProcessImagesInParallel
+from BatchProcessingPipeline import ProcessImagesInPipeline
+from DirectoryScanner import imageExtensions, ScanImageFiles
+from StageTimer import EnableInstrumentation, ResetInstrumentation, WriteJSONReport, WritePrometheusReport
+from IncrementalManifest import manifestFileName, LoadManifest, SaveManifest, GetProcessingParamsKey, PlanIncrementalRun, CompleteIncrementalRun
+from MemoryAdmission import MemoryAdmission, OrderImagesLargestFirst
+from JpegEncoding import AddJpegArguments
+from EffectChain import ParseEffectChain
+from WorkQueue import WorkQueue, KeepLeases
+from MultiFrameImages import multiFrameExtensions, IsMultiFrameImage, SetAsideMultiFrameImages, ProcessMultiFrameImage, ProcessMultiFrameImages
+
+
+
+imageBatchChunkSize = 64    # Number of images handed at a time to a function processing images in batches
+
+batchOperations = ("resize", "sepia")   # Operations of the batch processing scripts, selected by --operations
+defaultResizePercentages = [75, 50, 25] # Percentages by which to resize input images
+
+
+
+# *****
+# CreateBatchArgumentParser
+#
+# Description: Creates the command line parser with the options common to the batch processing scripts
+#
+# Parameters:
+#    inDescription : Description of the script
+#    inSharedFrames : Add the --shared-frames and --pixel-cache-* options, for scripts processing NumPy arrays of pixels
+#
+# Returns: argparse.ArgumentParser, to which the script may add its own options
+# *****
+def CreateBatchArgumentParser(inDescription, inSharedFrames=False):
+
+    parser = argparse.ArgumentParser(description=inDescription)
+    parser.add_argument("--input-dir", default=os.path.join("..","images","in"), help="Input directory where the jpg images reside (default: ../images/in)")
+    parser.add_argument("--output-dir", default=os.path.join("..","images","out"), help="Output directory where the results are saved (default: ../images/out)")
+    parser.add_argument("--recursive", action="store_true", help="Also process the images in the subdirectories of the input directory")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB", help="Only process the images matching this glob pattern, may be repeated")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB", help="Skip the images and subdirectories matching this glob pattern, may be repeated")
+    parser.add_argument("--multi-frame", action="store_true", help="Also process the multi-page tif and animated gif and webp images, frame by frame across the worker processes, into results of the same format")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes, 0 for one per CPU core (default: 1)")
+    parser.add_argument("--pipeline", action="store_true", help="Overlap decoding, processing and encoding of images on threads")
+    parser.add_argument("--reader-threads", type=int, default=2, help="Number of pipeline threads decoding images (default: 2)")
+    parser.add_argument("--compute-threads", type=int, default=1, help="Number of pipeline threads processing images (default: 1)")
+    parser.add_argument("--writer-threads", type=int, default=2, help="Number of pipeline threads encoding images (default: 2)")
+    parser.add_argument("--queue-size", type=int, default=4, help="Maximum number of images waiting between pipeline stages (default: 4)")
+    if inSharedFrames:
+        parser.add_argument("--shared-frames", type=int, default=0, metavar="SLOTS", help="Decode images into this number of shared memory slots processed by the worker processes (default: 0, off)")
+        parser.add_argument("--pixel-cache-dir", help="Cache the decoded pixels of the images in this directory, later runs map them instead of decoding the images")
+        parser.add_argument("--pixel-cache-mb", type=int, default=4096, help="Size of the --pixel-cache-dir cache above which the least recently used pixels are removed, in MB (default: 4096)")
+    parser.add_argument("--memory-budget-mb", type=int, default=0, help="Only process images at the same time while their estimated memory fits in this many MB, largest images first, with --workers or --pipeline (default: 0, no budget)")
+    parser.add_argument("--report-json", help="Write a JSON report of the time spent per stage to this file")
+    parser.add_argument("--report-prometheus", help="Write Prometheus text format metrics of the time spent per stage to this file")
+    parser.add_argument("--report-records", action="store_true", help="Also write the time of each stage of each image to the --report-json report, kept in memory for the whole run")
+    parser.add_argument("--incremental", action="store_true", help="Skip images whose results are up to date and copy the results of identical images")
+    parser.add_argument("--full-check", action="store_true", help="With --incremental, hash every image rather than trusting unchanged sizes and modification times")
+    parser.add_argument("--work-queue", metavar="QUEUE_FILE", help="Share the images with the other runs using this SQLite work queue, on a filesystem shared by their hosts, images changed since they were done being processed again")
+    parser.add_argument("--lease-seconds", type=int, default=300, help="Duration of the leases of the images claimed from --work-queue, renewed while they are processed (default: 300)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Number of attempts after which an image of --work-queue is a dead letter (default: 3)")
+    parser.add_argument("--claim-size", type=int, default=8, help="Number of images claimed at a time from --work-queue (default: 8)")
+    parser.add_argument("--retry-dead", action="store_true", help="Make the dead letters of --work-queue pending again")
+    AddJpegArguments(parser)
+
+    return parser
+
+
+# *****
+# AddOperationArguments
+#
+# Description: Adds the options selecting the operations applied to the images to a command line parser
+#
+# Parameters:
+#    inParser : argparse.ArgumentParser
+# *****
+def AddOperationArguments(inParser):
+
+    inParser.add_argument("--operations", choices=batchOperations, nargs="+", default=list(batchOperations), help="Operations applied to the images (default: resize sepia)")
+    inParser.add_argument("--resize-percentages", type=int, nargs="+", default=defaultResizePercentages, metavar="PERCENTAGE", help="Percentages by which to resize the images (default: 75 50 25)")
+    inParser.add_argument("--effect", type=ParseEffectChain, metavar="EFFECT", help="Effect applied by the sepia operation instead of the sepia tone effect, a look (sepia, noir, warm, cool, faded) or steps such as 'desaturate blur:1.5 multiply:#f0e0c0 vignette:0.4', see EffectChain.py")
+
+
+# *****
+# ProcessBatch
+#
+# Description: Processes images one after the other, across worker processes or through a pipeline
+#
+# Parameters:
+#    inArgs : Parsed command line options
+#    inBatchInImageFNs : List of paths and file names of the images to process
+#    inProcessImageFunc : Function processing an image and saving its results, given its path and file name
+#    inLoadImageFunc : Function opening and decoding an image, for the pipeline
+#    inComputeOutputsFunc : Function computing the (output path and file name, image) of each result, for the pipeline
+#    inSaveImageFunc : Function encoding and saving a result, for the pipeline
+#    inProcessedImageFNs : List to which the images are appended as they are processed one after the other
+#    inLoadFrameFunc : Function decoding an image to a NumPy array, for --shared-frames
+#    inFrameToImageFunc : Function wrapping a NumPy array as an image without copy, for --shared-frames
+#    inProcessImageBatchFunc : Function processing many images and saving their results, given their
+#                              paths and file names and returning the (path and file name, error or None)
+#                              of each, used instead of inProcessImageFunc if set, except by the pipeline
+#                              and --shared-frames
+#    inMemoryAdmission : MemoryAdmission bounding the memory of the images processed at the same time,
+#                        with --workers or --pipeline
+#    inProcessMultiFrameImageFunc : Function processing a multi-frame image and saving its results, given
+#                                   its path and file name and the number of worker processes of its frames,
+#                                   None to process every image as a still image
+#
+# Returns: List of (path and file name, error) for the images that could not be processed
+# *****
+def ProcessBatch(inArgs, inBatchInImageFNs, inProcessImageFunc, inLoadImageFunc, inComputeOutputsFunc, inSaveImageFunc, inProcessedImageFNs, inLoadFrameFunc=None, inFrameToImageFunc=None, inProcessImageBatchFunc=None, inMemoryAdmission=None, inProcessMultiFrameImageFunc=None):
+
+    if inProcessMultiFrameImageFunc is not None and (inArgs.pipeline or getattr(inArgs, "shared_frames", 0) or inArgs.workers != 1 or inProcessImageBatchFunc is not None):
+
+        # Multi-frame images are processed after the still images, one at a time with their frames across the worker processes
+        multiFrameImageFNs = []
+        failedImages = ProcessBatch(inArgs, SetAsideMultiFrameImages(inBatchInImageFNs, multiFrameImageFNs), inProcessImageFunc, inLoadImageFunc, inComputeOutputsFunc, inSaveImageFunc, inProcessedImageFNs, inLoadFrameFunc, inFrameToImageFunc, inProcessImageBatchFunc, inMemoryAdmission)
+
+        return failedImages + ProcessMultiFrameImages(multiFrameImageFNs, inProcessMultiFrameImageFunc, inArgs.workers, inProcessedImageFNs)
+
+    if inArgs.pipeline:
+
+        # Overlap decoding, processing and encoding, linked by bounded queues
+        return ProcessImagesInPipeline(inBatchInImageFNs, inLoadImageFunc, inComputeOutputsFunc, inSaveImageFunc, inArgs.reader_threads, inArgs.compute_threads, inArgs.writer_threads, inArgs.queue_size, inMemoryAdmission=inMemoryAdmission)
+
+    if getattr(inArgs, "shared_frames", 0):
+
+        # Decode into shared memory slots processed by worker processes, requires Python 3.8
+        from SharedFramePool import ProcessImagesWithSharedFrames
+        return ProcessImagesWithSharedFrames(inBatchInImageFNs, inLoadFrameFunc, inFrameToImageFunc, inComputeOutputsFunc, inSaveImageFunc, inArgs.workers, inArgs.shared_frames, inArgs.reader_threads)
+
+    if inArgs.workers != 1:
+
+        # Spread the images across a pool of worker processes
+        if inProcessImageBatchFunc is not None:
+            return ProcessImagesInParallel(inProcessImageFunc, inBatchInImageFNs, inArgs.workers, imageBatchChunkSize, inProcessImageBatchFunc=inProcessImageBatchFunc, inMemoryAdmission=inMemoryAdmission)
+
+        return ProcessImagesInParallel(inProcessImageFunc, inBatchInImageFNs, inArgs.workers, inMemoryAdmission=inMemoryAdmission)
+
+    if inProcessImageBatchFunc is not None:
+
+        # Hand the images to the batch function a chunk at a time, errors are isolated per image
+        failedImages = []
+        batchInImageFNIter = iter(inBatchInImageFNs)
+
+        while True:
+
+            chunkImageFNs = list(itertools.islice(batchInImageFNIter, imageBatchChunkSize))
+            if not chunkImageFNs:
+                return failedImages
+
+            print("Currently processing " + str(len(chunkImageFNs)) + " images from: " + chunkImageFNs[0])
+
+            for batchInImageFN, errorStr in inProcessImageBatchFunc(chunkImageFNs):
+                inProcessedImageFNs.append(batchInImageFN)
+                if errorStr is not None:
+                    print("Unable to process image: " + batchInImageFN + " (" + errorStr + ")")
+                    failedImages.append((batchInImageFN, errorStr))
+
+    failedImages = []
+
+    for batchInImageFN in inBatchInImageFNs:
+
+        print("Currently processing image: " + batchInImageFN)
+
+        # Isolate errors so that one bad image does not stop the rest of the batch
+        try:
+            if inProcessMultiFrameImageFunc is not None and IsMultiFrameImage(batchInImageFN):
+                inProcessMultiFrameImageFunc(batchInImageFN)
+            else:
+                inProcessImageFunc(batchInImageFN)
+        except Exception as err:
+            failedImages.append((batchInImageFN, type(err).__name__ + ": " + str(err)))
+            print("Unable to process image: " + batchInImageFN + " (" + failedImages[-1][1] + ")")
+
+        inProcessedImageFNs.append(batchInImageFN)
+
+    return failedImages
+
+
+# *****
+# ProcessWorkQueue
+#
+# Description: Processes the images claimed from a work queue, a few at a time, until none is left
+#
+# Parameters:
+#    inArgs : Parsed command line options
+#    inWorkQueue : WorkQueue.WorkQueue of the images
+#    inProcessBatchFunc : ProcessBatch with all but the images, inProcessedImageFNs and
+#                         inMemoryAdmission bound
+#    inEstimateImageBytesFunc : Function estimating the memory used to process an image from its header,
+#                               given its path and file name, for --memory-budget-mb
+#
+# Returns: List of (path and file name, error) for the images that could not be processed
+# *****
+def ProcessWorkQueue(inArgs, inWorkQueue, inProcessBatchFunc, inEstimateImageBytesFunc=None):
+
+    failedImages = []
+
+    while True:
+
+        claimedImageFNs = inWorkQueue.ClaimImages(inArgs.claim_size)
+        if not claimedImageFNs:
+            return failedImages
+
+        memoryAdmission = None
+
+        if inArgs.memory_budget_mb and inEstimateImageBytesFunc is not None:
+            claimedImageFNs, imageBytes = OrderImagesLargestFirst(claimedImageFNs, inEstimateImageBytesFunc)
+            memoryAdmission = MemoryAdmission(inArgs.memory_budget_mb * 1024 * 1024, imageBytes)
+
+        processedImageFNs = []
+
+        with KeepLeases(inWorkQueue, claimedImageFNs):
+
+            try:
+
+                claimFailedImages = inProcessBatchFunc(claimedImageFNs, inProcessedImageFNs=processedImageFNs, inMemoryAdmission=memoryAdmission)
+
+                if inArgs.pipeline or inArgs.workers != 1 or getattr(inArgs, "shared_frames", 0):
+                    processedImageFNs = claimedImageFNs
+
+            except Exception as err:
+
+                # Errors are isolated per image, one stopping the batch is recorded against the first image
+                # not processed, the images after it were not attempted
+                failedImageFN = claimedImageFNs[len(processedImageFNs)]
+                claimFailedImages = [(failedImageFN, type(err).__name__ + ": " + str(err))]
+                print("Unable to process image: " + failedImageFN + " (" + claimFailedImages[0][1] + ")")
+
+                inWorkQueue.ReleaseImages(claimedImageFNs[len(processedImageFNs) + 1:])
+
+            except BaseException:
+
+                # Interrupted, the images not processed are left to the other runs without waiting for their leases
+                inWorkQueue.ReleaseImages(claimedImageFNs[len(processedImageFNs):])
+                raise
+
+        failedImageFNs = set(imageFN for imageFN, errorStr in claimFailedImages)
+        inWorkQueue.CompleteImages([imageFN for imageFN in processedImageFNs if imageFN not in failedImageFNs], claimFailedImages)
+
+        failedImages += claimFailedImages
+
+
+# *****
+# RunBatch
+#
+# Description: Processes the jpg images of the input directory as set by the command line options
+#
+# Parameters:
+#    inArgs : Parsed command line options
+#    inBatchInputImageDir : Input directory where jpg files reside
+#    inBatchOutputImageDir : Output directory where results are saved, in subdirectories mirroring those of the input directory
+#    inProcessImageFunc : Function processing an image and saving its results, given its path and file name
+#    inLoadImageFunc : Function opening and decoding an image, for the pipeline
+#    inComputeOutputsFunc : Function computing the (output path and file name, image) of each result, for the pipeline
+#    inSaveImageFunc : Function encoding and saving a result, for the pipeline
+#    inOutputImageFNsFunc : Function returning the list of output paths and file names of an image
+#    inProcessingParams : Dictionary of the parameters the results depend on, for --incremental
+#    inLoadFrameFunc : Function decoding an image to a NumPy array, for --shared-frames
+#    inFrameToImageFunc : Function wrapping a NumPy array as an image without copy, None if the images
+#                         are NumPy arrays, for --shared-frames and --multi-frame
+#    inProcessImageBatchFunc : Function processing many images and saving their results, see ProcessBatch
+#    inEstimateImageBytesFunc : Function estimating the memory used to process an image from its header,
+#                               given its path and file name, for --memory-budget-mb
+#    inFrameChannelOrder : Order of the color channels of the NumPy arrays of the images, "RGB" or "BGR",
+#                          for --multi-frame
+#
+# Returns: List of (path and file name, error) of the images that could not be processed
+# *****
+def RunBatch(inArgs, inBatchInputImageDir, inBatchOutputImageDir, inProcessImageFunc, inLoadImageFunc, inComputeOutputsFunc, inSaveImageFunc, inOutputImageFNsFunc, inProcessingParams, inLoadFrameFunc=None, inFrameToImageFunc=None, inProcessImageBatchFunc=None, inEstimateImageBytesFunc=None, inFrameChannelOrder="RGB"):
+
+    if inArgs.work_queue and inArgs.incremental:
+        raise SystemExit("--work-queue already reprocesses the images changed since they were done, it cannot be combined with --incremental")
+
+    # Time the stages of each image when a report is requested, of this batch only
+    ResetInstrumentation()
+    EnableInstrumentation(bool(inArgs.report_json or inArgs.report_prometheus), inArgs.report_records)
+
+    processMultiFrameImageFunc = None
+    scanExtensions = imageExtensions
+
+    if inArgs.multi_frame:
+        processMultiFrameImageFunc = functools.partial(ProcessMultiFrameImage, inComputeOutputsFunc=inComputeOutputsFunc, inFrameToImageFunc=inFrameToImageFunc, inChannelOrder=inFrameChannelOrder)
+        scanExtensions = imageExtensions + multiFrameExtensions
+
+    # Stream the paths and file names of the jpgs of the input directory, processing starts before the scan ends
+    batchInImageFNs = ScanImageFiles(inBatchInputImageDir, inArgs.recursive, inArgs.include, inArgs.exclude, inBatchOutputImageDir, scanExtensions)
+
+    if inArgs.incremental:
+
+        # Only process the images whose results are missing or out of date, known once the whole scan is hashed
+        manifestFN = os.path.join(inBatchOutputImageDir, manifestFileName)
+        manifest = LoadManifest(manifestFN)
+        incrementalPlan = PlanIncrementalRun(manifest, batchInImageFNs, GetProcessingParamsKey(inProcessingParams), inOutputImageFNsFunc, not inArgs.full_check)
+        batchInImageFNs = incrementalPlan.processImageFNs
+
+        print("Skipping " + str(len(incrementalPlan.skipImageFNs)) + " up to date jpg images, " + str(len(incrementalPlan.copyImageFNs)) + " identical jpg images will be copied")
+
+    workQueue = None
+
+    if inArgs.work_queue:
+
+        # Every run enqueues the images it finds, those already queued are left as they are
+        workQueue = WorkQueue(inArgs.work_queue, inBatchInputImageDir, inArgs.lease_seconds, inArgs.max_attempts)
+        if inArgs.retry_dead:
+            print("Retrying " + str(workQueue.RetryDeadImages()) + " dead letter jpg images")
+        workQueue.EnqueueImages(batchInImageFNs, GetProcessingParamsKey(inProcessingParams))
+
+    memoryAdmission = None
+
+    if inArgs.memory_budget_mb and inEstimateImageBytesFunc is not None and workQueue is None:
+
+        # Order the images largest first from their headers, known once the whole scan is read
+        batchInImageFNs, imageBytes = OrderImagesLargestFirst(batchInImageFNs, inEstimateImageBytesFunc)
+        memoryAdmission = MemoryAdmission(inArgs.memory_budget_mb * 1024 * 1024, imageBytes)
+
+    failedImages = []
+    processedImageFNs = []
+
+    try:
+
+        if workQueue is not None:
+
+            processBatchFunc = functools.partial(ProcessBatch, inArgs, inProcessImageFunc=inProcessImageFunc, inLoadImageFunc=inLoadImageFunc, inComputeOutputsFunc=inComputeOutputsFunc, inSaveImageFunc=inSaveImageFunc, inLoadFrameFunc=inLoadFrameFunc, inFrameToImageFunc=inFrameToImageFunc, inProcessImageBatchFunc=inProcessImageBatchFunc, inProcessMultiFrameImageFunc=processMultiFrameImageFunc)
+            failedImages = ProcessWorkQueue(inArgs, workQueue, processBatchFunc, inEstimateImageBytesFunc)
+
+        else:
+
+            failedImages = ProcessBatch(inArgs, batchInImageFNs, inProcessImageFunc, inLoadImageFunc, inComputeOutputsFunc, inSaveImageFunc, processedImageFNs, inLoadFrameFunc, inFrameToImageFunc, inProcessImageBatchFunc, memoryAdmission, processMultiFrameImageFunc)
+
+            if inArgs.pipeline or inArgs.workers != 1 or getattr(inArgs, "shared_frames", 0):
+                processedImageFNs = batchInImageFNs
+
+    finally:
+
+        if inArgs.incremental:
+
+            # Record what was processed, even if processing stopped on an error
+            processedImageFNSet = set(processedImageFNs)
+            unprocessedImageFNs = [batchInImageFN for batchInImageFN in batchInImageFNs if batchInImageFN not in processedImageFNSet]
+
+            failedImages += CompleteIncrementalRun(manifest, incrementalPlan, [imageFN for imageFN, errorStr in failedImages] + unprocessedImageFNs, inOutputImageFNsFunc)
+            SaveManifest(manifest, manifestFN)
+
+    if failedImages:
+        print("Unable to process " + str(len(failedImages)) + " jpg images")
+
+    if workQueue is not None:
+        stateCounts = workQueue.GetStateCounts()
+        print("Work queue: " + str(stateCounts["done"]) + " done, " + str(stateCounts["pending"]) + " pending, " + str(stateCounts["leased"]) + " leased, " + str(stateCounts["dead"]) + " dead letter jpg images")
+
+    if inArgs.report_json:
+        WriteJSONReport(inArgs.report_json)
+    if inArgs.report_prometheus:
+        WritePrometheusReport(inArgs.report_prometheus)
+
+    print("Finished processing all jpg images in input directory: " + inBatchInputImageDir)
+    print("Output images files located in the directory: " + inBatchOutputImageDir)
+
+    return failedImages
@@ -1,113 +1,600 @@
-#!/usr/bin/env python
-#
-# -------------------------------------------------------------------------------------
-#
-# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
-# All rights reserved. Copyright holder cannot be held liable for any damages. 
-# 
-# Distributed under the Apache License (ASL). 
-# http://www.apache.org/licenses/
-# *****
-# Description: Python script to resize images by percentage and apply sepia tone effect 
-# using ImageMagick via Wand (developed with & tested against Python 3.5, Wand 0.4.2)
-# Resize
-# The jpg image files of the specified input directory are resized by the specified percentages
-# in the array resizePercentages and saved to the specified output directory.   
-# Sepia
-# The jpg image files of the specified input directory have the sepia tone effect applied and saved 
-# to the specified output directory.
-# 
-# Usage: Running the script will both resize and apply the sepia tone effect to the jpg images in the
-# input directory, saving the results to the output directory
-# *****
-
-
-import os
-from wand.image import Image
-from wand.color import Color
-
-
-# *****
-# SepiaToneEffectAndSave
-#
-# Description: Applies sepia tone effect to input image and saves the result
-#
-# Parameters:
-#    inImage : An image opened using Wand
-#    inSepiaImageFN : Output path and file name where the result is saved
-# *****
-def SepiaToneEffectAndSave(inImage, inSepiaImageFN):
-
-    colorStr = '#e2592a'    # Sepia tone effect color
-
-    # Apply the effect on a copy of the input image
-    with inImage.clone() as imgClone:
-        
-        # Convert image to greyscale
-        imgClone.type = 'grayscale'
-        
-        # Apply a slight blur
-        imgClone.gaussian_blur(0,1)
-        
-        # Blend the sepia tone color with the greyscale layer using soft light
-        fillColor = Color(colorStr)
-        with Image(width=img.width, height=img.height, background=fillColor) as fillImg:
-        
-            imgClone.composite_channel('default_channels', fillImg, 'soft_light', 0, 0 )
-        
-        imgClone.save(filename=inSepiaImageFN)
-
-
-# *****
-# ResizeImageByPercentAndSave
-#
-# Description: Resizes image by specified percentage and saves the result
-#
-# Parameters:
-#    inImage : An image opened using Wand
-#    inResizePercentage : Percentage by which to resize image as a non negative integer
-#    inResizedImageFN : Output path and file name where the result is saved
-# *****
-def ResizeImageByPercentAndSave(inImage, inResizePercentage, inResizedImageFN):
-    
-    with inImage.clone() as imgClone:
-        
-        resizeHeight = int(inResizePercentage * imgClone.height / 100)
-        resizeWidth = int(inResizePercentage * imgClone.width / 100)
-        
-        imgClone.resize(resizeWidth, resizeHeight)
-        
-        imgClone.save(filename=inResizedImageFN)
-
-
-
-batchInputImageDir = os.path.join("..","images","in")       # Input directory where jpg files reside
-batchOutputImageDir = os.path.join("..","images","out")     # Output directory where results are saves as jpg image files
-resizePercentages = [75, 50, 25]    # Percentages to by which to resize input images
-
-# Iterate through all jpgs in the input directory 
-for jpgFile in os.listdir(batchInputImageDir):
-    
-    if jpgFile.endswith(".jpg"):    # Process jpg files only
-    
-        # Determine full path and filename
-        imageName, imageExt = os.path.splitext(jpgFile)
-        batchInImageFN = os.path.join(batchInputImageDir, jpgFile)
-
-        print("Currently processing image: " + batchInImageFN)
-
-        # Open the input image to process
-        with Image(filename=batchInImageFN) as img:
-            
-            # Resize image by given percentages
-            for resizePercentage in resizePercentages:
-                
-                batchOutImageFN = os.path.join(batchOutputImageDir, imageName + "_" + str(resizePercentage) + ".jpg")
-                ResizeImageByPercentAndSave(img, resizePercentage, batchOutImageFN)
-                
-            # Apply the sepia tone effect
-            batchOutImageFN = os.path.join(batchOutputImageDir, imageName + "_sepia.jpg")
-            SepiaToneEffectAndSave(img, batchOutImageFN)
-            
-print("Finished processing all jpg images in input directory: " + batchInputImageDir)
-print("Output images files located in the directory: " + batchOutputImageDir)
\ No newline at end of file
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages. 
+# 
+# Distributed under the Apache License (ASL). 
+# http://www.apache.org/licenses/
+# *****
+# Description: Python script to resize images by percentage and apply sepia tone effect 
+# using ImageMagick via Wand (developed with & tested against Python 3.5, Wand 0.4.2, requires Wand 0.5
+# or later for wand.resource.limits, Image.from_array and wand.version.MAGICK_HDRI)
+# Resize
+# The jpg image files of the specified input directory are resized by the specified percentages
+# in the array resizePercentages and saved to the specified output directory.   
+# Sepia
+# The jpg image files of the specified input directory have the sepia tone effect applied and saved 
+# to the specified output directory.
+# Tuning
+# Wand composites an image over another, not a color, so the solid color canvas blended over the
+# images is kept per image size and thread rather than created for every image. Resizes other than
+# exact ones clone the full size image once, for the largest percentage, and cascade the others from
+# it. ImageMagick's resource limits (threads, memory, map, disk) can be set so that worker processes
+# do not each run one OpenMP thread per CPU core.
+# 
+# Usage: Running the script will both resize and apply the sepia tone effect to the jpg images in the
+# input directory, saving the results to the output directory
+# *****
+
+
+import os
+import sys
+import functools
+import threading
+import collections
+import numpy as np
+from wand.image import Image
+from wand.color import Color
+from wand.version import QUANTUM_DEPTH, MAGICK_HDRI
+from wand.resource import limits
+from BatchProcessingDriver import CreateBatchArgumentParser, AddOperationArguments, RunBatch
+from DirectoryScanner import GetOutputImageDir, AtomicOutputFile
+from MultiFrameImages import GetOutputImageExt
+from StageTimer import SetCurrentImage, TimeStage
+from MemoryAdmission import EstimateImageBytes
+from MultiScaleResize import resizeQualities, PlanMultiScaleResize
+from JpegEncoding import GetJpegSettings, EncodeJpeg, WriteJpegFile
+from EffectChain import effectStageNames, CompileEffectChain, ApplyEffectPixels
+
+
+sepiaToneColor = '#e2592a'    # Sepia tone effect color
+sepiaBlurSigma = 1            # Standard deviation of the sepia tone effect blur
+
+# Bytes per pixel of an image in ImageMagick's pixel cache, four channels of a quantum (a float in HDRI builds)
+pixelCacheBytesPerPixel = 4 * (4 if MAGICK_HDRI else QUANTUM_DEPTH // 8)
+
+fillCanvasCacheSize = 2     # Number of image sizes whose sepia tone fill canvas is kept, per thread
+
+threadFillCanvases = threading.local()     # OrderedDict of the fill canvases of a thread, keyed by size
+appliedResourceLimits = {}                  # Resource limits applied in this process
+
+jpegSamplingFactors = {"444": "1x1", "422": "2x1", "420": "2x2"}    # ImageMagick sampling factors of the JpegEncoding.jpegSubsamplings
+
+
+# *****
+# GetFillCanvas
+#
+# Description: Solid sepia tone color image of a size, kept for the next images of the same size
+# (each thread has its own canvases, so a canvas is never closed while another thread blends it)
+#
+# Parameters:
+#    inWidth : Width of the canvas
+#    inHeight : Height of the canvas
+#
+# Returns: The canvas, owned by the cache
+# *****
+def GetFillCanvas(inWidth, inHeight):
+
+    fillCanvases = getattr(threadFillCanvases, "canvases", None)
+    if fillCanvases is None:
+        fillCanvases = threadFillCanvases.canvases = collections.OrderedDict()
+
+    fillCanvas = fillCanvases.pop((inWidth, inHeight), None)
+
+    if fillCanvas is None:
+
+        # Make room by closing the least recently used canvas
+        while len(fillCanvases) >= fillCanvasCacheSize:
+            fillCanvases.popitem(last=False)[1].close()
+
+        fillCanvas = Image(width=inWidth, height=inHeight, background=Color(sepiaToneColor))
+
+    fillCanvases[(inWidth, inHeight)] = fillCanvas
+
+    return fillCanvas
+
+
+# *****
+# SetResourceLimits
+#
+# Description: Sets ImageMagick's resource limits in the current process, once
+#
+# Parameters:
+#    inResourceLimits : Dictionary of limits keyed by ImageMagick resource ('thread', 'memory', 'map'
+#                       or 'disk'), in bytes except for threads
+# *****
+def SetResourceLimits(inResourceLimits):
+
+    for resourceName, resourceLimit in inResourceLimits.items():
+
+        if appliedResourceLimits.get(resourceName) != resourceLimit:
+            limits[resourceName] = resourceLimit
+            appliedResourceLimits[resourceName] = resourceLimit
+
+
+# *****
+# SepiaToneEffect
+#
+# Description: Applies sepia tone effect to input image
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#
+# Returns: The sepia toned image, to be closed by the caller
+# *****
+def SepiaToneEffect(inImage):
+
+    imgPixels = inImage.width * inImage.height
+
+    # Apply the effect on a copy of the input image
+    imgClone = inImage.clone()
+        
+    # Convert image to greyscale
+    with TimeStage("desaturate", imgPixels):
+        imgClone.type = 'grayscale'
+    
+    # Apply a slight blur
+    with TimeStage("blur", imgPixels):
+        imgClone.gaussian_blur(0,sepiaBlurSigma)
+    
+    # Blend the sepia tone color with the greyscale layer using soft light
+    with TimeStage("blend", imgPixels):
+        imgClone.composite_channel('default_channels', GetFillCanvas(inImage.width, inImage.height), 'soft_light', 0, 0 )
+    
+    return imgClone
+
+
+# *****
+# SepiaToneEffectAndSave
+#
+# Description: Applies sepia tone effect to input image and saves the result
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#    inSepiaImageFN : Output path and file name where the result is saved
+# *****
+def SepiaToneEffectAndSave(inImage, inSepiaImageFN):
+
+    with SepiaToneEffect(inImage) as imgSepia:
+        
+        SaveImage(imgSepia, inSepiaImageFN)
+
+
+# *****
+# ApplyEffectChain
+#
+# Description: Applies an effect to input image, pass after pass, the pixels passes running on the
+# pixels exported to NumPy
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#    inEffectPasses : Passes returned by EffectChain.CompileEffectChain for RGB images and rounded values
+#
+# Returns: The resulting image, to be closed by the caller
+# *****
+def ApplyEffectChain(inImage, inEffectPasses):
+
+    imgPixels = inImage.width * inImage.height
+
+    # Apply the effect on a copy of the input image
+    imgEffect = inImage.clone()
+
+    try:
+        for effectPass in inEffectPasses:
+
+            with TimeStage(effectStageNames[effectPass.kind], imgPixels):
+
+                if effectPass.kind == "desaturate":
+                    imgEffect.type = 'grayscale'
+
+                elif effectPass.kind == "blur":
+                    imgEffect.gaussian_blur(0, sepiaBlurSigma if effectPass.sigma is None else effectPass.sigma)
+
+                else:
+                    # A greyscale image is exported with three equal channels, looked up as a color image
+                    imgEffect.depth = 8
+                    imgArray = np.frombuffer(imgEffect.make_blob("rgb"), np.uint8).reshape(imgEffect.height, imgEffect.width, 3)
+                    imgArray = ApplyEffectPixels(imgArray, effectPass, True)
+
+                    imgPass = Image(blob=imgArray.tobytes(), format="rgb", width=imgEffect.width, height=imgEffect.height, depth=8)
+                    imgEffect.close()
+                    imgEffect = imgPass
+    except BaseException:
+        imgEffect.close()
+        raise
+
+    return imgEffect
+
+
+# *****
+# ResizeImageByPercent
+#
+# Description: Resizes image by specified percentage
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#    inResizePercentage : Percentage by which to resize image as a non negative integer
+#
+# Returns: The resized image, to be closed by the caller
+# *****
+def ResizeImageByPercent(inImage, inResizePercentage):
+    
+    imgClone = inImage.clone()
+        
+    resizeHeight = int(inResizePercentage * imgClone.height / 100)
+    resizeWidth = int(inResizePercentage * imgClone.width / 100)
+    
+    with TimeStage("resize", imgClone.width * imgClone.height):
+        imgClone.resize(resizeWidth, resizeHeight)
+    
+    return imgClone
+
+
+# *****
+# ResizeImageByPercentAndSave
+#
+# Description: Resizes image by specified percentage and saves the result
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#    inResizePercentage : Percentage by which to resize image as a non negative integer
+#    inResizedImageFN : Output path and file name where the result is saved
+# *****
+def ResizeImageByPercentAndSave(inImage, inResizePercentage, inResizedImageFN):
+    
+    with ResizeImageByPercent(inImage, inResizePercentage) as imgResize:
+        
+        SaveImage(imgResize, inResizedImageFN)
+
+
+# *****
+# ResizeImageByPercentages
+#
+# Description: Resizes an image by several percentages, the largest first
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#    inResizePercentages : Percentages by which to resize the image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities, exact clones the full image for each
+#                      percentage, the others clone it once for the largest percentage and cascade
+#                      the others from it, or from smaller resized images as planned
+#
+# Returns: Generator of (percentage, resized image), the images are to be closed by the caller
+# *****
+def ResizeImageByPercentages(inImage, inResizePercentages, inResizeQuality="exact"):
+
+    resizePlan = PlanMultiScaleResize((inImage.width, inImage.height), inResizePercentages, inResizeQuality)
+
+    # Planned from the full size image, the steps after the first are resampled from the first instead,
+    # cloning the full size image is what costs most in ImageMagick
+    if inResizeQuality != "exact":
+        resizePlan = [resizeStep._replace(sourceIndex=0) if stepIndex > 0 and resizeStep.sourceIndex is None else resizeStep for stepIndex, resizeStep in enumerate(resizePlan)]
+
+    sourceStepIndices = set(resizeStep.sourceIndex for resizeStep in resizePlan)
+
+    # Resized images later steps are resampled from, kept apart as the caller closes the yielded ones
+    imgSources = {}
+
+    try:
+
+        for stepIndex, resizeStep in enumerate(resizePlan):
+
+            imgSource = inImage if resizeStep.sourceIndex is None else imgSources[resizeStep.sourceIndex]
+
+            with TimeStage("resize", imgSource.width * imgSource.height):
+                imgResize = imgSource.clone()
+                imgResize.resize(resizeStep.width, resizeStep.height)
+
+            if stepIndex in sourceStepIndices:
+                imgSources[stepIndex] = imgResize.clone()
+
+            yield (resizeStep.percentage, imgResize)
+
+    finally:
+
+        for imgSource in imgSources.values():
+            imgSource.close()
+
+
+# *****
+# LoadImage
+#
+# Description: Opens and decodes an image
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#
+# Returns: The image opened using Wand, to be closed by the caller
+# *****
+def LoadImage(inImageFN):
+    
+    with TimeStage("decode") as stageRecord:
+        
+        img = Image(filename=inImageFN)
+        
+        stageRecord["pixels"] = img.width * img.height
+        stageRecord["bytesRead"] = os.path.getsize(inImageFN)
+    
+    return img
+
+
+# *****
+# ImageFromFrame
+#
+# Description: Creates an image from a NumPy array of pixels, for --multi-frame
+#
+# Parameters:
+#    inFrame : NumPy array of RGB (height x width x 3) pixels
+#
+# Returns: The image created using Wand, to be closed by the caller
+# *****
+def ImageFromFrame(inFrame):
+
+    return Image.from_array(inFrame)
+
+
+# *****
+# EncodeImageJpeg
+#
+# Description: Encodes an image as jpg in memory
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#    inQuality : Jpg quality, None for ImageMagick's default
+#    inJpegSettings : JpegEncoding.JpegSettings
+#
+# Returns: The jpg bytes
+# *****
+def EncodeImageJpeg(inImage, inQuality, inJpegSettings):
+
+    # The settings are made on a clone, sharing the pixels of the image
+    with inImage.clone() as imgJpeg:
+
+        imgJpeg.format = "pjpeg" if inJpegSettings.progressive else "jpeg"
+        if inQuality is not None:
+            imgJpeg.compression_quality = inQuality
+        if inJpegSettings.optimize:
+            imgJpeg.options["jpeg:optimize-coding"] = "true"
+        if inJpegSettings.subsampling:
+            imgJpeg.options["jpeg:sampling-factor"] = jpegSamplingFactors[inJpegSettings.subsampling]
+
+        return imgJpeg.make_blob()
+
+
+# *****
+# GetImageGrey
+#
+# Description: Luma of an image
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#
+# Returns: 2D uint8 array
+# *****
+def GetImageGrey(inImage):
+
+    with inImage.clone() as imgGrey:
+
+        imgGrey.transform_colorspace("gray")
+        imgGrey.depth = 8
+
+        return np.frombuffer(imgGrey.make_blob("gray"), np.uint8).reshape(imgGrey.height, imgGrey.width)
+
+
+# *****
+# DecodeJpegGrey
+#
+# Description: Decodes the luma of jpg bytes
+#
+# Parameters:
+#    inJpegBytes : The jpg bytes
+#
+# Returns: 2D uint8 array
+# *****
+def DecodeJpegGrey(inJpegBytes):
+
+    with Image(blob=inJpegBytes) as img:
+        return GetImageGrey(img)
+
+
+# *****
+# SaveImage
+#
+# Description: Encodes an image and saves it, the format is given by the file name extension
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#    inImageFN : Output path and file name where the image is saved
+#    inJpegSettings : JpegEncoding.JpegSettings of the jpg, None for ImageMagick's defaults
+# *****
+def SaveImage(inImage, inImageFN, inJpegSettings=None):
+    
+    with TimeStage("encode", inImage.width * inImage.height) as stageRecord:
+        
+        # Written to a temporary file renamed over the result, never read partially written
+        with AtomicOutputFile(inImageFN) as tempImageFN:
+            if inJpegSettings is None:
+                inImage.save(filename=tempImageFN)
+            else:
+                stageRecord["jpegQuality"], jpegBytes = EncodeJpeg(inImage, inImage.width, inJpegSettings, EncodeImageJpeg, GetImageGrey, DecodeJpegGrey)
+                WriteJpegFile(jpegBytes, tempImageFN)
+        
+        stageRecord["bytesWritten"] = os.path.getsize(inImageFN)
+
+
+
+# *****
+# GetOutputImageFNs
+#
+# Description: Output paths and file names of the results of an image
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the input image
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inBatchInputImageDir : Input directory of the batch, its subdirectories are mirrored in the output
+#                           directory, None to save the results directly in the output directory
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inEffectName : Name of the effect applied instead of the sepia tone effect, naming its result
+#
+# Returns: List of the output paths and file names of the resized images, in the order of the
+# percentages, followed by the one of the sepia toned image with inSepiaTone, jpgs or of the format
+# of a multi-frame image
+# *****
+def GetOutputImageFNs(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir=None, inSepiaTone=True, inEffectName="sepia"):
+
+    # Determine the filename without path and extension
+    imageName, imageExt = os.path.splitext(os.path.basename(inBatchInImageFN))
+    outputImageDir = GetOutputImageDir(inBatchInImageFN, inBatchInputImageDir, inBatchOutputImageDir)
+
+    outputImageExt = GetOutputImageExt(inBatchInImageFN)
+
+    outputImageFNs = [os.path.join(outputImageDir, imageName + "_" + str(resizePercentage) + outputImageExt) for resizePercentage in inResizePercentages]
+    if inSepiaTone:
+        outputImageFNs.append(os.path.join(outputImageDir, imageName + "_" + inEffectName + outputImageExt))
+
+    return outputImageFNs
+
+
+# *****
+# ComputeImageOutputs
+#
+# Description: Resizes an image by the specified percentages and applies the sepia tone effect
+#
+# Parameters:
+#    inImage : An image opened using Wand
+#    inBatchInImageFN : Path and file name of the image, used to name the results
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inBatchInputImageDir : Input directory of the batch, None to save the results directly in the output directory
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inEffectName : Name of the effect applied instead of the sepia tone effect
+#    inEffectPasses : Passes of the effect, see ApplyEffectChain, None for the sepia tone effect
+#
+# Returns: Generator of (output path and file name, image) for each result, the images are to be
+# closed by the caller
+# *****
+def ComputeImageOutputs(inImage, inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir=None, inResizeQuality="exact", inSepiaTone=True, inEffectName="sepia", inEffectPasses=None):
+
+    outputImageFNs = GetOutputImageFNs(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir, inSepiaTone, inEffectName)
+    resizedImageFNs = dict(zip(inResizePercentages, outputImageFNs))
+
+    # Resize image by given percentages
+    for resizePercentage, imgResize in ResizeImageByPercentages(inImage, inResizePercentages, inResizeQuality):
+
+        yield (resizedImageFNs[resizePercentage], imgResize)
+
+    # Apply the sepia tone effect
+    if inSepiaTone and inEffectPasses is not None:
+        yield (outputImageFNs[-1], ApplyEffectChain(inImage, inEffectPasses))
+    elif inSepiaTone:
+        yield (outputImageFNs[-1], SepiaToneEffect(inImage))
+
+
+# *****
+# ProcessImage
+#
+# Description: Resizes an image by the specified percentages, applies the sepia tone effect and saves the results
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the jpg image to process
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inBatchInputImageDir : Input directory of the batch, None to save the results directly in the output directory
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inResourceLimits : Dictionary of ImageMagick resource limits, see SetResourceLimits
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for ImageMagick's defaults
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inEffectName : Name of the effect applied instead of the sepia tone effect
+#    inEffectPasses : Passes of the effect, see ApplyEffectChain, None for the sepia tone effect
+# *****
+def ProcessImage(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir=None, inResizeQuality="exact", inResourceLimits=None, inJpegSettings=None, inSepiaTone=True, inEffectName="sepia", inEffectPasses=None):
+
+    # Worker processes set the limits on their first image
+    if inResourceLimits:
+        SetResourceLimits(inResourceLimits)
+
+    SetCurrentImage(inBatchInImageFN)
+
+    # Open the input image to process
+    with LoadImage(inBatchInImageFN) as img:
+
+        # Save each result as soon as it is computed
+        for batchOutImageFN, imgOut in ComputeImageOutputs(img, inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir, inResizeQuality, inSepiaTone, inEffectName, inEffectPasses):
+
+            with imgOut:
+                SaveImage(imgOut, batchOutImageFN, inJpegSettings)
+
+
+# *****
+# Main
+#
+# Description: Resizes the jpg images of the input directory and/or applies the sepia tone effect, as
+# set by the command line options
+#
+# Parameters:
+#    inArgv : Command line options, None for those of the script
+#
+# Returns: List of (path and file name, error) of the images that could not be processed
+# *****
+def Main(inArgv=None):
+
+    parser = CreateBatchArgumentParser("Resize jpg images by percentage and apply sepia tone effect using ImageMagick")
+    parser.add_argument("--resize-quality", choices=resizeQualities, default="exact", help="Trade resize exactness for speed (default: exact)")
+    parser.add_argument("--magick-threads", type=int, help="ImageMagick threads per process (default: ImageMagick's, divided among --workers)")
+    parser.add_argument("--magick-memory-mb", type=int, help="ImageMagick pixel cache memory limit per process, in MB")
+    parser.add_argument("--magick-map-mb", type=int, help="ImageMagick memory mapped pixel cache limit per process, in MB")
+    parser.add_argument("--magick-disk-mb", type=int, help="ImageMagick disk pixel cache limit per process, in MB")
+    AddOperationArguments(parser)
+    args = parser.parse_args(inArgv)
+
+    # Split the cores among worker processes unless set, each would otherwise run one thread per core
+    magickThreads = args.magick_threads
+    if magickThreads is None and args.workers != 1:
+        magickThreads = max(1, os.cpu_count() // (args.workers or os.cpu_count()))
+
+    resourceLimits = {}
+    if magickThreads:
+        resourceLimits['thread'] = magickThreads
+    for resourceName, resourceLimitMB in (('memory', args.magick_memory_mb), ('map', args.magick_map_mb), ('disk', args.magick_disk_mb)):
+        if resourceLimitMB is not None:
+            resourceLimits[resourceName] = resourceLimitMB * 1024 * 1024
+
+    SetResourceLimits(resourceLimits)
+
+    batchInputImageDir = args.input_dir         # Input directory where jpg files reside
+    batchOutputImageDir = args.output_dir       # Output directory where results are saves as jpg image files
+    resizePercentages = args.resize_percentages if "resize" in args.operations else []     # Percentages to by which to resize input images
+    sepiaTone = "sepia" in args.operations
+
+    # Parameters the results depend on, results saved with other parameters are processed again by --incremental
+    processingParams = {"backend": "wand", "resizePercentages": resizePercentages, "resizeQuality": args.resize_quality, "sepiaToneColor": sepiaToneColor, "sepiaBlurSigma": sepiaBlurSigma}
+    jpegSettings = GetJpegSettings(args)
+    if jpegSettings:
+        processingParams["jpegSettings"] = jpegSettings._asdict()
+    if not sepiaTone:
+        processingParams["sepiaTone"] = False
+    if args.effect:
+        processingParams["effect"] = args.effect.spec
+
+    effectName = args.effect.name if args.effect else "sepia"
+    effectPasses = CompileEffectChain(args.effect.steps, True, "RGB") if args.effect else None
+
+    processImageFunc = functools.partial(ProcessImage, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inBatchInputImageDir=batchInputImageDir, inResizeQuality=args.resize_quality, inResourceLimits=resourceLimits, inJpegSettings=jpegSettings, inSepiaTone=sepiaTone, inEffectName=effectName, inEffectPasses=effectPasses)
+    computeOutputsFunc = functools.partial(ComputeImageOutputs, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inBatchInputImageDir=batchInputImageDir, inResizeQuality=args.resize_quality, inSepiaTone=sepiaTone, inEffectName=effectName, inEffectPasses=effectPasses)
+    # The sepia tone effect holds a clone and a cached fill canvas, the resizes a full size clone until resized
+    estimateImageBytesFunc = functools.partial(EstimateImageBytes, inResizePercentages=resizePercentages, inEffectBytesPerPixel=(3 if sepiaTone else 1) * pixelCacheBytesPerPixel, inDecodedBytesPerPixel=pixelCacheBytesPerPixel)
+    outputImageFNsFunc = functools.partial(GetOutputImageFNs, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inBatchInputImageDir=batchInputImageDir, inSepiaTone=sepiaTone, inEffectName=effectName)
+    saveImageFunc = functools.partial(SaveImage, inJpegSettings=jpegSettings)
+
+    return RunBatch(args, batchInputImageDir, batchOutputImageDir, processImageFunc, LoadImage, computeOutputsFunc, saveImageFunc, outputImageFNsFunc, processingParams, inFrameToImageFunc=ImageFromFrame, inEstimateImageBytesFunc=estimateImageBytesFunc)
+
+
+
+if __name__ == "__main__":
+
+    # Exit with an error status when images could not be processed
+    sys.exit(1 if Main() else 0)
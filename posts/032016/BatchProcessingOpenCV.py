@@ -1,165 +1,869 @@
-#!/usr/bin/env python
-#
-# -------------------------------------------------------------------------------------
-#
-# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
-# All rights reserved. Copyright holder cannot be held liable for any damages. 
-# 
-# Distributed under the Apache License (ASL). 
-# http://www.apache.org/licenses/
-# *****
-# Description: Python script to resize images by percentage and apply sepia tone effect 
-# using OpenCV and NumPy (developed with & tested against Python 3.5, OpenCV 3.1 and
-# NumPy 1.10.4)
-# Resize
-# The jpg image files of the specified input directory are resized by the specified percentages
-# in the array resizePercentages and saved to the specified output directory.   
-# Sepia
-# The jpg image files of the specified input directory have the sepia tone effect applied and saved 
-# to the specified output directory.
-# 
-# Usage: Running the script will both resize and apply the sepia tone effect to the jpg images in the
-# input directory, saving the results to the output directory
-# *****
-
-
-
-import os
-import numpy as np
-import cv2
-
-
-
-# *****
-# SoftLight
-#
-# Description: Implements the soft light blending mode as per w3c
-# https://en.wikipedia.org/wiki/Blend_modes#Soft_Light
-#
-# Parameters:
-#    inTopImg : Open OpenCV image (top)
-#    inBottomImg : Open OpenCV image (bottom)
-# *****
-def SoftLight(inTopImg,inBottomImg):
-    
-    # Normalize color values to between 0 and 1
-    topImgArray = np.asarray(inTopImg) / 255.0
-    bottomImgArray = np.asarray(inBottomImg) / 255.0
-    
-    softLightImgArray = SoftLightF(topImgArray, bottomImgArray)
-    
-    # Convert colors back to between 0 to 255
-    softLightImgArray = softLightImgArray * 255.0
-        
-    return softLightImgArray
-
-
-# *****
-# SoftLightF
-#
-# Description: Implements f(bottom image, top image) portion of w3c soft light blending equation
-#
-# Parameters:
-#    inTopImgArray : Top image as array
-#    inBottomImgArray : Bottom image as array
-# *****
-def SoftLightF(inTopImgArray,inBottomImgArray):
-
-    softLightFArray = np.where(inTopImgArray <= 0.5,inBottomImgArray - ((1 - (2 * inTopImgArray)) * inBottomImgArray * (1 - inBottomImgArray)),inBottomImgArray + (2 * inTopImgArray - 1) * (SoftLightG(inBottomImgArray) - inBottomImgArray))
-
-    return softLightFArray
-
-
-# *****
-# SoftLightG
-#
-# Description: Implements f(bottom image) portion of w3c soft light blending equation
-#
-# Parameters:
-#    inBottomImgArray : Bottom image as array
-# *****
-def SoftLightG(inBottomImgArray):
-    
-    softLightGArray = np.where(inBottomImgArray <= 0.25, ((16 * inBottomImgArray - 12) * inBottomImgArray + 4) * inBottomImgArray, np.sqrt(inBottomImgArray))
-    
-    return softLightGArray
-
-
-# *****
-# SepiaToneEffectAndSave
-#
-# Description: Applies sepia tone effect to input image and saves the result
-#
-# Parameters:
-#    inImage : An OpenCV image
-#    inSepiaImageFN : Output path and file name where the result is saved
-# *****
-def SepiaToneEffectAndSave(inImage, inSepiaImageFN):
-    
-    # Desaturate (but needs to be RGB for later operations)
-    imgGrey = cv2.cvtColor(inImage,cv2.COLOR_BGR2GRAY)
-    imgGrey = cv2.cvtColor(imgGrey,cv2.COLOR_GRAY2RGB)  # Need RGB for matrix math
-    
-    # Apply a slight blur
-    imgSmooth = cv2.GaussianBlur(imgGrey,(5,5),0)
-
-    # Blend the sepia tone color with the greyscale layer using soft light
-    imgWidth, imgHeight, imgChannels = imgGrey.shape
-    imgSepiaColor = np.zeros((imgWidth,imgHeight,3), np.uint8)
-    imgSepiaColor[:,:] = (42,89,226)  # BGR
-    
-    imgSepia = SoftLight(imgSepiaColor, imgSmooth)
-    
-    cv2.imwrite(inSepiaImageFN,imgSepia)
-
-
-# *****
-# ResizeImageByPercentAndSave
-#
-# Description: Resizes image by specified percentage and saves the result
-#
-# Parameters:
-#    inImage : An OpenCV image
-#    inResizePercentage : Percentage by which to resize image as a non negative integer
-#    inResizedImageFN : Output path and file name where the result is saved
-# *****
-def ResizeImageByPercentAndSave(inImage, inResizePercentage, inResizedImageFN):
-    
-    resizeFraction = inResizePercentage / 100
-        
-    imgResize = cv2.resize(inImage, (0,0), fx=resizeFraction, fy=resizeFraction)
-    
-    cv2.imwrite(inResizedImageFN,imgResize)
-
-
-
-batchInputImageDir = os.path.join("..","images","in")       # Input directory where jpg files reside
-batchOutputImageDir = os.path.join("..","images","out")     # Output directory where results are saves as jpg image files
-resizePercentages = [75, 50, 25]    # Percentages to by which to resize input images
-
-# Iterate through all jpgs in the input directory 
-for jpgFile in os.listdir(batchInputImageDir):
-    
-    if jpgFile.endswith(".jpg"):    # Process jpg files only
-    
-        # Determine full path and filename
-        imageName, imageExt = os.path.splitext(jpgFile)
-        batchInImageFN = os.path.join(batchInputImageDir, jpgFile)
-
-        print("Currently processing image: " + batchInImageFN)
-
-        # Open the input image to process
-        img = cv2.imread(batchInImageFN)
-            
-        # Resize image by given percentages
-        for resizePercentage in resizePercentages:
-                
-            batchOutImageFN = os.path.join(batchOutputImageDir, imageName + "_" + str(resizePercentage) + ".jpg")
-            ResizeImageByPercentAndSave(img, resizePercentage, batchOutImageFN)
-                
-        # Apply the sepia tone effect
-        batchOutImageFN = os.path.join(batchOutputImageDir, imageName + "_sepia.jpg")
-        SepiaToneEffectAndSave(img, batchOutImageFN)
-            
-print("Finished processing all jpg images in input directory: " + batchInputImageDir)
-print("Output images files located in the directory: " + batchOutputImageDir)
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages. 
+# 
+# Distributed under the Apache License (ASL). 
+# http://www.apache.org/licenses/
+# *****
+# Description: Python script to resize images by percentage and apply sepia tone effect 
+# using OpenCV and NumPy (developed with & tested against Python 3.5, OpenCV 3.1 and
+# NumPy 1.10.4)
+# Resize
+# The jpg image files of the specified input directory are resized by the specified percentages
+# in the array resizePercentages and saved to the specified output directory.   
+# Sepia
+# The jpg image files of the specified input directory have the sepia tone effect applied and saved 
+# to the specified output directory.
+# 
+# Usage: Running the script will both resize and apply the sepia tone effect to the jpg images in the
+# input directory, saving the results to the output directory
+# *****
+
+
+
+import os
+import sys
+import functools
+import numpy as np
+import cv2
+from BatchProcessingDriver import CreateBatchArgumentParser, AddOperationArguments, RunBatch
+from DirectoryScanner import GetOutputImageDir, AtomicOutputFile
+from MultiFrameImages import GetOutputImageExt
+from StageTimer import SetCurrentImage, TimeStage
+from SoftLightLUT import GetSoftLightLUT, ApplySoftLightLUT
+from SoftLightKernel import softLightKernels, SoftLightBlend, GetSoftLightBlendBytes
+from EffectChain import effectStageNames, CompileEffectChain, GetVignetteMask, ApplyEffectLUT, ApplyVignetteMask
+from ScratchBuffers import GetScratchBuffer
+from MultiScaleResize import resizeQualities, ReadJpegSize, PlanMultiScaleResize
+from StripProcessing import IterateStrips, GetStripBufferShape, CarryHaloRows
+from ImageBatching import GroupImagesByShape, StackImages, GetBatchBytes
+from MemoryAdmission import EstimateImageBytes
+from JpegEncoding import GetJpegSettings, EncodeJpeg, WriteJpegFile
+from DecodedPixelCache import DecodedPixelCache
+
+
+
+sepiaToneColor = (42, 89, 226)    # Sepia tone effect color (BGR)
+sepiaBlurKernelSize = (5, 5)      # Size of the sepia tone effect blur kernel
+sepiaWorkingBytesPerPixel = 5    # Grey (1), blurred grey (1) and result (3) bytes per pixel of the sepia tone effect
+reducedDecodeCost = 3            # Decoding a jpg again at a reduced resolution costs about as much as resizing three times its pixels
+
+# Flags to decode a jpg at a reduced resolution, keyed by decode scale denominator
+reducedColorFlags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# cv2.imwrite chroma subsampling flags of the JpegEncoding.jpegSubsamplings, looked up when used as they require OpenCV 4.5.5
+jpegSamplingFactorNames = {"444": "IMWRITE_JPEG_SAMPLING_FACTOR_444", "422": "IMWRITE_JPEG_SAMPLING_FACTOR_422", "420": "IMWRITE_JPEG_SAMPLING_FACTOR_420"}
+
+
+
+# *****
+# SoftLight
+#
+# Description: Implements the soft light blending mode as per w3c
+# https://en.wikipedia.org/wiki/Blend_modes#Soft_Light
+#
+# Parameters:
+#    inTopImg : Open OpenCV image (top)
+#    inBottomImg : Open OpenCV image (bottom)
+# *****
+def SoftLight(inTopImg,inBottomImg):
+    
+    # Normalize color values to between 0 and 1
+    topImgArray = np.asarray(inTopImg) / 255.0
+    bottomImgArray = np.asarray(inBottomImg) / 255.0
+    
+    softLightImgArray = SoftLightF(topImgArray, bottomImgArray)
+    
+    # Convert colors back to between 0 to 255
+    softLightImgArray = softLightImgArray * 255.0
+        
+    return softLightImgArray
+
+
+# *****
+# SoftLightF
+#
+# Description: Implements f(bottom image, top image) portion of w3c soft light blending equation
+#
+# Parameters:
+#    inTopImgArray : Top image as array
+#    inBottomImgArray : Bottom image as array
+# *****
+def SoftLightF(inTopImgArray,inBottomImgArray):
+
+    softLightFArray = np.where(inTopImgArray <= 0.5,inBottomImgArray - ((1 - (2 * inTopImgArray)) * inBottomImgArray * (1 - inBottomImgArray)),inBottomImgArray + (2 * inTopImgArray - 1) * (SoftLightG(inBottomImgArray) - inBottomImgArray))
+
+    return softLightFArray
+
+
+# *****
+# SoftLightG
+#
+# Description: Implements f(bottom image) portion of w3c soft light blending equation
+#
+# Parameters:
+#    inBottomImgArray : Bottom image as array
+# *****
+def SoftLightG(inBottomImgArray):
+    
+    softLightGArray = np.where(inBottomImgArray <= 0.25, ((16 * inBottomImgArray - 12) * inBottomImgArray + 4) * inBottomImgArray, np.sqrt(inBottomImgArray))
+    
+    return softLightGArray
+
+
+# *****
+# PrecomputeSepiaTables
+#
+# Description: Builds the lookup table of the sepia tone effect ahead of the first image, for long
+# running processes
+# *****
+def PrecomputeSepiaTables():
+
+    GetSoftLightLUT(SoftLight, sepiaToneColor, True)
+
+
+# *****
+# BlendSepiaTone
+#
+# Description: Blends the sepia tone color with a greyscale layer using soft light, rounded as
+# cv2.imwrite rounds the floating point blend
+#
+# Parameters:
+#    inGreyArray : Greyscale layer as a uint8 array
+#    inOutArray : Optional preallocated uint8 array of the layer shape plus 3 channels for the result
+#    inBlendKernel : lut to look the blend up per grey level, or one of SoftLightKernel.softLightKernels
+#
+# Returns: Blended image as a uint8 array of the layer shape plus 3 channels
+# *****
+def BlendSepiaTone(inGreyArray, inOutArray=None, inBlendKernel="lut"):
+
+    if inBlendKernel == "lut":
+        return ApplySoftLightLUT(inGreyArray, GetSoftLightLUT(SoftLight, sepiaToneColor, True), inOutArray)
+
+    return SoftLightBlend(SoftLight, np.array(sepiaToneColor, np.uint8), inGreyArray[..., np.newaxis], True, inOutArray, inBlendKernel)
+
+
+# *****
+# SepiaToneEffect
+#
+# Description: Applies sepia tone effect to input image
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inOutImage : Optional preallocated uint8 array of the input image shape for the result
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: The sepia toned OpenCV image
+# *****
+def SepiaToneEffect(inImage, inOutImage=None, inBlendKernel="lut"):
+    
+    imgHeight, imgWidth = inImage.shape[:2]
+    
+    # Desaturate, the effect is computed on the single grey channel
+    with TimeStage("desaturate", imgWidth * imgHeight):
+        imgGrey = cv2.cvtColor(inImage, cv2.COLOR_BGR2GRAY, dst=GetScratchBuffer("grey", (imgHeight, imgWidth), np.uint8))
+    
+    # Apply a slight blur
+    with TimeStage("blur", imgWidth * imgHeight):
+        imgSmooth = cv2.GaussianBlur(imgGrey, sepiaBlurKernelSize, 0, dst=GetScratchBuffer("greySmooth", (imgHeight, imgWidth), np.uint8))
+
+    # Blend the sepia tone color with the greyscale layer using soft light
+    with TimeStage("blend", imgWidth * imgHeight):
+        imgSepia = BlendSepiaTone(imgSmooth, inOutImage, inBlendKernel)
+    
+    return imgSepia
+
+
+# *****
+# SepiaToneEffectInStrips
+#
+# Description: Applies sepia tone effect to input image in horizontal strips, overwriting the input
+# image, with the same result as SepiaToneEffect
+#
+# Parameters:
+#    inImage : An OpenCV image, overwritten
+#    inStripHeight : Number of rows per strip
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: The sepia toned OpenCV image, the input image
+# *****
+def SepiaToneEffectInStrips(inImage, inStripHeight, inBlendKernel="lut"):
+    
+    imgHeight, imgWidth = inImage.shape[:2]
+    
+    blurHalo = sepiaBlurKernelSize[1] // 2
+    stripBufferShape = GetStripBufferShape(imgWidth, imgHeight, inStripHeight, blurHalo)
+    greyRows = GetScratchBuffer("greyStrip", stripBufferShape, np.uint8)
+    greySmoothRows = GetScratchBuffer("greySmoothStrip", stripBufferShape, np.uint8)
+    prevStrip = None
+    
+    with TimeStage("sepia", imgWidth * imgHeight):
+        
+        for imgStrip in IterateStrips(imgHeight, inStripHeight, blurHalo):
+            
+            numStripRows = imgStrip.stripY1 - imgStrip.stripY0
+            numHaloRows = imgStrip.haloY1 - imgStrip.haloY0
+            
+            # Desaturate the rows not yet overwritten, the rows above the strip are carried over
+            numCarriedRows = CarryHaloRows(greyRows, prevStrip, imgStrip)
+            cv2.cvtColor(inImage[imgStrip.stripY0:imgStrip.haloY1], cv2.COLOR_BGR2GRAY, dst=greyRows[numCarriedRows:numHaloRows])
+            
+            # Apply a slight blur to the strip extended by its halo
+            cv2.GaussianBlur(greyRows[:numHaloRows], sepiaBlurKernelSize, 0, dst=greySmoothRows[:numHaloRows])
+            
+            # Blend, written over the input rows of the strip
+            BlendSepiaTone(greySmoothRows[numCarriedRows:numCarriedRows + numStripRows], inImage[imgStrip.stripY0:imgStrip.stripY1], inBlendKernel)
+            
+            prevStrip = imgStrip
+    
+    return inImage
+
+
+# *****
+# SepiaToneEffectBatch
+#
+# Description: Applies sepia tone effect to many images at once, each step running once over the
+# stack of the images of the same shape, with the same results as SepiaToneEffect
+#
+# Parameters:
+#    inImages : List of OpenCV images
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: List of the sepia toned OpenCV images, in the order of the input images
+# *****
+def SepiaToneEffectBatch(inImages, inBlendKernel="lut"):
+    
+    imgSepias = [None] * len(inImages)
+    blurHalo = sepiaBlurKernelSize[1] // 2
+    
+    for imgIndices in GroupImagesByShape([img.shape for img in inImages]):
+        
+        imgHeight, imgWidth = inImages[imgIndices[0]].shape[:2]
+        numImages = len(imgIndices)
+        stackPixels = numImages * imgWidth * imgHeight
+        
+        # Desaturate the stack as a single image of the rows of all the images
+        with TimeStage("desaturate", stackPixels):
+            imageStack = StackImages([inImages[imgIndex] for imgIndex in imgIndices], GetScratchBuffer("imageStack", (numImages,) + inImages[imgIndices[0]].shape, np.uint8))
+            greyStack = GetScratchBuffer("greyStack", (numImages, imgHeight, imgWidth), np.uint8)
+            cv2.cvtColor(imageStack.reshape(numImages * imgHeight, imgWidth, -1), cv2.COLOR_BGR2GRAY, dst=greyStack.reshape(numImages * imgHeight, imgWidth))
+        
+        # Apply a slight blur to the stack as a single image, each image extended by its reflected
+        # rows (as GaussianBlur's default border) so that rows of neighbouring images do not mix
+        with TimeStage("blur", stackPixels):
+            greyPaddedStack = np.pad(greyStack, ((0, 0), (blurHalo, blurHalo), (0, 0)), mode='reflect')
+            greySmoothStack = GetScratchBuffer("greySmoothStack", greyPaddedStack.shape, np.uint8)
+            cv2.GaussianBlur(greyPaddedStack.reshape(-1, imgWidth), sepiaBlurKernelSize, 0, dst=greySmoothStack.reshape(-1, imgWidth))
+            greySmoothStack = greySmoothStack[:, blurHalo:blurHalo + imgHeight]
+        
+        # Blend the sepia tone color with the greyscale layers using soft light (into a new array,
+        # shared by the resulting images)
+        with TimeStage("blend", stackPixels):
+            sepiaStack = BlendSepiaTone(greySmoothStack, inBlendKernel=inBlendKernel)
+            for stackIndex, imgIndex in enumerate(imgIndices):
+                imgSepias[imgIndex] = sepiaStack[stackIndex]
+    
+    return imgSepias
+
+
+# *****
+# SepiaToneEffectAndSave
+#
+# Description: Applies sepia tone effect to input image and saves the result
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inSepiaImageFN : Output path and file name where the result is saved
+# *****
+def SepiaToneEffectAndSave(inImage, inSepiaImageFN):
+    
+    # The result is saved straight away, so it can go to a reused buffer
+    imgHeight, imgWidth = inImage.shape[:2]
+    imgSepia = SepiaToneEffect(inImage, GetScratchBuffer("sepia", (imgHeight, imgWidth, 3), np.uint8))
+    
+    SaveImage(imgSepia, inSepiaImageFN)
+
+
+# *****
+# ApplyEffectChain
+#
+# Description: Applies an effect to input image, pass after pass
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inEffectPasses : Passes returned by EffectChain.CompileEffectChain for BGR images and rounded values
+#
+# Returns: The resulting OpenCV image, greyscale if the effect ends desaturated
+# *****
+def ApplyEffectChain(inImage, inEffectPasses):
+    
+    imgHeight, imgWidth = inImage.shape[:2]
+    imgEffect = inImage
+    
+    for effectPass in inEffectPasses:
+        
+        with TimeStage(effectStageNames[effectPass.kind], imgWidth * imgHeight):
+            
+            if effectPass.kind == "desaturate":
+                imgEffect = cv2.cvtColor(imgEffect, cv2.COLOR_BGR2GRAY)
+            
+            elif effectPass.kind == "blur":
+                if effectPass.sigma is None:
+                    imgEffect = cv2.GaussianBlur(imgEffect, sepiaBlurKernelSize, 0)
+                else:
+                    imgEffect = cv2.GaussianBlur(imgEffect, (0, 0), effectPass.sigma)
+            
+            else:
+                # A color image is looked up per channel by OpenCV, a greyscale one per grey level
+                if effectPass.lut is not None and imgEffect.ndim == 3:
+                    imgEffect = cv2.LUT(imgEffect, effectPass.lut[:, np.newaxis])
+                elif effectPass.lut is not None:
+                    imgEffect = ApplyEffectLUT(imgEffect, effectPass.lut)
+                if effectPass.vignettes:
+                    imgEffect = ApplyVignetteMask(imgEffect, GetVignetteMask(imgWidth, imgHeight, effectPass.vignettes), True)
+    
+    return imgEffect
+
+
+# *****
+# ResizeImageByPercentAndSave
+#
+# Description: Resizes image by specified percentage and saves the result
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inResizePercentage : Percentage by which to resize image as a non negative integer
+#    inResizedImageFN : Output path and file name where the result is saved
+# *****
+def ResizeImageByPercentAndSave(inImage, inResizePercentage, inResizedImageFN):
+    
+    resizeFraction = inResizePercentage / 100
+        
+    with TimeStage("resize", inImage.shape[0] * inImage.shape[1]):
+        imgResize = cv2.resize(inImage, (0,0), fx=resizeFraction, fy=resizeFraction)
+    
+    SaveImage(imgResize, inResizedImageFN)
+
+
+# *****
+# ResizeImageByPlan
+#
+# Description: Resizes image by several percentages, as planned by MultiScaleResize.PlanMultiScaleResize
+#
+# Parameters:
+#    inResizePlan : List of MultiScaleResize.ResizeStep, with rounded sizes
+#    inDecodeImageFunc : Function returning the OpenCV image decoded at the reduced resolution of a scale
+#                        denominator (1 for full resolution), called once per denominator of the plan
+#
+# Returns: Generator of (percentage, resized OpenCV image), largest percentage first
+# *****
+def ResizeImageByPlan(inResizePlan, inDecodeImageFunc):
+    
+    imgDecodes = {}
+    
+    # Largest percentage first, smaller percentages may be resampled from larger ones
+    imgResizes = []
+    for resizeStep in inResizePlan:
+        
+        if resizeStep.sourceIndex is None:
+            if resizeStep.decodeScaleDenominator not in imgDecodes:
+                imgDecodes[resizeStep.decodeScaleDenominator] = inDecodeImageFunc(resizeStep.decodeScaleDenominator)
+            imgSource = imgDecodes[resizeStep.decodeScaleDenominator]
+        else:
+            imgSource = imgResizes[resizeStep.sourceIndex]
+        
+        with TimeStage("resize", imgSource.shape[0] * imgSource.shape[1]):
+            
+            if resizeStep.sourceIndex is None and resizeStep.decodeScaleDenominator == 1:
+                
+                # Resize the full resolution image by fraction, as ResizeImageByPercentAndSave does,
+                # OpenCV only takes a float for fractional percentages
+                resizeFraction = float(resizeStep.percentage) / 100
+                imgResize = cv2.resize(imgSource, (0,0), fx=resizeFraction, fy=resizeFraction)
+                
+            else:
+                
+                imgResize = cv2.resize(imgSource, (resizeStep.width,resizeStep.height))
+        
+        imgResizes.append(imgResize)
+        yield (resizeStep.percentage, imgResize)
+
+
+# *****
+# ResizeImageByPercentages
+#
+# Description: Resizes image by several percentages, planned together
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inResizePercentages : Percentages by which to resize the image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#
+# Returns: Generator of (percentage, resized OpenCV image), largest percentage first
+# *****
+def ResizeImageByPercentages(inImage, inResizePercentages, inResizeQuality="exact"):
+    
+    imgHeight, imgWidth = inImage.shape[:2]
+    resizePlan = PlanMultiScaleResize((imgWidth, imgHeight), inResizePercentages, inResizeQuality, True)
+    
+    return ResizeImageByPlan(resizePlan, lambda inScaleDenominator: inImage)
+
+
+# *****
+# ResizeImageByPercentagesAndSave
+#
+# Description: Resizes image by several percentages, planned together, and saves the results
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inResizedImageFNs : Dictionary of output path and file name where each result is saved, keyed by percentage
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+# *****
+def ResizeImageByPercentagesAndSave(inImage, inResizedImageFNs, inResizeQuality="exact"):
+    
+    for resizePercentage, imgResize in ResizeImageByPercentages(inImage, inResizedImageFNs.keys(), inResizeQuality):
+        
+        SaveImage(imgResize, inResizedImageFNs[resizePercentage])
+
+
+# *****
+# ResizeImageFileByPercentages
+#
+# Description: Decodes an image, at the reduced resolutions the resize quality allows, and resizes it
+# by several percentages
+#
+# Parameters:
+#    inImageFN : Path and file name of the image to resize
+#    inResizePercentages : Percentages by which to resize the image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#
+# Returns: Generator of (percentage, resized OpenCV image), largest percentage first
+# *****
+def ResizeImageFileByPercentages(inImageFN, inResizePercentages, inResizeQuality="exact"):
+    
+    # The full resolution size is read from the jpg header, other formats are decoded at full resolution
+    imgSize = ReadJpegSize(inImageFN)
+    if imgSize is None:
+        return ResizeImageByPercentages(LoadImage(inImageFN), inResizePercentages, inResizeQuality)
+    
+    # Let the jpg decoder scale the image down, each percentage from the decode costing the least
+    resizePlan = PlanMultiScaleResize(imgSize, inResizePercentages, inResizeQuality, True, reducedDecodeCost)
+    
+    return ResizeImageByPlan(resizePlan, lambda inScaleDenominator: LoadImage(inImageFN, reducedColorFlags[inScaleDenominator]))
+
+
+# *****
+# ResizeImageFileByPercentagesAndSave
+#
+# Description: Decodes an image, at the reduced resolutions the resize quality allows, then resizes it
+# by several percentages and saves the results
+#
+# Parameters:
+#    inImageFN : Path and file name of the image to resize
+#    inResizedImageFNs : Dictionary of output path and file name where each result is saved, keyed by percentage
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for OpenCV's defaults
+# *****
+def ResizeImageFileByPercentagesAndSave(inImageFN, inResizedImageFNs, inResizeQuality="exact", inJpegSettings=None):
+    
+    for resizePercentage, imgResize in ResizeImageFileByPercentages(inImageFN, inResizedImageFNs.keys(), inResizeQuality):
+        
+        SaveImage(imgResize, inResizedImageFNs[resizePercentage], inJpegSettings)
+
+
+# *****
+# LoadImage
+#
+# Description: Opens and decodes an image, or maps its decoded pixels from a cache
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#    inReadFlags : cv2.imread flags
+#    inPixelCache : DecodedPixelCache, None to always decode the image
+#
+# Returns: The decoded OpenCV image
+# *****
+def LoadImage(inImageFN, inReadFlags=cv2.IMREAD_COLOR, inPixelCache=None):
+    
+    # Pixels decoded with other flags are cached apart
+    if inPixelCache is not None:
+        return inPixelCache.LoadFrame(inImageFN, "opencv" + str(inReadFlags), functools.partial(LoadImage, inReadFlags=inReadFlags))
+    
+    with TimeStage("decode") as stageRecord:
+        
+        img = cv2.imread(inImageFN, inReadFlags)
+        
+        if img is None:
+            raise IOError("Unable to read image: " + inImageFN)
+        
+        stageRecord["pixels"] = img.shape[0] * img.shape[1]
+        stageRecord["bytesRead"] = os.path.getsize(inImageFN)
+    
+    return img
+
+
+# *****
+# EncodeImageJpeg
+#
+# Description: Encodes an image as jpg in memory
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inQuality : Jpg quality, None for OpenCV's default
+#    inJpegSettings : JpegEncoding.JpegSettings
+#
+# Returns: The jpg bytes
+# *****
+def EncodeImageJpeg(inImage, inQuality, inJpegSettings):
+
+    encodeParams = []
+    if inQuality is not None:
+        encodeParams += [cv2.IMWRITE_JPEG_QUALITY, inQuality]
+    if inJpegSettings.progressive:
+        encodeParams += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+    if inJpegSettings.optimize:
+        encodeParams += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+    if inJpegSettings.subsampling:
+        encodeParams += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, getattr(cv2, jpegSamplingFactorNames[inJpegSettings.subsampling])]
+
+    encodeOk, jpegBuffer = cv2.imencode(".jpg", inImage, encodeParams)
+    if not encodeOk:
+        raise IOError("Unable to encode image as jpg")
+
+    return jpegBuffer.tobytes()
+
+
+# *****
+# GetImageGrey
+#
+# Description: Luma of an image
+#
+# Parameters:
+#    inImage : An OpenCV image
+#
+# Returns: 2D uint8 array
+# *****
+def GetImageGrey(inImage):
+
+    if inImage.ndim == 2:
+        return inImage
+
+    return cv2.cvtColor(inImage, cv2.COLOR_BGR2GRAY)
+
+
+# *****
+# DecodeJpegGrey
+#
+# Description: Decodes the luma of jpg bytes
+#
+# Parameters:
+#    inJpegBytes : The jpg bytes
+#
+# Returns: 2D uint8 array
+# *****
+def DecodeJpegGrey(inJpegBytes):
+
+    return cv2.imdecode(np.frombuffer(inJpegBytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+# *****
+# SaveImage
+#
+# Description: Encodes an image and saves it, the format is given by the file name extension
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inImageFN : Output path and file name where the image is saved
+#    inJpegSettings : JpegEncoding.JpegSettings of the jpg, None for OpenCV's defaults
+# *****
+def SaveImage(inImage, inImageFN, inJpegSettings=None):
+    
+    with TimeStage("encode", inImage.shape[0] * inImage.shape[1]) as stageRecord:
+        
+        # Written to a temporary file renamed over the result, never read partially written
+        with AtomicOutputFile(inImageFN) as tempImageFN:
+            if inJpegSettings is None:
+                cv2.imwrite(tempImageFN,inImage)
+            else:
+                stageRecord["jpegQuality"], jpegBytes = EncodeJpeg(inImage, inImage.shape[1], inJpegSettings, EncodeImageJpeg, GetImageGrey, DecodeJpegGrey)
+                WriteJpegFile(jpegBytes, tempImageFN)
+        
+        stageRecord["bytesWritten"] = os.path.getsize(inImageFN)
+
+
+
+# *****
+# GetOutputImageFNs
+#
+# Description: Output paths and file names of the results of an image
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the input image
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inBatchInputImageDir : Input directory of the batch, its subdirectories are mirrored in the output
+#                           directory, None to save the results directly in the output directory
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inEffectName : Name of the effect applied instead of the sepia tone effect, naming its result
+#
+# Returns: List of the output paths and file names of the resized images, in the order of the
+# percentages, followed by the one of the sepia toned image with inSepiaTone, jpgs or of the format
+# of a multi-frame image
+# *****
+def GetOutputImageFNs(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir=None, inSepiaTone=True, inEffectName="sepia"):
+
+    # Determine the filename without path and extension
+    imageName, imageExt = os.path.splitext(os.path.basename(inBatchInImageFN))
+    outputImageDir = GetOutputImageDir(inBatchInImageFN, inBatchInputImageDir, inBatchOutputImageDir)
+
+    outputImageExt = GetOutputImageExt(inBatchInImageFN)
+
+    outputImageFNs = [os.path.join(outputImageDir, imageName + "_" + str(resizePercentage) + outputImageExt) for resizePercentage in inResizePercentages]
+    if inSepiaTone:
+        outputImageFNs.append(os.path.join(outputImageDir, imageName + "_" + inEffectName + outputImageExt))
+
+    return outputImageFNs
+
+
+# *****
+# ComputeImageOutputs
+#
+# Description: Resizes an image by the specified percentages and applies the sepia tone effect
+#
+# Parameters:
+#    inImage : An OpenCV image
+#    inBatchInImageFN : Path and file name of the image, used to name the results
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inBatchInputImageDir : Input directory of the batch, None to save the results directly in the output directory
+#    inStripHeight : Apply the sepia tone effect in strips of this number of rows over the input image, 0 for the whole image at once
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inBlendKernel : See BlendSepiaTone
+#    inEffectName : Name of the effect applied instead of the sepia tone effect
+#    inEffectPasses : Passes of the effect, see ApplyEffectChain, None for the sepia tone effect
+#
+# Returns: Generator of (output path and file name, OpenCV image) for each result
+# *****
+def ComputeImageOutputs(inImage, inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inResizeQuality="exact", inBatchInputImageDir=None, inStripHeight=0, inSepiaTone=True, inBlendKernel="lut", inEffectName="sepia", inEffectPasses=None):
+
+    outputImageFNs = GetOutputImageFNs(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir, inSepiaTone, inEffectName)
+    resizedImageFNs = dict(zip(inResizePercentages, outputImageFNs))
+
+    # Resize image by given percentages
+    for resizePercentage, imgResize in ResizeImageByPercentages(inImage, inResizePercentages, inResizeQuality):
+
+        yield (resizedImageFNs[resizePercentage], imgResize)
+
+    if not inSepiaTone:
+        return
+
+    # Apply the sepia tone effect, last as it may overwrite the input image
+    if inEffectPasses is not None:
+        yield (outputImageFNs[-1], ApplyEffectChain(inImage, inEffectPasses))
+    elif inStripHeight:
+        yield (outputImageFNs[-1], SepiaToneEffectInStrips(inImage, inStripHeight, inBlendKernel))
+    else:
+        yield (outputImageFNs[-1], SepiaToneEffect(inImage, inBlendKernel=inBlendKernel))
+
+
+# *****
+# ProcessImage
+#
+# Description: Resizes an image by the specified percentages, applies the sepia tone effect and saves the results
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the jpg image to process
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inBatchInputImageDir : Input directory of the batch, None to save the results directly in the output directory
+#    inStripHeight : Apply the sepia tone effect in strips of this number of rows over the input image, 0 for the whole image at once
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for OpenCV's defaults
+#    inPixelCache : DecodedPixelCache of the decoded pixels of the images, None to always decode them
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inBlendKernel : See BlendSepiaTone
+#    inEffectName : Name of the effect applied instead of the sepia tone effect
+#    inEffectPasses : Passes of the effect, see ApplyEffectChain, None for the sepia tone effect
+# *****
+def ProcessImage(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inResizeQuality="exact", inBatchInputImageDir=None, inStripHeight=0, inJpegSettings=None, inPixelCache=None, inSepiaTone=True, inBlendKernel="lut", inEffectName="sepia", inEffectPasses=None):
+
+    SetCurrentImage(inBatchInImageFN)
+
+    # Only resized, jpgs are decoded at the reduced resolutions the resize quality allows
+    if not inSepiaTone and inPixelCache is None:
+        ResizeImageFileByPercentagesAndSave(inBatchInImageFN, dict(zip(inResizePercentages, GetOutputImageFNs(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir, False))), inResizeQuality, inJpegSettings)
+        return
+
+    # Open the input image to process
+    img = LoadImage(inBatchInImageFN, inPixelCache=inPixelCache)
+
+    # Save each result as soon as it is computed
+    for batchOutImageFN, imgOut in ComputeImageOutputs(img, inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inResizeQuality, inBatchInputImageDir, inStripHeight, inSepiaTone, inBlendKernel, inEffectName, inEffectPasses):
+
+        SaveImage(imgOut, batchOutImageFN, inJpegSettings)
+
+
+# *****
+# SaveSepiaToneBatch
+#
+# Description: Applies the sepia tone effect to a batch of images and saves the results
+#
+# Parameters:
+#    inPendingImages : List of (path and file name, OpenCV image, output path and file name of the sepia toned image)
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for OpenCV's defaults
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: List of (path and file name, error or None) for each image
+# *****
+def SaveSepiaToneBatch(inPendingImages, inJpegSettings=None, inBlendKernel="lut"):
+
+    if not inPendingImages:
+        return []
+
+    try:
+        imgSepias = SepiaToneEffectBatch([img for batchInImageFN, img, sepiaImageFN in inPendingImages], inBlendKernel=inBlendKernel)
+    except Exception as err:
+        errorStr = type(err).__name__ + ": " + str(err)
+        return [(batchInImageFN, errorStr) for batchInImageFN, img, sepiaImageFN in inPendingImages]
+
+    batchResults = []
+
+    for (batchInImageFN, img, sepiaImageFN), imgSepia in zip(inPendingImages, imgSepias):
+
+        SetCurrentImage(batchInImageFN)
+
+        try:
+            SaveImage(imgSepia, sepiaImageFN, inJpegSettings)
+            batchResults.append((batchInImageFN, None))
+        except Exception as err:
+            batchResults.append((batchInImageFN, type(err).__name__ + ": " + str(err)))
+
+    return batchResults
+
+
+# *****
+# ProcessImageBatch
+#
+# Description: Resizes images by the specified percentages and saves the results, applying the sepia
+# tone effect to batches of images at once
+#
+# Parameters:
+#    inBatchInImageFNs : Paths and file names of the jpg images to process
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input images
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inBatchInputImageDir : Input directory of the batch, None to save the results directly in the output directory
+#    inSepiaBatchBytes : Memory budget of a batch of images for the sepia tone effect
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for OpenCV's defaults
+#    inPixelCache : DecodedPixelCache of the decoded pixels of the images, None to always decode them
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: List of (path and file name, error or None) for each image
+# *****
+def ProcessImageBatch(inBatchInImageFNs, inBatchOutputImageDir, inResizePercentages, inResizeQuality="exact", inBatchInputImageDir=None, inSepiaBatchBytes=64 * 1024 * 1024, inJpegSettings=None, inPixelCache=None, inSepiaTone=True, inBlendKernel="lut"):
+
+    batchResults = []
+    pendingImages = []      # Images awaiting the sepia tone effect, as passed to SaveSepiaToneBatch
+    pendingBytes = 0
+
+    for batchInImageFN in inBatchInImageFNs:
+
+        SetCurrentImage(batchInImageFN)
+
+        # Resize and save the resized images right away, the sepia tone effect waits for the batch
+        try:
+            outputImageFNs = GetOutputImageFNs(batchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir, inSepiaTone)
+            resizedImageFNs = dict(zip(inResizePercentages, outputImageFNs))
+
+            if not inSepiaTone and inPixelCache is None:
+                ResizeImageFileByPercentagesAndSave(batchInImageFN, resizedImageFNs, inResizeQuality, inJpegSettings)
+            else:
+                img = LoadImage(batchInImageFN, inPixelCache=inPixelCache)
+                for resizePercentage, imgResize in ResizeImageByPercentages(img, inResizePercentages, inResizeQuality):
+                    SaveImage(imgResize, resizedImageFNs[resizePercentage], inJpegSettings)
+        except Exception as err:
+            batchResults.append((batchInImageFN, type(err).__name__ + ": " + str(err)))
+            continue
+
+        if not inSepiaTone:
+            batchResults.append((batchInImageFN, None))
+            continue
+
+        pendingImages.append((batchInImageFN, img, outputImageFNs[-1]))
+        pendingBytes += GetBatchBytes(img.shape[1], img.shape[0])
+
+        if pendingBytes >= inSepiaBatchBytes:
+            batchResults += SaveSepiaToneBatch(pendingImages, inJpegSettings, inBlendKernel)
+            pendingImages = []
+            pendingBytes = 0
+
+    return batchResults + SaveSepiaToneBatch(pendingImages, inJpegSettings, inBlendKernel)
+
+
+# *****
+# Main
+#
+# Description: Resizes the jpg images of the input directory and/or applies the sepia tone effect, as
+# set by the command line options
+#
+# Parameters:
+#    inArgv : Command line options, None for those of the script
+#
+# Returns: List of (path and file name, error) of the images that could not be processed
+# *****
+def Main(inArgv=None):
+
+    parser = CreateBatchArgumentParser("Resize jpg images by percentage and apply sepia tone effect using OpenCV", True)
+    parser.add_argument("--resize-quality", choices=resizeQualities, default="exact", help="Trade resize exactness for speed (default: exact)")
+    parser.add_argument("--strip-height", type=int, default=0, help="Apply the sepia tone effect in strips of this number of rows, bounding the memory used by large images (default: 0, whole image)")
+    parser.add_argument("--blend-kernel", choices=("lut",) + softLightKernels, default="lut", help="Blend the sepia tone color per grey level (lut) or per pixel, as with an overlay, with the numba kernel or, without Numba, the numpy kernel (default: lut)")
+    parser.add_argument("--sepia-batch-mb", type=int, default=0, help="Apply the sepia tone effect to batches of same size images using up to this many MB at once (default: 0, one image at a time)")
+    AddOperationArguments(parser)
+    args = parser.parse_args(inArgv)
+    if args.effect and (args.strip_height or args.sepia_batch_mb):
+        parser.error("--effect cannot be combined with --strip-height or --sepia-batch-mb")
+
+    batchInputImageDir = args.input_dir         # Input directory where jpg files reside
+    batchOutputImageDir = args.output_dir       # Output directory where results are saves as jpg image files
+    resizePercentages = args.resize_percentages if "resize" in args.operations else []     # Percentages to by which to resize input images
+    sepiaTone = "sepia" in args.operations
+
+    # Parameters the results depend on, results saved with other parameters are processed again by --incremental
+    processingParams = {"backend": "opencv", "resizePercentages": resizePercentages, "resizeQuality": args.resize_quality, "sepiaToneColor": sepiaToneColor, "sepiaBlurKernel": sepiaBlurKernelSize}
+    jpegSettings = GetJpegSettings(args)
+    if jpegSettings:
+        processingParams["jpegSettings"] = jpegSettings._asdict()
+    if not sepiaTone:
+        processingParams["sepiaTone"] = False
+    if args.effect:
+        processingParams["effect"] = args.effect.spec
+
+    effectName = args.effect.name if args.effect else "sepia"
+    effectPasses = CompileEffectChain(args.effect.steps, True, "BGR") if args.effect else None
+
+    pixelCache = DecodedPixelCache(args.pixel_cache_dir, args.pixel_cache_mb * 1024 * 1024) if args.pixel_cache_dir else None
+
+    processImageFunc = functools.partial(ProcessImage, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inResizeQuality=args.resize_quality, inBatchInputImageDir=batchInputImageDir, inStripHeight=args.strip_height, inJpegSettings=jpegSettings, inPixelCache=pixelCache, inSepiaTone=sepiaTone, inBlendKernel=args.blend_kernel, inEffectName=effectName, inEffectPasses=effectPasses)
+    computeOutputsFunc = functools.partial(ComputeImageOutputs, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inResizeQuality=args.resize_quality, inBatchInputImageDir=batchInputImageDir, inStripHeight=args.strip_height, inSepiaTone=sepiaTone, inBlendKernel=args.blend_kernel, inEffectName=effectName, inEffectPasses=effectPasses)
+    processImageBatchFunc = None
+    if args.sepia_batch_mb:
+        processImageBatchFunc = functools.partial(ProcessImageBatch, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inResizeQuality=args.resize_quality, inBatchInputImageDir=batchInputImageDir, inSepiaBatchBytes=args.sepia_batch_mb * 1024 * 1024, inJpegSettings=jpegSettings, inPixelCache=pixelCache, inSepiaTone=sepiaTone, inBlendKernel=args.blend_kernel)
+    blendBytesFunc = functools.partial(GetSoftLightBlendBytes, args.blend_kernel) if sepiaTone and args.blend_kernel != "lut" else None
+    estimateImageBytesFunc = functools.partial(EstimateImageBytes, inResizePercentages=resizePercentages, inEffectBytesPerPixel=sepiaWorkingBytesPerPixel if sepiaTone else 0, inBlendBytesFunc=blendBytesFunc)
+    outputImageFNsFunc = functools.partial(GetOutputImageFNs, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inBatchInputImageDir=batchInputImageDir, inSepiaTone=sepiaTone, inEffectName=effectName)
+    loadImageFunc = functools.partial(LoadImage, inPixelCache=pixelCache)
+    saveImageFunc = functools.partial(SaveImage, inJpegSettings=jpegSettings)
+
+    return RunBatch(args, batchInputImageDir, batchOutputImageDir, processImageFunc, loadImageFunc, computeOutputsFunc, saveImageFunc, outputImageFNsFunc, processingParams, loadImageFunc, None, processImageBatchFunc, estimateImageBytesFunc, "BGR")
+
+
+
+if __name__ == "__main__":
+
+    # Exit with an error status when images could not be processed
+    sys.exit(1 if Main() else 0)
@@ -1,172 +1,952 @@
-#!/usr/bin/env python
-#
-# -------------------------------------------------------------------------------------
-#
-# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
-# All rights reserved. Copyright holder cannot be held liable for any damages. 
-# 
-# Distributed under the Apache License (ASL). 
-# http://www.apache.org/licenses/
-# *****
-# Description: Python script to resize images by percentage and apply sepia tone effect 
-# using PIL (Pillow), NumPy and SciPy (developed with & tested against Python 3.5, 
-# Pillow 3.2.0, NumPy 1.10.4 and SciPy 0.17.0)
-# Resize
-# The jpg image files of the specified input directory are resized by the specified percentages
-# in the array resizePercentages and saved to the specified output directory.   
-# Sepia
-# The jpg image files of the specified input directory have the sepia tone effect applied and saved 
-# to the specified output directory.
-# 
-# Usage: Running the script will both resize and apply the sepia tone effect to the jpg images in the
-# input directory, saving the results to the output directory
-# *****
-
-
-
-import os
-import numpy as np
-from PIL import Image
-from scipy.ndimage import filters
-from scipy.misc import imsave
-
-
-
-# *****
-# SoftLight
-#
-# Description: Implements the soft light blending mode as per w3c
-# https://en.wikipedia.org/wiki/Blend_modes#Soft_Light
-#
-# Parameters:
-#    inTopImg : Open PIL image (top)
-#    inBottomImg : Open PIL image (bottom)
-# *****
-def SoftLight(inTopImg,inBottomImg):
-    
-    # Normalize color values to between 0 and 1
-    topImgArray = np.asarray(inTopImg) / 255.0
-    bottomImgArray = np.asarray(inBottomImg) / 255.0
-    
-    softLightImgArray = SoftLightF(topImgArray, bottomImgArray)
-    
-    # Convert colors back to between 0 to 255
-    softLightImgArray = softLightImgArray * 255.0
-        
-    return softLightImgArray
-
-
-# *****
-# SoftLightF
-#
-# Description: Implements f(bottom image, top image) portion of w3c soft light blending equation
-#
-# Parameters:
-#    inTopImgArray : Top image as array
-#    inBottomImgArray : Bottom image as array
-# *****
-def SoftLightF(inTopImgArray,inBottomImgArray):
-
-    softLightFArray = np.where(inTopImgArray <= 0.5,inBottomImgArray - ((1 - (2 * inTopImgArray)) * inBottomImgArray * (1 - inBottomImgArray)),inBottomImgArray + (2 * inTopImgArray - 1) * (SoftLightG(inBottomImgArray) - inBottomImgArray))
-
-    return softLightFArray
-
-
-# *****
-# SoftLightG
-#
-# Description: Implements f(bottom image) portion of w3c soft light blending equation
-#
-# Parameters:
-#    inBottomImgArray : Bottom image as array
-# *****
-def SoftLightG(inBottomImgArray):
-    
-    softLightGArray = np.where(inBottomImgArray <= 0.25, ((16 * inBottomImgArray - 12) * inBottomImgArray + 4) * inBottomImgArray, np.sqrt(inBottomImgArray))
-    
-    return softLightGArray
-
-
-# *****
-# SepiaToneEffectAndSave
-#
-# Description: Applies sepia tone effect to input image and saves the result
-#
-# Parameters:
-#    inImage : A PIL image
-#    inSepiaImageFN : Output path and file name where the result is saved
-# *****
-def SepiaToneEffectAndSave(inImage, inSepiaImageFN):
-    
-    # Desaturate (but needs to be RGB for later operations)
-    imgGrey = inImage.convert('L')
-    imgGrey = imgGrey.convert('RGB')
-    
-    # Apply a slight blur
-    imgGreySmooth = filters.gaussian_filter(imgGrey,sigma=[1,1,0]) # Do not smooth color channels - results in grayscale
-    
-    # Blend the sepia tone color with the greyscale layer using soft light
-    imgWidth, imgHeight = imgGrey.size
-    imgSepiaColor = Image.new('RGB', (imgWidth, imgHeight), (226, 89, 42, 0))
-    
-    imgSepiaArray = SoftLight(imgSepiaColor, imgGreySmooth)
-    imgSepia = Image.fromarray(imgSepiaArray.astype('uint8'), 'RGB')
-    
-    imsave(inSepiaImageFN, imgSepia)
-
-
-# *****
-# ResizeImageByPercentAndSave
-#
-# Description: Resizes image by specified percentage and saves the result
-#
-# Parameters:
-#    inImage :  A PIL image
-#    inResizePercentage : Percentage by which to resize image as a non negative integer
-#    inResizedImageFN : Output path and file name where the result is saved
-# *****
-def ResizeImageByPercentAndSave(inImage, inResizePercentage, inResizedImageFN):
-    
-    # Clone input image
-    imgClone  = inImage.copy()
-    
-    imgWidth, imgHeight = imgClone.size
-    resizeHeight = int(inResizePercentage * imgHeight / 100)
-    resizeWidth = int(inResizePercentage * imgWidth / 100)
-        
-    imgClone.resize((resizeWidth,resizeHeight), Image.ANTIALIAS)
-    
-    imsave(inResizedImageFN, imgClone)
-
-
-
-batchInputImageDir = os.path.join("..","images","in")       # Input directory where jpg files reside
-batchOutputImageDir = os.path.join("..","images","out")     # Output directory where results are saves as jpg image files
-resizePercentages = [75, 50, 25]    # Percentages to by which to resize input images
-
-# Iterate through all jpgs in the input directory 
-for jpgFile in os.listdir(batchInputImageDir):
-    
-    if jpgFile.endswith(".jpg"):    # Process jpg files only
-    
-        # Determine full path and filename
-        imageName, imageExt = os.path.splitext(jpgFile)
-        batchInImageFN = os.path.join(batchInputImageDir, jpgFile)
-
-        print("Currently processing image: " + batchInImageFN)
-
-        # Open the input image to process
-        img = Image.open(batchInImageFN)
-            
-        # Resize image by given percentages
-        for resizePercentage in resizePercentages:
-                
-            batchOutImageFN = os.path.join(batchOutputImageDir, imageName + "_" + str(resizePercentage) + ".jpg")
-            ResizeImageByPercentAndSave(img, resizePercentage, batchOutImageFN)
-                
-        # Apply the sepia tone effect
-        batchOutImageFN = os.path.join(batchOutputImageDir, imageName + "_sepia.jpg")
-        SepiaToneEffectAndSave(img, batchOutImageFN)
-            
-print("Finished processing all jpg images in input directory: " + batchInputImageDir)
-print("Output images files located in the directory: " + batchOutputImageDir)
\ No newline at end of file
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages. 
+# 
+# Distributed under the Apache License (ASL). 
+# http://www.apache.org/licenses/
+# *****
+# Description: Python script to resize images by percentage and apply sepia tone effect 
+# using PIL (Pillow), NumPy and SciPy (developed with & tested against Python 3.5, 
+# Pillow 3.2.0, NumPy 1.10.4 and SciPy 0.17.0)
+# Resize
+# The jpg image files of the specified input directory are resized by the specified percentages
+# in the array resizePercentages and saved to the specified output directory.   
+# Sepia
+# The jpg image files of the specified input directory have the sepia tone effect applied and saved 
+# to the specified output directory.
+# 
+# Usage: Running the script will both resize and apply the sepia tone effect to the jpg images in the
+# input directory, saving the results to the output directory
+# *****
+
+
+
+import io
+import os
+import sys
+import functools
+import numpy as np
+from PIL import Image
+from BatchProcessingDriver import CreateBatchArgumentParser, AddOperationArguments, RunBatch
+from DirectoryScanner import GetOutputImageDir, AtomicOutputFile
+from MultiFrameImages import GetOutputImageExt
+from StageTimer import SetCurrentImage, TimeStage
+from SoftLightLUT import GetSoftLightLUT, ApplySoftLightLUT
+from SoftLightKernel import softLightKernels, SoftLightBlend, GetSoftLightBlendBytes
+from EffectChain import effectStageNames, CompileEffectChain, GetVignetteMask, ApplyVignetteMask
+from ScratchBuffers import GetScratchBuffer
+from MultiScaleResize import resizeQualities, ReadJpegSize, GetDecodeSize, PlanMultiScaleResize
+from StripProcessing import GetGaussianHalo, IterateStrips, GetStripBufferShape, CarryHaloRows
+from ImageBatching import GroupImagesByShape, StackImages, GetBatchBytes
+from MemoryAdmission import EstimateImageBytes
+from FastGaussianBlur import blurMethods, GetBlurMethod, FastGaussianBlur
+from JpegEncoding import GetJpegSettings, EncodeJpeg, WriteJpegFile
+from DecodedPixelCache import DecodedPixelCache
+
+
+
+sepiaToneColor = (226, 89, 42)    # Sepia tone effect color (RGB)
+sepiaBlurSigma = 1                # Standard deviation of the sepia tone effect blur
+sepiaWorkingBytesPerPixel = 5    # Grey (1), blurred grey (1) and result (3) bytes per pixel of the sepia tone effect
+reducedDecodeCost = 0.25         # Decoding a jpg again at a reduced resolution costs about as much as the Lanczos resampling of a quarter of its pixels
+
+jpegSubsamplingValues = {"444": 0, "422": 1, "420": 2}    # PIL subsampling values of the JpegEncoding.jpegSubsamplings
+
+lazyDependencies = {"sepia": ("scipy.ndimage",)}    # Modules imported on first use, by operation
+
+
+
+# *****
+# SoftLight
+#
+# Description: Implements the soft light blending mode as per w3c
+# https://en.wikipedia.org/wiki/Blend_modes#Soft_Light
+#
+# Parameters:
+#    inTopImg : Open PIL image (top)
+#    inBottomImg : Open PIL image (bottom)
+# *****
+def SoftLight(inTopImg,inBottomImg):
+    
+    # Normalize color values to between 0 and 1
+    topImgArray = np.asarray(inTopImg) / 255.0
+    bottomImgArray = np.asarray(inBottomImg) / 255.0
+    
+    softLightImgArray = SoftLightF(topImgArray, bottomImgArray)
+    
+    # Convert colors back to between 0 to 255
+    softLightImgArray = softLightImgArray * 255.0
+        
+    return softLightImgArray
+
+
+# *****
+# SoftLightF
+#
+# Description: Implements f(bottom image, top image) portion of w3c soft light blending equation
+#
+# Parameters:
+#    inTopImgArray : Top image as array
+#    inBottomImgArray : Bottom image as array
+# *****
+def SoftLightF(inTopImgArray,inBottomImgArray):
+
+    softLightFArray = np.where(inTopImgArray <= 0.5,inBottomImgArray - ((1 - (2 * inTopImgArray)) * inBottomImgArray * (1 - inBottomImgArray)),inBottomImgArray + (2 * inTopImgArray - 1) * (SoftLightG(inBottomImgArray) - inBottomImgArray))
+
+    return softLightFArray
+
+
+# *****
+# SoftLightG
+#
+# Description: Implements f(bottom image) portion of w3c soft light blending equation
+#
+# Parameters:
+#    inBottomImgArray : Bottom image as array
+# *****
+def SoftLightG(inBottomImgArray):
+    
+    softLightGArray = np.where(inBottomImgArray <= 0.25, ((16 * inBottomImgArray - 12) * inBottomImgArray + 4) * inBottomImgArray, np.sqrt(inBottomImgArray))
+    
+    return softLightGArray
+
+
+# *****
+# GaussianFilter
+#
+# Description: Gaussian blur of scipy, imported on first use as only the sepia tone effect needs SciPy
+#
+# Parameters:
+#    inArray : Array to blur
+#    inSigma : Standard deviation of the Gaussian, or a sequence of one per axis
+#    inOutArray : Array of the shape of the input for the result
+#
+# Returns: The blurred array
+# *****
+def GaussianFilter(inArray, inSigma, inOutArray):
+    
+    from scipy.ndimage import gaussian_filter
+    
+    return gaussian_filter(inArray, sigma=inSigma, output=inOutArray)
+
+
+# *****
+# PrecomputeSepiaTables
+#
+# Description: Builds the lookup table of the sepia tone effect ahead of the first image, for long
+# running processes
+# *****
+def PrecomputeSepiaTables():
+
+    GetSoftLightLUT(SoftLight, sepiaToneColor)
+
+
+# *****
+# BlendSepiaTone
+#
+# Description: Blends the sepia tone color with a greyscale layer using soft light
+#
+# Parameters:
+#    inGreyArray : Greyscale layer as a uint8 array
+#    inBlendKernel : lut to look the blend up per grey level, or one of SoftLightKernel.softLightKernels
+#
+# Returns: Blended image as a uint8 array of the layer shape plus 3 channels
+# *****
+def BlendSepiaTone(inGreyArray, inBlendKernel="lut"):
+
+    if inBlendKernel == "lut":
+        return ApplySoftLightLUT(inGreyArray, GetSoftLightLUT(SoftLight, sepiaToneColor))
+
+    return SoftLightBlend(SoftLight, np.array(sepiaToneColor, np.uint8), inGreyArray[..., np.newaxis], inKernel=inBlendKernel)
+
+
+# *****
+# SepiaToneEffect
+#
+# Description: Applies sepia tone effect to input image
+#
+# Parameters:
+#    inImage : A PIL image
+#    inBlurMethod : One of FastGaussianBlur.blurMethods, see FastGaussianBlur.GetBlurMethod
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: The sepia toned PIL image
+# *****
+def SepiaToneEffect(inImage, inBlurMethod="exact", inBlendKernel="lut"):
+    
+    imgPixels = inImage.width * inImage.height
+    
+    # Desaturate, the effect is computed on the single grey channel
+    with TimeStage("desaturate", imgPixels):
+        imgGreyArray = np.asarray(inImage.convert('L'))
+    
+    # Apply a slight blur (into a reused buffer, uint8 as the blur of a uint8 image is)
+    with TimeStage("blur", imgPixels):
+        imgGreySmooth = GetScratchBuffer("greySmooth", imgGreyArray.shape, np.uint8)
+        if GetBlurMethod(inBlurMethod, sepiaBlurSigma) == "exact":
+            GaussianFilter(imgGreyArray, sepiaBlurSigma, imgGreySmooth)
+        else:
+            FastGaussianBlur(imgGreyArray, sepiaBlurSigma, inBlurMethod, imgGreySmooth)
+    
+    # Blend the sepia tone color with the greyscale layer using soft light, looked up per grey level
+    # (the smoothed layer becomes a palette image sharing the buffer, the palette being the lookup table)
+    with TimeStage("blend", imgPixels):
+        if inBlendKernel != "lut":
+            return Image.fromarray(BlendSepiaTone(imgGreySmooth, inBlendKernel))
+        
+        sepiaLUT = GetSoftLightLUT(SoftLight, sepiaToneColor)
+        
+        imgSepiaPalette = Image.frombuffer('P', (imgGreySmooth.shape[1], imgGreySmooth.shape[0]), imgGreySmooth, 'raw', 'P', 0, 1)
+        imgSepiaPalette.putpalette(sepiaLUT.tobytes())
+        imgSepia = imgSepiaPalette.convert('RGB')
+    
+    return imgSepia
+
+
+# *****
+# SepiaToneEffectInStrips
+#
+# Description: Applies sepia tone effect to input image in horizontal strips, overwriting the input
+# image, with the same result as SepiaToneEffect
+#
+# Parameters:
+#    inImage : A PIL image, overwritten if it is an RGB image
+#    inStripHeight : Number of rows per strip
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: The sepia toned PIL image, the input image if it is an RGB image
+# *****
+def SepiaToneEffectInStrips(inImage, inStripHeight, inBlendKernel="lut"):
+    
+    imgWidth, imgHeight = inImage.size
+    
+    # The result is written over the input image, which has to be an RGB image for it
+    imgSepia = inImage if inImage.mode == 'RGB' else inImage.convert('RGB')
+    
+    blurHalo = GetGaussianHalo(sepiaBlurSigma)
+    stripBufferShape = GetStripBufferShape(imgWidth, imgHeight, inStripHeight, blurHalo)
+    greyRows = GetScratchBuffer("greyStrip", stripBufferShape, np.uint8)
+    greySmoothRows = GetScratchBuffer("greySmoothStrip", stripBufferShape, np.uint8)
+    sepiaLUT = GetSoftLightLUT(SoftLight, sepiaToneColor)
+    prevStrip = None
+    
+    with TimeStage("sepia", imgWidth * imgHeight):
+        
+        for imgStrip in IterateStrips(imgHeight, inStripHeight, blurHalo):
+            
+            numStripRows = imgStrip.stripY1 - imgStrip.stripY0
+            numHaloRows = imgStrip.haloY1 - imgStrip.haloY0
+            
+            # Desaturate the rows not yet overwritten, the rows above the strip are carried over
+            numCarriedRows = CarryHaloRows(greyRows, prevStrip, imgStrip)
+            greyRows[numCarriedRows:numHaloRows] = np.asarray(imgSepia.crop((0, imgStrip.stripY0, imgWidth, imgStrip.haloY1)).convert('L'))
+            
+            # Apply a slight blur to the strip extended by its halo
+            GaussianFilter(greyRows[:numHaloRows], sepiaBlurSigma, greySmoothRows[:numHaloRows])
+            
+            # Blend through a palette image of the rows of the strip, written over the input rows
+            if inBlendKernel == "lut":
+                imgStripPalette = Image.frombuffer('P', (imgWidth, numStripRows), greySmoothRows[numCarriedRows:numCarriedRows + numStripRows], 'raw', 'P', 0, 1)
+                imgStripPalette.putpalette(sepiaLUT.tobytes())
+                imgSepia.paste(imgStripPalette.convert('RGB'), (0, imgStrip.stripY0))
+            else:
+                imgSepia.paste(Image.fromarray(BlendSepiaTone(greySmoothRows[numCarriedRows:numCarriedRows + numStripRows], inBlendKernel)), (0, imgStrip.stripY0))
+            
+            prevStrip = imgStrip
+    
+    return imgSepia
+
+
+# *****
+# SepiaToneEffectBatch
+#
+# Description: Applies sepia tone effect to many images at once, each step running once over the
+# stack of the images of the same size and mode, with the same results as SepiaToneEffect
+#
+# Parameters:
+#    inImages : List of PIL images
+#    inBlurMethod : One of FastGaussianBlur.blurMethods, see FastGaussianBlur.GetBlurMethod
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: List of the sepia toned PIL images, in the order of the input images
+# *****
+def SepiaToneEffectBatch(inImages, inBlurMethod="exact", inBlendKernel="lut"):
+    
+    imgSepias = [None] * len(inImages)
+    
+    for imgIndices in GroupImagesByShape([(img.size, img.mode) for img in inImages]):
+        
+        imgWidth, imgHeight = inImages[imgIndices[0]].size
+        stackShape = (len(imgIndices), imgHeight, imgWidth)
+        stackPixels = len(imgIndices) * imgWidth * imgHeight
+        
+        # Desaturate, RGB images with the integer weights of PIL's conversion to greyscale
+        with TimeStage("desaturate", stackPixels):
+            greyStack = GetScratchBuffer("greyStack", stackShape, np.uint8)
+            if inImages[imgIndices[0]].mode == 'RGB':
+                rgbStack = StackImages([np.asarray(inImages[imgIndex]) for imgIndex in imgIndices], GetScratchBuffer("rgbStack", stackShape + (3,), np.uint8))
+                greyWeighted = np.multiply(rgbStack[..., 0], 19595, dtype=np.uint32)
+                greyWeighted += np.multiply(rgbStack[..., 1], 38470, dtype=np.uint32)
+                greyWeighted += np.multiply(rgbStack[..., 2], 7471, dtype=np.uint32)
+                greyWeighted += 0x8000
+                greyWeighted >>= 16
+                greyStack[...] = greyWeighted
+            else:
+                StackImages([np.asarray(inImages[imgIndex].convert('L')) for imgIndex in imgIndices], greyStack)
+        
+        # Apply a slight blur to each image, along the rows and columns of the stack only
+        with TimeStage("blur", stackPixels):
+            greySmoothStack = GetScratchBuffer("greySmoothStack", stackShape, np.uint8)
+            if GetBlurMethod(inBlurMethod, sepiaBlurSigma) == "exact":
+                GaussianFilter(greyStack, (0, sepiaBlurSigma, sepiaBlurSigma), greySmoothStack)
+            else:
+                FastGaussianBlur(greyStack, sepiaBlurSigma, inBlurMethod, greySmoothStack)
+        
+        # Blend the sepia tone color with the greyscale layers using soft light (into a new array,
+        # shared by the resulting images)
+        with TimeStage("blend", stackPixels):
+            sepiaStack = BlendSepiaTone(greySmoothStack, inBlendKernel)
+            for stackIndex, imgIndex in enumerate(imgIndices):
+                imgSepias[imgIndex] = Image.fromarray(sepiaStack[stackIndex])
+    
+    return imgSepias
+
+
+# *****
+# SepiaToneEffectAndSave
+#
+# Description: Applies sepia tone effect to input image and saves the result
+#
+# Parameters:
+#    inImage : A PIL image
+#    inSepiaImageFN : Output path and file name where the result is saved
+# *****
+def SepiaToneEffectAndSave(inImage, inSepiaImageFN):
+    
+    SaveImage(SepiaToneEffect(inImage), inSepiaImageFN)
+
+
+# *****
+# ApplyEffectChain
+#
+# Description: Applies an effect to input image, pass after pass
+#
+# Parameters:
+#    inImage : A PIL image
+#    inEffectPasses : Passes returned by EffectChain.CompileEffectChain for RGB images and truncated values
+#    inBlurMethod : One of FastGaussianBlur.blurMethods, see FastGaussianBlur.GetBlurMethod
+#
+# Returns: The resulting PIL image, greyscale if the effect ends desaturated
+# *****
+def ApplyEffectChain(inImage, inEffectPasses, inBlurMethod="exact"):
+    
+    imgEffect = inImage if inImage.mode in ('L', 'RGB') else inImage.convert('RGB')
+    
+    for effectPass in inEffectPasses:
+        
+        with TimeStage(effectStageNames[effectPass.kind], imgEffect.width * imgEffect.height):
+            
+            if effectPass.kind == "desaturate":
+                imgEffect = imgEffect.convert('L')
+            
+            elif effectPass.kind == "blur":
+                imgArray = np.asarray(imgEffect)
+                blurSigma = sepiaBlurSigma if effectPass.sigma is None else effectPass.sigma
+                if GetBlurMethod(inBlurMethod, blurSigma) == "exact":
+                    imgEffect = Image.fromarray(GaussianFilter(imgArray, blurSigma if imgArray.ndim == 2 else (blurSigma, blurSigma, 0), np.empty_like(imgArray)))
+                else:
+                    imgEffect = Image.fromarray(FastGaussianBlur(imgArray, blurSigma, inBlurMethod, inAxes=(0, 1)))
+            
+            else:
+                # A color image is looked up per channel by PIL, a greyscale one through a palette image
+                if effectPass.lut is not None and imgEffect.mode == 'RGB':
+                    imgEffect = imgEffect.point(effectPass.lut.T.ravel().tolist())
+                elif effectPass.lut is not None:
+                    imgPalette = Image.frombuffer('P', imgEffect.size, np.asarray(imgEffect), 'raw', 'P', 0, 1)
+                    imgPalette.putpalette(effectPass.lut.tobytes())
+                    imgEffect = imgPalette.convert('RGB')
+                if effectPass.vignettes:
+                    imgEffect = Image.fromarray(ApplyVignetteMask(np.asarray(imgEffect), GetVignetteMask(imgEffect.width, imgEffect.height, effectPass.vignettes)))
+    
+    return imgEffect
+
+
+# *****
+# ResizeImageByPercentAndSave
+#
+# Description: Resizes image by specified percentage and saves the result
+#
+# Parameters:
+#    inImage :  A PIL image
+#    inResizePercentage : Percentage by which to resize image as a non negative integer
+#    inResizedImageFN : Output path and file name where the result is saved
+# *****
+def ResizeImageByPercentAndSave(inImage, inResizePercentage, inResizedImageFN):
+    
+    imgWidth, imgHeight = inImage.size
+    resizeHeight = int(inResizePercentage * imgHeight / 100)
+    resizeWidth = int(inResizePercentage * imgWidth / 100)
+    
+    # Resize returns a new image, the input image is left unchanged
+    with TimeStage("resize", imgWidth * imgHeight):
+        imgResize = inImage.resize((resizeWidth,resizeHeight), Image.LANCZOS)
+    
+    SaveImage(imgResize, inResizedImageFN)
+
+
+# *****
+# ResizeImageByPlan
+#
+# Description: Resizes image by several percentages, as planned by MultiScaleResize.PlanMultiScaleResize
+#
+# Parameters:
+#    inResizePlan : List of MultiScaleResize.ResizeStep
+#    inDecodeImageFunc : Function returning the PIL image decoded at the reduced resolution of a scale
+#                        denominator (1 for full resolution), called once per denominator of the plan
+#
+# Returns: Generator of (percentage, resized PIL image), largest percentage first
+# *****
+def ResizeImageByPlan(inResizePlan, inDecodeImageFunc):
+    
+    imgDecodes = {}
+    
+    # Largest percentage first, smaller percentages may be resampled from larger ones
+    imgResizes = []
+    for resizeStep in inResizePlan:
+        
+        if resizeStep.sourceIndex is None:
+            if resizeStep.decodeScaleDenominator not in imgDecodes:
+                imgDecodes[resizeStep.decodeScaleDenominator] = inDecodeImageFunc(resizeStep.decodeScaleDenominator)
+            imgSource = imgDecodes[resizeStep.decodeScaleDenominator]
+        else:
+            imgSource = imgResizes[resizeStep.sourceIndex]
+        
+        with TimeStage("resize", imgSource.width * imgSource.height):
+            imgResize = imgSource.resize((resizeStep.width,resizeStep.height), Image.LANCZOS)
+        
+        imgResizes.append(imgResize)
+        yield (resizeStep.percentage, imgResize)
+
+
+# *****
+# ResizeImageByPercentages
+#
+# Description: Resizes image by several percentages, planned together
+#
+# Parameters:
+#    inImage : A PIL image
+#    inResizePercentages : Percentages by which to resize the image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#
+# Returns: Generator of (percentage, resized PIL image), largest percentage first
+# *****
+def ResizeImageByPercentages(inImage, inResizePercentages, inResizeQuality="exact"):
+    
+    resizePlan = PlanMultiScaleResize(inImage.size, inResizePercentages, inResizeQuality)
+    
+    return ResizeImageByPlan(resizePlan, lambda inScaleDenominator: inImage)
+
+
+# *****
+# ResizeImageByPercentagesAndSave
+#
+# Description: Resizes image by several percentages, planned together, and saves the results
+#
+# Parameters:
+#    inImage : A PIL image
+#    inResizedImageFNs : Dictionary of output path and file name where each result is saved, keyed by percentage
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+# *****
+def ResizeImageByPercentagesAndSave(inImage, inResizedImageFNs, inResizeQuality="exact"):
+    
+    for resizePercentage, imgResize in ResizeImageByPercentages(inImage, inResizedImageFNs.keys(), inResizeQuality):
+        
+        SaveImage(imgResize, inResizedImageFNs[resizePercentage])
+
+
+# *****
+# ResizeImageFileByPercentages
+#
+# Description: Decodes an image, at the reduced resolutions the resize quality allows, and resizes it
+# by several percentages
+#
+# Parameters:
+#    inImageFN : Path and file name of the image to resize
+#    inResizePercentages : Percentages by which to resize the image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#
+# Returns: Generator of (percentage, resized PIL image), largest percentage first
+# *****
+def ResizeImageFileByPercentages(inImageFN, inResizePercentages, inResizeQuality="exact"):
+    
+    # The full resolution size is read from the jpg header, other formats are decoded at full resolution
+    imgSize = ReadJpegSize(inImageFN)
+    if imgSize is None:
+        return ResizeImageByPercentages(LoadImage(inImageFN), inResizePercentages, inResizeQuality)
+    
+    # Let the jpg decoder scale the image down, each percentage from the decode costing the least
+    resizePlan = PlanMultiScaleResize(imgSize, inResizePercentages, inResizeQuality, inDecodeCost=reducedDecodeCost)
+    
+    return ResizeImageByPlan(resizePlan, lambda inScaleDenominator: LoadImage(inImageFN, inScaleDenominator=inScaleDenominator))
+
+
+# *****
+# ResizeImageFileByPercentagesAndSave
+#
+# Description: Decodes an image, at the reduced resolutions the resize quality allows, then resizes it
+# by several percentages and saves the results
+#
+# Parameters:
+#    inImageFN : Path and file name of the image to resize
+#    inResizedImageFNs : Dictionary of output path and file name where each result is saved, keyed by percentage
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for PIL's defaults
+# *****
+def ResizeImageFileByPercentagesAndSave(inImageFN, inResizedImageFNs, inResizeQuality="exact", inJpegSettings=None):
+    
+    for resizePercentage, imgResize in ResizeImageFileByPercentages(inImageFN, inResizedImageFNs.keys(), inResizeQuality):
+        
+        SaveImage(imgResize, inResizedImageFNs[resizePercentage], inJpegSettings)
+
+
+# *****
+# LoadImage
+#
+# Description: Opens and decodes an image, or maps its decoded pixels from a cache
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#    inPixelCache : DecodedPixelCache, None to always decode the image
+#    inScaleDenominator : Decode a jpg image at this reduced resolution (1, 2, 4 or 8), not cached
+#
+# Returns: The decoded PIL image, read only if mapped from the cache
+# *****
+def LoadImage(inImageFN, inPixelCache=None, inScaleDenominator=1):
+    
+    # Cached as greyscale or RGB pixels, as shared with worker processes
+    if inPixelCache is not None:
+        return ImageFromFrame(LoadImageFrame(inImageFN, inPixelCache))
+    
+    with TimeStage("decode") as stageRecord:
+        
+        img = Image.open(inImageFN)
+        
+        # Let the jpg decoder scale the image down (ignored by other formats)
+        if inScaleDenominator > 1:
+            img.draft(img.mode, GetDecodeSize(img.size, inScaleDenominator))
+        
+        img.load()
+        
+        stageRecord["pixels"] = img.width * img.height
+        stageRecord["bytesRead"] = os.path.getsize(inImageFN)
+    
+    return img
+
+
+# *****
+# LoadImageFrame
+#
+# Description: Opens and decodes an image to a NumPy array, to be shared with worker processes, or
+# maps its decoded pixels from a cache
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#    inPixelCache : DecodedPixelCache, None to always decode the image
+#
+# Returns: NumPy array of the greyscale or RGB pixels of the image
+# *****
+def LoadImageFrame(inImageFN, inPixelCache=None):
+    
+    if inPixelCache is not None:
+        return inPixelCache.LoadFrame(inImageFN, "pil", LoadImageFrame)
+    
+    img = LoadImage(inImageFN)
+    
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    
+    return np.asarray(img)
+
+
+# *****
+# ImageFromFrame
+#
+# Description: Wraps a NumPy array of pixels as a PIL image sharing its memory
+#
+# Parameters:
+#    inFrame : NumPy array of greyscale (height x width) or RGB (height x width x 3) pixels
+#
+# Returns: A read only PIL image
+# *****
+def ImageFromFrame(inFrame):
+    
+    imgMode = 'L' if inFrame.ndim == 2 else 'RGB'
+    
+    return Image.frombuffer(imgMode, (inFrame.shape[1], inFrame.shape[0]), inFrame, 'raw', imgMode, 0, 1)
+
+
+# *****
+# EncodeImageJpeg
+#
+# Description: Encodes an image as jpg in memory
+#
+# Parameters:
+#    inImage : A PIL image
+#    inQuality : Jpg quality, None for PIL's default
+#    inJpegSettings : JpegEncoding.JpegSettings
+#
+# Returns: The jpg bytes
+# *****
+def EncodeImageJpeg(inImage, inQuality, inJpegSettings):
+
+    saveOptions = {"progressive": inJpegSettings.progressive, "optimize": inJpegSettings.optimize}
+    if inQuality is not None:
+        saveOptions["quality"] = inQuality
+    if inJpegSettings.subsampling:
+        saveOptions["subsampling"] = jpegSubsamplingValues[inJpegSettings.subsampling]
+
+    jpegFile = io.BytesIO()
+    inImage.save(jpegFile, "JPEG", **saveOptions)
+
+    return jpegFile.getvalue()
+
+
+# *****
+# GetImageGrey
+#
+# Description: Luma of an image
+#
+# Parameters:
+#    inImage : A PIL image
+#
+# Returns: 2D uint8 array
+# *****
+def GetImageGrey(inImage):
+
+    return np.asarray(inImage.convert("L"))
+
+
+# *****
+# DecodeJpegGrey
+#
+# Description: Decodes the luma of jpg bytes
+#
+# Parameters:
+#    inJpegBytes : The jpg bytes
+#
+# Returns: 2D uint8 array
+# *****
+def DecodeJpegGrey(inJpegBytes):
+
+    return GetImageGrey(Image.open(io.BytesIO(inJpegBytes)))
+
+
+# *****
+# SaveImage
+#
+# Description: Encodes an image and saves it, the format is given by the file name extension
+#
+# Parameters:
+#    inImage : A PIL image
+#    inImageFN : Output path and file name where the image is saved
+#    inJpegSettings : JpegEncoding.JpegSettings of the jpg, None for PIL's defaults
+# *****
+def SaveImage(inImage, inImageFN, inJpegSettings=None):
+    
+    with TimeStage("encode", inImage.width * inImage.height) as stageRecord:
+        
+        # Written to a temporary file renamed over the result, never read partially written
+        with AtomicOutputFile(inImageFN) as tempImageFN:
+            if inJpegSettings is None:
+                inImage.save(tempImageFN)
+            else:
+                stageRecord["jpegQuality"], jpegBytes = EncodeJpeg(inImage, inImage.width, inJpegSettings, EncodeImageJpeg, GetImageGrey, DecodeJpegGrey)
+                WriteJpegFile(jpegBytes, tempImageFN)
+        
+        stageRecord["bytesWritten"] = os.path.getsize(inImageFN)
+
+
+
+# *****
+# GetOutputImageFNs
+#
+# Description: Output paths and file names of the results of an image
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the input image
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inBatchInputImageDir : Input directory of the batch, its subdirectories are mirrored in the output
+#                           directory, None to save the results directly in the output directory
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inEffectName : Name of the effect applied instead of the sepia tone effect, naming its result
+#
+# Returns: List of the output paths and file names of the resized images, in the order of the
+# percentages, followed by the one of the sepia toned image with inSepiaTone, jpgs or of the format
+# of a multi-frame image
+# *****
+def GetOutputImageFNs(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir=None, inSepiaTone=True, inEffectName="sepia"):
+
+    # Determine the filename without path and extension
+    imageName, imageExt = os.path.splitext(os.path.basename(inBatchInImageFN))
+    outputImageDir = GetOutputImageDir(inBatchInImageFN, inBatchInputImageDir, inBatchOutputImageDir)
+
+    outputImageExt = GetOutputImageExt(inBatchInImageFN)
+
+    outputImageFNs = [os.path.join(outputImageDir, imageName + "_" + str(resizePercentage) + outputImageExt) for resizePercentage in inResizePercentages]
+    if inSepiaTone:
+        outputImageFNs.append(os.path.join(outputImageDir, imageName + "_" + inEffectName + outputImageExt))
+
+    return outputImageFNs
+
+
+# *****
+# ComputeImageOutputs
+#
+# Description: Resizes an image by the specified percentages and applies the sepia tone effect
+#
+# Parameters:
+#    inImage : A PIL image
+#    inBatchInImageFN : Path and file name of the image, used to name the results
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inBatchInputImageDir : Input directory of the batch, None to save the results directly in the output directory
+#    inStripHeight : Apply the sepia tone effect in strips of this number of rows over the input image, 0 for the whole image at once
+#    inBlurMethod : One of FastGaussianBlur.blurMethods, see FastGaussianBlur.GetBlurMethod
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inBlendKernel : See BlendSepiaTone
+#    inEffectName : Name of the effect applied instead of the sepia tone effect
+#    inEffectPasses : Passes of the effect, see ApplyEffectChain, None for the sepia tone effect
+#
+# Returns: Generator of (output path and file name, PIL image) for each result
+# *****
+def ComputeImageOutputs(inImage, inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inResizeQuality="exact", inBatchInputImageDir=None, inStripHeight=0, inBlurMethod="exact", inSepiaTone=True, inBlendKernel="lut", inEffectName="sepia", inEffectPasses=None):
+
+    outputImageFNs = GetOutputImageFNs(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir, inSepiaTone, inEffectName)
+    resizedImageFNs = dict(zip(inResizePercentages, outputImageFNs))
+
+    # Resize image by given percentages
+    for resizePercentage, imgResize in ResizeImageByPercentages(inImage, inResizePercentages, inResizeQuality):
+
+        yield (resizedImageFNs[resizePercentage], imgResize)
+
+    if not inSepiaTone:
+        return
+
+    # Apply the sepia tone effect, last as it may overwrite the input image
+    if inEffectPasses is not None:
+        yield (outputImageFNs[-1], ApplyEffectChain(inImage, inEffectPasses, inBlurMethod))
+    elif inStripHeight:
+        yield (outputImageFNs[-1], SepiaToneEffectInStrips(inImage, inStripHeight, inBlendKernel))
+    else:
+        yield (outputImageFNs[-1], SepiaToneEffect(inImage, inBlurMethod=inBlurMethod, inBlendKernel=inBlendKernel))
+
+
+# *****
+# ProcessImage
+#
+# Description: Resizes an image by the specified percentages, applies the sepia tone effect and saves the results
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the jpg image to process
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input image
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inBatchInputImageDir : Input directory of the batch, None to save the results directly in the output directory
+#    inStripHeight : Apply the sepia tone effect in strips of this number of rows over the input image, 0 for the whole image at once
+#    inBlurMethod : One of FastGaussianBlur.blurMethods, see FastGaussianBlur.GetBlurMethod
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for PIL's defaults
+#    inPixelCache : DecodedPixelCache of the decoded pixels of the images, None to always decode them
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inBlendKernel : See BlendSepiaTone
+#    inEffectName : Name of the effect applied instead of the sepia tone effect
+#    inEffectPasses : Passes of the effect, see ApplyEffectChain, None for the sepia tone effect
+# *****
+def ProcessImage(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inResizeQuality="exact", inBatchInputImageDir=None, inStripHeight=0, inBlurMethod="exact", inJpegSettings=None, inPixelCache=None, inSepiaTone=True, inBlendKernel="lut", inEffectName="sepia", inEffectPasses=None):
+
+    SetCurrentImage(inBatchInImageFN)
+
+    # Only resized, jpgs are decoded at the reduced resolutions the resize quality allows
+    if not inSepiaTone and inPixelCache is None:
+        ResizeImageFileByPercentagesAndSave(inBatchInImageFN, dict(zip(inResizePercentages, GetOutputImageFNs(inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir, False))), inResizeQuality, inJpegSettings)
+        return
+
+    # Open the input image to process
+    img = LoadImage(inBatchInImageFN, inPixelCache=inPixelCache)
+
+    # Save each result as soon as it is computed
+    for batchOutImageFN, imgOut in ComputeImageOutputs(img, inBatchInImageFN, inBatchOutputImageDir, inResizePercentages, inResizeQuality, inBatchInputImageDir, inStripHeight, inBlurMethod, inSepiaTone, inBlendKernel, inEffectName, inEffectPasses):
+
+        SaveImage(imgOut, batchOutImageFN, inJpegSettings)
+
+
+# *****
+# SaveSepiaToneBatch
+#
+# Description: Applies the sepia tone effect to a batch of images and saves the results
+#
+# Parameters:
+#    inPendingImages : List of (path and file name, PIL image, output path and file name of the sepia toned image)
+#    inBlurMethod : One of FastGaussianBlur.blurMethods, see FastGaussianBlur.GetBlurMethod
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for PIL's defaults
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: List of (path and file name, error or None) for each image
+# *****
+def SaveSepiaToneBatch(inPendingImages, inBlurMethod="exact", inJpegSettings=None, inBlendKernel="lut"):
+
+    if not inPendingImages:
+        return []
+
+    try:
+        imgSepias = SepiaToneEffectBatch([img for batchInImageFN, img, sepiaImageFN in inPendingImages], inBlurMethod, inBlendKernel)
+    except Exception as err:
+        errorStr = type(err).__name__ + ": " + str(err)
+        return [(batchInImageFN, errorStr) for batchInImageFN, img, sepiaImageFN in inPendingImages]
+
+    batchResults = []
+
+    for (batchInImageFN, img, sepiaImageFN), imgSepia in zip(inPendingImages, imgSepias):
+
+        SetCurrentImage(batchInImageFN)
+
+        try:
+            SaveImage(imgSepia, sepiaImageFN, inJpegSettings)
+            batchResults.append((batchInImageFN, None))
+        except Exception as err:
+            batchResults.append((batchInImageFN, type(err).__name__ + ": " + str(err)))
+
+    return batchResults
+
+
+# *****
+# ProcessImageBatch
+#
+# Description: Resizes images by the specified percentages and saves the results, applying the sepia
+# tone effect to batches of images at once
+#
+# Parameters:
+#    inBatchInImageFNs : Paths and file names of the jpg images to process
+#    inBatchOutputImageDir : Output directory where results are saved as jpg image files
+#    inResizePercentages : Percentages by which to resize the input images
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inBatchInputImageDir : Input directory of the batch, None to save the results directly in the output directory
+#    inSepiaBatchBytes : Memory budget of a batch of images for the sepia tone effect
+#    inBlurMethod : One of FastGaussianBlur.blurMethods, see FastGaussianBlur.GetBlurMethod
+#    inJpegSettings : JpegEncoding.JpegSettings of the results, None for PIL's defaults
+#    inPixelCache : DecodedPixelCache of the decoded pixels of the images, None to always decode them
+#    inSepiaTone : Apply the sepia tone effect, False to only resize
+#    inBlendKernel : See BlendSepiaTone
+#
+# Returns: List of (path and file name, error or None) for each image
+# *****
+def ProcessImageBatch(inBatchInImageFNs, inBatchOutputImageDir, inResizePercentages, inResizeQuality="exact", inBatchInputImageDir=None, inSepiaBatchBytes=64 * 1024 * 1024, inBlurMethod="exact", inJpegSettings=None, inPixelCache=None, inSepiaTone=True, inBlendKernel="lut"):
+
+    batchResults = []
+    pendingImages = []      # Images awaiting the sepia tone effect, as passed to SaveSepiaToneBatch
+    pendingBytes = 0
+
+    for batchInImageFN in inBatchInImageFNs:
+
+        SetCurrentImage(batchInImageFN)
+
+        # Resize and save the resized images right away, the sepia tone effect waits for the batch
+        try:
+            outputImageFNs = GetOutputImageFNs(batchInImageFN, inBatchOutputImageDir, inResizePercentages, inBatchInputImageDir, inSepiaTone)
+            resizedImageFNs = dict(zip(inResizePercentages, outputImageFNs))
+
+            if not inSepiaTone and inPixelCache is None:
+                ResizeImageFileByPercentagesAndSave(batchInImageFN, resizedImageFNs, inResizeQuality, inJpegSettings)
+            else:
+                img = LoadImage(batchInImageFN, inPixelCache=inPixelCache)
+                for resizePercentage, imgResize in ResizeImageByPercentages(img, inResizePercentages, inResizeQuality):
+                    SaveImage(imgResize, resizedImageFNs[resizePercentage], inJpegSettings)
+        except Exception as err:
+            batchResults.append((batchInImageFN, type(err).__name__ + ": " + str(err)))
+            continue
+
+        if not inSepiaTone:
+            batchResults.append((batchInImageFN, None))
+            continue
+
+        pendingImages.append((batchInImageFN, img, outputImageFNs[-1]))
+        pendingBytes += GetBatchBytes(img.width, img.height)
+
+        if pendingBytes >= inSepiaBatchBytes:
+            batchResults += SaveSepiaToneBatch(pendingImages, inBlurMethod, inJpegSettings, inBlendKernel)
+            pendingImages = []
+            pendingBytes = 0
+
+    return batchResults + SaveSepiaToneBatch(pendingImages, inBlurMethod, inJpegSettings, inBlendKernel)
+
+
+# *****
+# Main
+#
+# Description: Resizes the jpg images of the input directory and/or applies the sepia tone effect, as
+# set by the command line options
+#
+# Parameters:
+#    inArgv : Command line options, None for those of the script
+#
+# Returns: List of (path and file name, error) of the images that could not be processed
+# *****
+def Main(inArgv=None):
+
+    parser = CreateBatchArgumentParser("Resize jpg images by percentage and apply sepia tone effect using PIL", True)
+    parser.add_argument("--resize-quality", choices=resizeQualities, default="exact", help="Trade resize exactness for speed (default: exact)")
+    parser.add_argument("--strip-height", type=int, default=0, help="Apply the sepia tone effect in strips of this number of rows, bounding the memory used by large images (default: 0, whole image)")
+    parser.add_argument("--blur-method", choices=blurMethods, default="exact", help="Approximate the Gaussian blurs of standard deviation 2 or more, such as --effect blur:8, at a cost independent of their size, faster than the exact blur for wide blurs, narrower ones such as the sepia tone effect blur staying exact (default: exact)")
+    parser.add_argument("--blend-kernel", choices=("lut",) + softLightKernels, default="lut", help="Blend the sepia tone color per grey level (lut) or per pixel, as with an overlay, with the numba kernel or, without Numba, the numpy kernel (default: lut)")
+    parser.add_argument("--sepia-batch-mb", type=int, default=0, help="Apply the sepia tone effect to batches of same size images using up to this many MB at once (default: 0, one image at a time)")
+    AddOperationArguments(parser)
+    args = parser.parse_args(inArgv)
+    if args.strip_height and args.blur_method != "exact":
+        parser.error("--strip-height requires --blur-method exact")
+    if args.effect and (args.strip_height or args.sepia_batch_mb):
+        parser.error("--effect cannot be combined with --strip-height or --sepia-batch-mb")
+
+    batchInputImageDir = args.input_dir         # Input directory where jpg files reside
+    batchOutputImageDir = args.output_dir       # Output directory where results are saves as jpg image files
+    resizePercentages = args.resize_percentages if "resize" in args.operations else []     # Percentages to by which to resize input images
+    sepiaTone = "sepia" in args.operations
+
+    # Parameters the results depend on, results saved with other parameters are processed again by --incremental
+    processingParams = {"backend": "pil", "resizePercentages": resizePercentages, "resizeQuality": args.resize_quality, "blurMethod": args.blur_method, "sepiaToneColor": sepiaToneColor, "sepiaBlurSigma": sepiaBlurSigma}
+    jpegSettings = GetJpegSettings(args)
+    if jpegSettings:
+        processingParams["jpegSettings"] = jpegSettings._asdict()
+    if not sepiaTone:
+        processingParams["sepiaTone"] = False
+    if args.effect:
+        processingParams["effect"] = args.effect.spec
+
+    effectName = args.effect.name if args.effect else "sepia"
+    effectPasses = CompileEffectChain(args.effect.steps, False, "RGB") if args.effect else None
+
+    pixelCache = DecodedPixelCache(args.pixel_cache_dir, args.pixel_cache_mb * 1024 * 1024) if args.pixel_cache_dir else None
+
+    processImageFunc = functools.partial(ProcessImage, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inResizeQuality=args.resize_quality, inBatchInputImageDir=batchInputImageDir, inStripHeight=args.strip_height, inBlurMethod=args.blur_method, inJpegSettings=jpegSettings, inPixelCache=pixelCache, inSepiaTone=sepiaTone, inBlendKernel=args.blend_kernel, inEffectName=effectName, inEffectPasses=effectPasses)
+    computeOutputsFunc = functools.partial(ComputeImageOutputs, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inResizeQuality=args.resize_quality, inBatchInputImageDir=batchInputImageDir, inStripHeight=args.strip_height, inBlurMethod=args.blur_method, inSepiaTone=sepiaTone, inBlendKernel=args.blend_kernel, inEffectName=effectName, inEffectPasses=effectPasses)
+    processImageBatchFunc = None
+    if args.sepia_batch_mb:
+        processImageBatchFunc = functools.partial(ProcessImageBatch, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inResizeQuality=args.resize_quality, inBatchInputImageDir=batchInputImageDir, inSepiaBatchBytes=args.sepia_batch_mb * 1024 * 1024, inBlurMethod=args.blur_method, inJpegSettings=jpegSettings, inPixelCache=pixelCache, inSepiaTone=sepiaTone, inBlendKernel=args.blend_kernel)
+    blendBytesFunc = functools.partial(GetSoftLightBlendBytes, args.blend_kernel) if sepiaTone and args.blend_kernel != "lut" else None
+    estimateImageBytesFunc = functools.partial(EstimateImageBytes, inResizePercentages=resizePercentages, inEffectBytesPerPixel=sepiaWorkingBytesPerPixel if sepiaTone else 0, inBlendBytesFunc=blendBytesFunc)
+    outputImageFNsFunc = functools.partial(GetOutputImageFNs, inBatchOutputImageDir=batchOutputImageDir, inResizePercentages=resizePercentages, inBatchInputImageDir=batchInputImageDir, inSepiaTone=sepiaTone, inEffectName=effectName)
+    loadImageFunc = functools.partial(LoadImage, inPixelCache=pixelCache)
+    loadFrameFunc = functools.partial(LoadImageFrame, inPixelCache=pixelCache)
+    saveImageFunc = functools.partial(SaveImage, inJpegSettings=jpegSettings)
+
+    return RunBatch(args, batchInputImageDir, batchOutputImageDir, processImageFunc, loadImageFunc, computeOutputsFunc, saveImageFunc, outputImageFNsFunc, processingParams, loadFrameFunc, ImageFromFrame, processImageBatchFunc, estimateImageBytesFunc)
+
+
+
+if __name__ == "__main__":
+
+    # Exit with an error status when images could not be processed
+    sys.exit(1 if Main() else 0)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to spread the batch processing of images across a pool of
+# worker processes (developed with & tested against Python 3.5)
+# Parallel
+# The images are submitted to the worker processes in chunks, with a bounded number of chunks
+# in flight. An error raised while processing an image is recorded against that image only,
+# so the remaining images are still processed. Progress is reported in the input order.
+#
+# Usage: Imported by BatchProcessingPIL.py and BatchProcessingOpenCV.py when run with the
+# --workers option
+# *****
+
+
+
+import os
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from StageTimer import EnableInstrumentation, GetInstrumentationSettings, SetCurrentImage, TakeStageTimes, AddStageTimes
+
+
+
+# *****
+# ProcessImageChunk
+#
+# Description: Processes a chunk of images within a worker process, recording the outcome of each image
+#
+# Parameters:
+#    inProcessImageFunc : Function called with the path and file name of each image
+#    inImageFNs : Paths and file names of the images in the chunk
+#    inRecordStages : Settings of the timing of the stages of each image, see GetInstrumentationSettings,
+#                     the stage times returned with the results
+#    inProcessImageBatchFunc : Function processing the whole chunk instead, returning the
+#                              (path and file name, error or None) of each image
+#
+# Returns: Tuple of the list of (path and file name, error or None) and the stage times, see TakeStageTimes
+# *****
+def ProcessImageChunk(inProcessImageFunc, inImageFNs, inRecordStages=(False, False), inProcessImageBatchFunc=None):
+
+    EnableInstrumentation(*inRecordStages)
+
+    if inProcessImageBatchFunc is not None:
+        return (inProcessImageBatchFunc(inImageFNs), TakeStageTimes())
+
+    chunkResults = []
+
+    for imageFN in inImageFNs:
+
+        SetCurrentImage(imageFN)
+
+        # Isolate errors so that one bad image does not stop the rest of the chunk
+        try:
+            inProcessImageFunc(imageFN)
+            chunkResults.append((imageFN, None))
+        except Exception as err:
+            chunkResults.append((imageFN, type(err).__name__ + ": " + str(err)))
+
+    return (chunkResults, TakeStageTimes())
+
+
+# *****
+# ReportProgress
+#
+# Description: Default progress report, prints the outcome of each processed image
+#
+# Parameters:
+#    inImageFN : Path and file name of the processed image
+#    inErrorStr : Description of the error raised while processing the image, None on success
+#    inNumProcessed : Number of images processed so far
+# *****
+def ReportProgress(inImageFN, inErrorStr, inNumProcessed):
+
+    if inErrorStr is None:
+        print("Processed image " + str(inNumProcessed) + ": " + inImageFN)
+    else:
+        print("Unable to process image " + str(inNumProcessed) + ": " + inImageFN + " (" + inErrorStr + ")")
+
+
+# *****
+# ProcessImagesInParallel
+#
+# Description: Processes images across a pool of worker processes
+#
+# Parameters:
+#    inProcessImageFunc : Function called with the path and file name of each image, must be picklable
+#                         (a module level function or a functools.partial of one)
+#    inImageFNs : Iterable of paths and file names of the images to process
+#    inWorkers : Number of worker processes, defaults to the number of CPU cores
+#    inChunkSize : Number of images submitted to a worker process at a time
+#    inReportProgressFunc : Function called in input order with each image, its error (or None) and
+#                           the number of images processed so far
+#    inProcessImageBatchFunc : Function called with the paths and file names of each chunk instead of
+#                              inProcessImageFunc, returning the (path and file name, error or None) of
+#                              each image, must be picklable
+#    inMemoryAdmission : MemoryAdmission.MemoryAdmission bounding the memory of the chunks in flight, None
+#                        for no bound
+#
+# Returns: List of (path and file name, error) for the images that could not be processed
+# *****
+def ProcessImagesInParallel(inProcessImageFunc, inImageFNs, inWorkers=None, inChunkSize=4, inReportProgressFunc=ReportProgress, inProcessImageBatchFunc=None, inMemoryAdmission=None):
+
+    numWorkers = inWorkers if inWorkers else os.cpu_count()
+    maxChunksInFlight = 2 * numWorkers     # Enough to keep every worker busy while results are collected
+
+    imageFNIter = iter(inImageFNs)
+    chunksInFlight = collections.deque()    # (future, memory estimate) of each chunk
+    pendingChunkImageFNs = None             # Chunk read from the input but not yet admitted
+    failedImages = []
+    numProcessed = 0
+
+    with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+
+        while True:
+
+            # Top up the chunks in flight, the input is consumed lazily
+            while len(chunksInFlight) < maxChunksInFlight:
+
+                if pendingChunkImageFNs is None:
+                    pendingChunkImageFNs = list(itertools.islice(imageFNIter, inChunkSize))
+                if not pendingChunkImageFNs:
+                    break
+
+                # Wait for chunks in flight to complete while the chunk does not fit in the memory budget
+                # (the images of a chunk are processed one after the other, unless by a batch function)
+                chunkBytes = 0
+                if inMemoryAdmission is not None:
+                    chunkBytes = inMemoryAdmission.GetImagesBytes(pendingChunkImageFNs, inProcessImageBatchFunc is not None)
+                    if not inMemoryAdmission.TryAdmit(chunkBytes):
+                        break
+
+                chunksInFlight.append((executor.submit(ProcessImageChunk, inProcessImageFunc, pendingChunkImageFNs, GetInstrumentationSettings(), inProcessImageBatchFunc), chunkBytes))
+                pendingChunkImageFNs = None
+
+            if not chunksInFlight:
+                break
+
+            # Collect the oldest chunk so that progress is reported in input order
+            chunkFuture, chunkBytes = chunksInFlight.popleft()
+            chunkResults, chunkStageTimes = chunkFuture.result()
+            if inMemoryAdmission is not None:
+                inMemoryAdmission.Release(chunkBytes)
+            AddStageTimes(chunkStageTimes)
+
+            for imageFN, errorStr in chunkResults:
+
+                numProcessed += 1
+                if errorStr is not None:
+                    failedImages.append((imageFN, errorStr))
+
+                if inReportProgressFunc is not None:
+                    inReportProgressFunc(imageFN, errorStr, numProcessed)
+
+    return failedImages
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to batch process images as an overlapped pipeline of decode,
+# process and encode stages (developed with & tested against Python 3.5)
+# Pipeline
+# Reader threads open and decode images ahead of the compute threads, which resize and apply
+# effects, while writer threads encode and save the results behind them. The stages are linked
+# by bounded queues, so a fast stage blocks (backpressure) instead of piling up decoded images,
+# and at most about queue size images per stage are held in memory. Decoding, image processing
+# and encoding release the GIL in PIL, OpenCV and Wand, so the stages overlap on threads.
+#
+# Usage: Imported by BatchProcessingPIL.py, BatchProcessingOpenCV.py and BatchProcessingImageMagick.py
+# when run with the --pipeline option
+# *****
+
+
+
+import threading
+import queue
+from BatchProcessingParallel import ReportProgress
+from StageTimer import SetCurrentImage
+
+
+
+pipelineStageEnd = object()     # Queue item signalling the end of the previous stage
+
+
+
+# *****
+# PipelineStage
+#
+# Description: Runs the threads of a pipeline stage, signalling the next stage once all of them are done
+#
+# Parameters:
+#    inStageFunc : Function run by each thread of the stage
+#    inNumThreads : Number of threads of the stage
+#    inNextQueue : Queue of the next stage, None for the last stage
+#    inNumNextThreads : Number of threads of the next stage
+#
+# Returns: List of the started threads
+# *****
+def PipelineStage(inStageFunc, inNumThreads, inNextQueue, inNumNextThreads):
+
+    stageState = {"running": inNumThreads}
+    stageLock = threading.Lock()
+
+    def RunStageThread():
+
+        try:
+            inStageFunc()
+        finally:
+            with stageLock:
+                stageState["running"] -= 1
+                lastThread = stageState["running"] == 0
+
+            # The last thread of the stage to finish ends the next stage
+            if lastThread and inNextQueue is not None:
+                for threadIndex in range(inNumNextThreads):
+                    inNextQueue.put(pipelineStageEnd)
+
+    stageThreads = [threading.Thread(target=RunStageThread, daemon=True) for threadIndex in range(inNumThreads)]
+    for stageThread in stageThreads:
+        stageThread.start()
+
+    return stageThreads
+
+
+# *****
+# ProcessImagesInPipeline
+#
+# Description: Processes images through overlapped decode, compute and encode stages
+#
+# Parameters:
+#    inImageFNs : Iterable of paths and file names of the images to process
+#    inLoadImageFunc : Function opening and decoding an image, given its path and file name
+#    inComputeOutputsFunc : Function given a decoded image and its path and file name, returning the
+#                           (output path and file name, image) of each result
+#    inSaveImageFunc : Function encoding and saving a result, given the image and its output path and file name
+#    inReaderThreads : Number of threads decoding images
+#    inComputeThreads : Number of threads computing results
+#    inWriterThreads : Number of threads encoding and saving results
+#    inQueueSize : Maximum number of images waiting between two stages
+#    inReportProgressFunc : Function called with each image, its error (or None) and the number of
+#                           images processed so far
+#    inMemoryAdmission : MemoryAdmission.MemoryAdmission bounding the memory of the images between
+#                        decoding and saving, None for no bound
+#
+# Returns: List of (path and file name, error) for the images that could not be processed
+# *****
+def ProcessImagesInPipeline(inImageFNs, inLoadImageFunc, inComputeOutputsFunc, inSaveImageFunc, inReaderThreads=2, inComputeThreads=1, inWriterThreads=2, inQueueSize=4, inReportProgressFunc=ReportProgress, inMemoryAdmission=None):
+
+    imageFNIter = iter(inImageFNs)
+    imageFNLock = threading.Lock()
+    decodedQueue = queue.Queue(maxsize=inQueueSize)     # (path and file name, decoded image, error)
+    computedQueue = queue.Queue(maxsize=inQueueSize)    # (path and file name, results, error)
+
+    failedImages = []
+    progressState = {"processed": 0}
+    progressLock = threading.Lock()
+
+    def ReportImage(inImageFN, inErrorStr):
+
+        with progressLock:
+            progressState["processed"] += 1
+            if inErrorStr is not None:
+                failedImages.append((inImageFN, inErrorStr))
+            if inReportProgressFunc is not None:
+                inReportProgressFunc(inImageFN, inErrorStr, progressState["processed"])
+
+    def ReadImages():
+
+        while True:
+
+            with imageFNLock:
+                imageFN = next(imageFNIter, None)
+            if imageFN is None:
+                return
+
+            SetCurrentImage(imageFN)
+
+            # Wait for images to be saved while the image does not fit in the memory budget
+            if inMemoryAdmission is not None:
+                inMemoryAdmission.Admit(inMemoryAdmission.GetImagesBytes([imageFN]))
+
+            try:
+                decodedQueue.put((imageFN, inLoadImageFunc(imageFN), None))
+            except Exception as err:
+                decodedQueue.put((imageFN, None, type(err).__name__ + ": " + str(err)))
+
+    def ComputeImages():
+
+        while True:
+
+            decodedItem = decodedQueue.get()
+            if decodedItem is pipelineStageEnd:
+                return
+
+            imageFN, img, errorStr = decodedItem
+            imgOutputs = None
+            SetCurrentImage(imageFN)
+
+            if errorStr is None:
+                try:
+                    imgOutputs = list(inComputeOutputsFunc(img, imageFN))
+                except Exception as err:
+                    errorStr = type(err).__name__ + ": " + str(err)
+                finally:
+                    # The decoded image is no longer needed once its results are computed, unless a
+                    # result was written over it (closed by the writer once saved)
+                    if hasattr(img, "close") and not any(imgOut is img for outImageFN, imgOut in imgOutputs or []):
+                        img.close()
+
+            computedQueue.put((imageFN, imgOutputs, errorStr))
+
+    def WriteImages():
+
+        while True:
+
+            computedItem = computedQueue.get()
+            if computedItem is pipelineStageEnd:
+                return
+
+            imageFN, imgOutputs, errorStr = computedItem
+            SetCurrentImage(imageFN)
+
+            if errorStr is None:
+                try:
+                    for outImageFN, imgOut in imgOutputs:
+                        inSaveImageFunc(imgOut, outImageFN)
+                except Exception as err:
+                    errorStr = type(err).__name__ + ": " + str(err)
+                finally:
+                    for outImageFN, imgOut in imgOutputs:
+                        if hasattr(imgOut, "close"):
+                            imgOut.close()
+
+            if inMemoryAdmission is not None:
+                inMemoryAdmission.Release(inMemoryAdmission.GetImagesBytes([imageFN]))
+
+            ReportImage(imageFN, errorStr)
+
+    pipelineThreads = PipelineStage(ReadImages, inReaderThreads, decodedQueue, inComputeThreads)
+    pipelineThreads += PipelineStage(ComputeImages, inComputeThreads, computedQueue, inWriterThreads)
+    pipelineThreads += PipelineStage(WriteImages, inWriterThreads, None, 0)
+
+    for pipelineThread in pipelineThreads:
+        pipelineThread.join()
+
+    return failedImages
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python script running the resize and sepia tone effect as a long running local service,
+# for images submitted one or a few at a time (developed with & tested against Python 3.7)
+# Workers
+# A pool of worker processes imports the backend (PIL, OpenCV or ImageMagick) and builds the lookup
+# tables of the sepia tone effect once, at start up, so that a job only pays for processing its
+# images. Each image is processed by the ProcessImage function of the backend, as by the batch scripts.
+# Jobs
+# A job is a JSON object {"images": [paths], "outputDir": path, "operations": ["resize", "sepia"],
+# "resizePercentages": [75, 50, 25]}, the last two optional. Its result is a JSON object
+# {"results": [{"image", "outputs", "error", "seconds", "stages"}], "seconds"}, with the output
+# paths, the processing time and the time per stage of each image. Jobs are read from a Unix domain
+# socket (--socket, one JSON object per line, many per connection) or from HTTP POST requests to
+# localhost (--port).
+# Batching
+# The jobs arriving within a short window (--batch-window-ms) are handed to the pool together, up to
+# a number of images (--batch-images), to amortise the round trips to the worker processes.
+# At most --max-jobs jobs are accepted at once, further jobs are refused (error busy, HTTP 503)
+# rather than queued without bound.
+#
+# Usage: python BatchProcessingService.py --backend opencv --socket /tmp/batch.sock
+#        python BatchProcessingService.py --backend pil --port 8642
+#        curl -d '{"images": ["../images/in/im0.jpg"], "outputDir": "../images/out"}' localhost:8642
+# *****
+
+
+
+import os
+import json
+import time
+import queue
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+import http.server
+import multiprocessing
+from BatchProcessingDriver import batchOperations, defaultResizePercentages
+from BatchProcessingCLI import batchBackends, LoadBackend
+from StageTimer import EnableInstrumentation, SetCurrentImage, TakeStageTimes
+
+
+
+serviceWorkerState = {}         # Backend module of a worker process, set by InitServiceWorker
+serviceBatchWindowMS = 2        # Default time waited for more jobs to hand to the pool with a job
+serviceBatchImages = 16         # Default number of images above which jobs are handed to the pool at once
+serviceMaxJobs = 64             # Default number of jobs accepted at once
+
+
+
+# *****
+# InitServiceWorker
+#
+# Description: Imports the backend in a worker process and builds its lookup tables, ahead of the
+# first job
+#
+# Parameters:
+#    inBackendName : One of BatchProcessingCLI.batchBackends
+#    inOperations : Operations whose modules are imported right away
+# *****
+def InitServiceWorker(inBackendName, inOperations):
+
+    # Interrupting the service stops the workers through the pool, not in the middle of an image
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    backendModule = LoadBackend(inBackendName, inOperations)
+
+    if "sepia" in inOperations and hasattr(backendModule, "PrecomputeSepiaTables"):
+        backendModule.PrecomputeSepiaTables()
+
+    # Stages are recorded to return their times with each image
+    EnableInstrumentation(True)
+
+    serviceWorkerState["backendModule"] = backendModule
+
+
+# *****
+# ProcessServiceImage
+#
+# Description: Processes an image of a job in a worker process
+#
+# Parameters:
+#    inImageTask : Tuple (path and file name of the image, output directory, resize percentages,
+#                  True to apply the sepia tone effect)
+#
+# Returns: Dictionary of the result of the image: image, outputs, error, seconds and stages
+# *****
+def ProcessServiceImage(inImageTask):
+
+    imageFN, outputDir, resizePercentages, sepiaTone = inImageTask
+    backendModule = serviceWorkerState["backendModule"]
+
+    SetCurrentImage(imageFN)
+    startTime = time.perf_counter()
+
+    try:
+        backendModule.ProcessImage(imageFN, outputDir, resizePercentages, inSepiaTone=sepiaTone)
+        errorStr = None
+    except Exception as err:
+        errorStr = type(err).__name__ + ": " + str(err)
+
+    imageSeconds = time.perf_counter() - startTime
+
+    stageSeconds = dict((stageName, stageAggregate["wallSeconds"]) for stageName, stageAggregate in TakeStageTimes()["stages"].items())
+
+    outputImageFNs = backendModule.GetOutputImageFNs(imageFN, outputDir, resizePercentages, inSepiaTone=sepiaTone) if errorStr is None else []
+
+    return {"image": imageFN, "outputs": outputImageFNs, "error": errorStr, "seconds": imageSeconds, "stages": stageSeconds}
+
+
+# *****
+# ServiceJob
+#
+# Description: Job submitted to the service, completed once all its images are processed
+# *****
+class ServiceJob(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inImageTasks : List of the tuples of the images of the job, see ProcessServiceImage
+    # *****
+    def __init__(self, inImageTasks):
+
+        self.imageTasks = inImageTasks
+        self.results = None
+        self.completed = threading.Event()
+
+    # *****
+    # Complete
+    #
+    # Parameters:
+    #    inResults : List of the results of the images of the job, see ProcessServiceImage
+    # *****
+    def Complete(self, inResults):
+
+        self.results = inResults
+        self.completed.set()
+
+
+# *****
+# ImageService
+#
+# Description: Pool of warm worker processes to which jobs are handed in batches
+# *****
+class ImageService(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inBackendName : One of BatchProcessingCLI.batchBackends
+    #    inOperations : Operations the workers are warmed up for, jobs may still select others
+    #    inWorkers : Number of worker processes, 0 for one per CPU core
+    #    inBatchWindowSeconds : Time waited for more jobs to hand to the pool with a job
+    #    inBatchImages : Number of images above which jobs are handed to the pool without waiting
+    #    inMaxJobs : Number of jobs accepted at once, further jobs are refused
+    # *****
+    def __init__(self, inBackendName, inOperations, inWorkers=0, inBatchWindowSeconds=serviceBatchWindowMS / 1000.0, inBatchImages=serviceBatchImages, inMaxJobs=serviceMaxJobs):
+
+        self.workers = inWorkers or os.cpu_count()
+        self.batchWindowSeconds = inBatchWindowSeconds
+        self.batchImages = inBatchImages
+        self.jobSlots = threading.BoundedSemaphore(inMaxJobs)
+        self.jobQueue = queue.Queue()
+
+        # The pool is started before any thread of the service, forked workers hold no lock
+        self.pool = multiprocessing.Pool(self.workers, InitServiceWorker, (inBackendName, list(inOperations)))
+
+        self.dispatchThread = threading.Thread(target=self.DispatchJobs, daemon=True)
+        self.dispatchThread.start()
+
+    # *****
+    # SubmitJob
+    #
+    # Description: Processes the images of a job, waiting for their results
+    #
+    # Parameters:
+    #    inJobRequest : Dictionary of the job: images, outputDir, and optionally operations and
+    #                   resizePercentages
+    #
+    # Returns: Dictionary of the results of the job: results (see ProcessServiceImage) and seconds, or
+    # error if the job is invalid or refused
+    # *****
+    def SubmitJob(self, inJobRequest):
+
+        startTime = time.perf_counter()
+
+        try:
+            imageFNs = [str(imageFN) for imageFN in inJobRequest["images"]]
+            outputDir = str(inJobRequest["outputDir"])
+            operations = inJobRequest.get("operations", batchOperations)
+            if not set(operations) <= set(batchOperations):
+                raise ValueError("unknown operations " + str(operations))
+            resizePercentages = [int(percentage) for percentage in inJobRequest.get("resizePercentages", defaultResizePercentages)] if "resize" in operations else []
+        except (KeyError, TypeError, ValueError, AttributeError) as err:
+            return {"error": "invalid job (" + type(err).__name__ + ": " + str(err) + ")"}
+
+        if not self.jobSlots.acquire(False):
+            return {"error": "busy"}
+
+        try:
+
+            if not os.path.isdir(outputDir):
+                os.makedirs(outputDir, exist_ok=True)
+
+            serviceJob = ServiceJob([(imageFN, outputDir, resizePercentages, "sepia" in operations) for imageFN in imageFNs])
+            self.jobQueue.put(serviceJob)
+            serviceJob.completed.wait()
+
+        finally:
+            self.jobSlots.release()
+
+        return {"results": serviceJob.results, "seconds": time.perf_counter() - startTime}
+
+    # *****
+    # DispatchJobs
+    #
+    # Description: Hands the queued jobs to the pool, those arriving within the batch window together,
+    # until the service is closed
+    # *****
+    def DispatchJobs(self):
+
+        while True:
+
+            serviceJob = self.jobQueue.get()
+            if serviceJob is None:
+                return
+
+            batchJobs = [serviceJob]
+            batchImages = len(serviceJob.imageTasks)
+            batchDeadline = time.perf_counter() + self.batchWindowSeconds
+
+            while batchImages < self.batchImages:
+
+                try:
+                    serviceJob = self.jobQueue.get(timeout=max(0.0, batchDeadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+
+                if serviceJob is None:
+                    self.jobQueue.put(None)
+                    break
+
+                batchJobs.append(serviceJob)
+                batchImages += len(serviceJob.imageTasks)
+
+            self.DispatchBatch(batchJobs)
+
+    # *****
+    # DispatchBatch
+    #
+    # Description: Hands the images of jobs to the pool, each job is completed with its results once
+    # all are processed
+    #
+    # Parameters:
+    #    inBatchJobs : List of ServiceJob
+    # *****
+    def DispatchBatch(self, inBatchJobs):
+
+        imageTasks = [imageTask for serviceJob in inBatchJobs for imageTask in serviceJob.imageTasks]
+
+        def CompleteBatch(inResults):
+            resultIndex = 0
+            for serviceJob in inBatchJobs:
+                serviceJob.Complete(inResults[resultIndex:resultIndex + len(serviceJob.imageTasks)])
+                resultIndex += len(serviceJob.imageTasks)
+
+        def FailBatch(inError):
+            errorStr = type(inError).__name__ + ": " + str(inError)
+            for serviceJob in inBatchJobs:
+                serviceJob.Complete([{"image": imageTask[0], "outputs": [], "error": errorStr, "seconds": 0.0, "stages": {}} for imageTask in serviceJob.imageTasks])
+
+        # Chunks spread the images of a batch over the workers with one round trip per chunk
+        chunkSize = max(1, len(imageTasks) // self.workers)
+        self.pool.map_async(ProcessServiceImage, imageTasks, chunkSize, CompleteBatch, FailBatch)
+
+    # *****
+    # Close
+    #
+    # Description: Stops dispatching jobs and the worker processes
+    # *****
+    def Close(self):
+
+        self.jobQueue.put(None)
+        self.dispatchThread.join()
+        self.pool.terminate()
+        self.pool.join()
+
+
+# *****
+# SocketJobHandler
+#
+# Description: Handles a Unix domain socket connection, one JSON job per line and one JSON result per line
+# *****
+class SocketJobHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+
+        for jobLine in self.rfile:
+
+            if not jobLine.strip():
+                continue
+
+            try:
+                jobResult = self.server.imageService.SubmitJob(json.loads(jobLine.decode("utf-8")))
+            except ValueError as err:
+                jobResult = {"error": "invalid JSON (" + str(err) + ")"}
+
+            self.wfile.write(json.dumps(jobResult).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+# *****
+# HTTPJobHandler
+#
+# Description: Handles HTTP POST requests, the body being a JSON job and the response a JSON result
+# *****
+class HTTPJobHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+
+        try:
+            jobRequest = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+            jobResult = self.server.imageService.SubmitJob(jobRequest)
+            statusCode = 503 if jobResult.get("error") == "busy" else 400 if "error" in jobResult else 200
+        except ValueError as err:
+            jobResult = {"error": "invalid JSON (" + str(err) + ")"}
+            statusCode = 400
+
+        responseBytes = json.dumps(jobResult).encode("utf-8")
+
+        self.send_response(statusCode)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(responseBytes)))
+        self.end_headers()
+        self.wfile.write(responseBytes)
+
+    def log_message(self, inFormat, *inArgs):
+
+        # One line per job on the console would cost more than a job
+        pass
+
+
+# *****
+# SubmitSocketJob
+#
+# Description: Submits a job to a service listening on a Unix domain socket, for Python clients
+#
+# Parameters:
+#    inSocketFN : Path and file name of the socket of the service
+#    inJobRequest : Dictionary of the job, see ImageService.SubmitJob
+#
+# Returns: Dictionary of the results of the job
+# *****
+def SubmitSocketJob(inSocketFN, inJobRequest):
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as clientSocket:
+
+        clientSocket.connect(inSocketFN)
+
+        with clientSocket.makefile("rwb") as socketFile:
+            socketFile.write(json.dumps(inJobRequest).encode("utf-8") + b"\n")
+            socketFile.flush()
+            return json.loads(socketFile.readline().decode("utf-8"))
+
+
+# *****
+# Main
+#
+# Description: Runs the service until interrupted, as set by the command line options
+#
+# Parameters:
+#    inArgv : Command line options, None for those of the script
+# *****
+def Main(inArgv=None):
+
+    parser = argparse.ArgumentParser(description="Resize jpg images by percentage and apply sepia tone effect as a local service of warm worker processes")
+    parser.add_argument("--backend", choices=sorted(batchBackends), default="opencv", help="Implementation processing the images (default: opencv)")
+    parser.add_argument("--operations", choices=batchOperations, nargs="+", default=list(batchOperations), help="Operations the workers are warmed up for (default: resize sepia)")
+    parser.add_argument("--workers", type=int, default=0, help="Number of worker processes, 0 for one per CPU core (default: 0)")
+    parser.add_argument("--socket", help="Listen on this Unix domain socket")
+    parser.add_argument("--port", type=int, help="Listen for HTTP POST requests on this port of localhost")
+    parser.add_argument("--batch-window-ms", type=float, default=serviceBatchWindowMS, help="Time waited for more jobs to hand to the workers with a job, in ms (default: " + str(serviceBatchWindowMS) + ")")
+    parser.add_argument("--batch-images", type=int, default=serviceBatchImages, help="Number of images above which jobs are handed to the workers without waiting (default: " + str(serviceBatchImages) + ")")
+    parser.add_argument("--max-jobs", type=int, default=serviceMaxJobs, help="Number of jobs accepted at once, further jobs are refused (default: " + str(serviceMaxJobs) + ")")
+    args = parser.parse_args(inArgv)
+    if (args.socket is None) == (args.port is None):
+        parser.error("one of --socket or --port is required")
+
+    imageService = ImageService(args.backend, args.operations, args.workers, args.batch_window_ms / 1000.0, args.batch_images, args.max_jobs)
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        jobServer = socketserver.ThreadingUnixStreamServer(args.socket, SocketJobHandler)
+        print("Serving jobs on the socket: " + args.socket)
+    else:
+        jobServer = http.server.ThreadingHTTPServer(("127.0.0.1", args.port), HTTPJobHandler)
+        print("Serving jobs on: http://127.0.0.1:" + str(args.port))
+
+    jobServer.daemon_threads = True
+    jobServer.imageService = imageService
+
+    try:
+        jobServer.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        jobServer.server_close()
+        imageService.Close()
+        if args.socket:
+            os.remove(args.socket)
+
+
+
+if __name__ == "__main__":
+
+    Main()
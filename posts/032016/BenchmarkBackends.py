@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python script to benchmark the PIL, OpenCV and ImageMagick (Wand) implementations of
+# the resize and sepia tone effect batch processing against each other (developed with & tested
+# against Python 3.5, Pillow 3.2.0, OpenCV 3.1, Wand 0.5 and NumPy 1.10.4)
+# Corpus
+# A synthetic corpus of jpg images is generated locally, in several sizes (0.3 to 50 megapixels)
+# and aspect ratios (landscape, portrait, square and panorama).
+# Benchmark
+# Each backend is run in its own process (so that its peak memory is measured in isolation) for
+# each benchmark mode:
+#    decode : opening and decoding the images
+#    resize : resizing decoded images by the resize percentages
+#    sepia : applying the sepia tone effect to decoded images
+#    end-to-end : decoding, resizing, applying the sepia tone effect and saving the results
+# Throughput (images/s and megapixels/s) and latency percentiles are recorded per backend, mode and
+# image dimensions, the peak resident memory per backend and mode (that of its process).
+# Baseline
+# The results can be saved as a JSON baseline and later runs compared against it, listing the
+# results that regressed by more than a threshold.
+#
+# Usage: python BenchmarkBackends.py --corpus-dir ../images/bench --save-baseline baseline.json
+#        python BenchmarkBackends.py --corpus-dir ../images/bench --compare-baseline baseline.json
+# *****
+
+
+
+import os
+import sys
+import json
+import time
+import math
+import shutil
+import argparse
+import tempfile
+import importlib
+import subprocess
+import numpy as np
+from StageTimer import GetPercentile
+
+
+
+benchmarkBackends = {"pil": "BatchProcessingPIL", "opencv": "BatchProcessingOpenCV", "wand": "BatchProcessingImageMagick"}
+benchmarkModes = ("decode", "resize", "sepia", "end-to-end")
+corpusMegapixels = (0.3, 2, 8, 24, 50)                              # Image sizes of the synthetic corpus
+corpusAspectRatios = ((4, 3), (3, 4), (1, 1), (16, 9), (3, 1))     # Aspect ratios (width, height) of the synthetic corpus
+resizePercentages = [75, 50, 25]                                    # Percentages by which images are resized
+latencyPercentiles = (50, 90, 99)                                   # Latency percentiles reported
+
+
+
+# *****
+# CreateSyntheticImage
+#
+# Description: Creates a synthetic photo like image (smooth gradients, shapes and sensor noise)
+#
+# Parameters:
+#    inWidth : Width of the image
+#    inHeight : Height of the image
+#    inRandomState : NumPy RandomState used for the noise
+#
+# Returns: RGB image as a uint8 array of shape (height, width, 3)
+# *****
+def CreateSyntheticImage(inWidth, inHeight, inRandomState):
+
+    # Smooth gradients per channel, in float32 to keep the 50 megapixel images affordable
+    xRamp = np.linspace(0, 1, inWidth, dtype=np.float32).reshape(1, inWidth)
+    yRamp = np.linspace(0, 1, inHeight, dtype=np.float32).reshape(inHeight, 1)
+
+    imgArray = np.empty((inHeight, inWidth, 3), np.uint8)
+    for channelIndex, (xWeight, yWeight, phase) in enumerate(((200, 40, 0.0), (80, 150, 1.0), (60, 90, 2.0))):
+
+        channelArray = xWeight * xRamp + yWeight * yRamp
+        channelArray += 30 * np.sin(12 * xRamp + phase) * np.cos(9 * yRamp)
+        channelArray += inRandomState.normal(0, 6, (inHeight, inWidth)).astype(np.float32)
+        np.clip(channelArray, 0, 255, out=channelArray)
+        imgArray[:, :, channelIndex] = channelArray
+
+    return imgArray
+
+
+# *****
+# CreateSyntheticCorpus
+#
+# Description: Creates the synthetic jpg corpus, images that already exist are kept
+#
+# Parameters:
+#    inCorpusDir : Directory where the jpg images are saved
+#    inMegapixels : Image sizes in megapixels
+#    inAspectRatios : Aspect ratios as (width, height)
+#
+# Returns: List of (path and file name, width, height) of the corpus images
+# *****
+def CreateSyntheticCorpus(inCorpusDir, inMegapixels=corpusMegapixels, inAspectRatios=corpusAspectRatios):
+
+    # The corpus is encoded with Pillow if available, otherwise OpenCV
+    try:
+        from PIL import Image
+        SaveJpg = lambda inArray, inFN: Image.fromarray(inArray, 'RGB').save(inFN, quality=90)
+    except ImportError:
+        import cv2
+        SaveJpg = lambda inArray, inFN: cv2.imwrite(inFN, inArray[:, :, ::-1], [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+    if not os.path.isdir(inCorpusDir):
+        os.makedirs(inCorpusDir)
+
+    randomState = np.random.RandomState(2016)
+    corpusImages = []
+
+    for megapixels in inMegapixels:
+        for aspectWidth, aspectHeight in inAspectRatios:
+
+            imgWidth = int(round(math.sqrt(megapixels * 1e6 * aspectWidth / aspectHeight)))
+            imgHeight = int(round(megapixels * 1e6 / imgWidth))
+
+            corpusImageFN = os.path.join(inCorpusDir, "synthetic_" + str(megapixels) + "mp_" + str(aspectWidth) + "x" + str(aspectHeight) + ".jpg")
+            if not os.path.exists(corpusImageFN):
+                SaveJpg(CreateSyntheticImage(imgWidth, imgHeight, randomState), corpusImageFN)
+
+            corpusImages.append((corpusImageFN, imgWidth, imgHeight))
+
+    return corpusImages
+
+
+# *****
+# GetPeakRSSBytes
+#
+# Description: Peak resident memory of the current process
+#
+# Returns: Peak resident memory in bytes, None where unavailable
+# *****
+def GetPeakRSSBytes():
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peakRSS if sys.platform == "darwin" else peakRSS * 1024
+
+
+# *****
+# RunBenchmarkMode
+#
+# Description: Benchmarks one mode of one backend over the corpus, within the current process
+#
+# Parameters:
+#    inBackendName : One of benchmarkBackends
+#    inMode : One of benchmarkModes
+#    inCorpusImages : List of (path and file name, width, height) of the corpus images
+#    inRepeats : Number of timed runs per image (after one untimed warm up run)
+#
+# Returns: Dictionary of the results keyed by image dimensions (as a WIDTHxHEIGHT string), and of the
+# peak resident memory of the process
+# *****
+def RunBenchmarkMode(inBackendName, inMode, inCorpusImages, inRepeats):
+
+    backendModule = importlib.import_module(benchmarkBackends[inBackendName])
+    outputDir = tempfile.mkdtemp(prefix="benchmark_")
+
+    # Closing releases the ImageMagick images, other backends free their images when unreferenced
+    CloseImage = lambda inImage: inImage.close() if inBackendName == "wand" else None
+
+    def RunDecode(inImageFN):
+        CloseImage(backendModule.LoadImage(inImageFN))
+
+    def RunResize(inImage):
+        if inBackendName == "wand":
+            for resizePercentage in resizePercentages:
+                CloseImage(backendModule.ResizeImageByPercent(inImage, resizePercentage))
+        else:
+            for resizePercentage, imgResize in backendModule.ResizeImageByPercentages(inImage, resizePercentages):
+                pass
+
+    def RunSepia(inImage):
+        CloseImage(backendModule.SepiaToneEffect(inImage))
+
+    def RunEndToEnd(inImageFN):
+        backendModule.ProcessImage(inImageFN, outputDir, resizePercentages)
+
+    modeResults = {}
+
+    try:
+
+        for imageFN, imgWidth, imgHeight in inCorpusImages:
+
+            # The resize and sepia modes time the processing of an already decoded image
+            img = backendModule.LoadImage(imageFN) if inMode in ("resize", "sepia") else None
+
+            if inMode == "decode":
+                runFunc = lambda: RunDecode(imageFN)
+            elif inMode == "resize":
+                runFunc = lambda: RunResize(img)
+            elif inMode == "sepia":
+                runFunc = lambda: RunSepia(img)
+            else:
+                runFunc = lambda: RunEndToEnd(imageFN)
+
+            runFunc()   # Warm up (lookup tables, scratch buffers, file cache)
+
+            for repeatIndex in range(inRepeats):
+
+                startTime = time.perf_counter()
+                runFunc()
+                modeResults.setdefault(str(imgWidth) + "x" + str(imgHeight), {"width": imgWidth, "height": imgHeight, "megapixels": imgWidth * imgHeight / 1e6, "latencies": []})["latencies"].append(time.perf_counter() - startTime)
+
+            if img is not None:
+                CloseImage(img)
+
+    finally:
+        shutil.rmtree(outputDir, ignore_errors=True)
+
+    for sizeResult in modeResults.values():
+
+        latencies = sorted(sizeResult.pop("latencies"))
+        totalSeconds = sum(latencies)
+
+        sizeResult["images"] = len(latencies)
+        sizeResult["imagesPerSecond"] = len(latencies) / totalSeconds
+        sizeResult["megapixelsPerSecond"] = len(latencies) * sizeResult["megapixels"] / totalSeconds
+        sizeResult["latencySeconds"] = dict((str(percentile), GetPercentile(latencies, percentile)) for percentile in latencyPercentiles)
+
+    return {"sizes": modeResults, "peakRSSBytes": GetPeakRSSBytes()}
+
+
+# *****
+# SortSizeKeys
+#
+# Description: Sorts image dimension keys of results by number of pixels, then width
+#
+# Parameters:
+#    inSizeResults : Dictionary of results keyed by WIDTHxHEIGHT strings
+#
+# Returns: List of the keys
+# *****
+def SortSizeKeys(inSizeResults):
+
+    return sorted(inSizeResults, key=lambda inSizeKey: (inSizeResults[inSizeKey]["width"] * inSizeResults[inSizeKey]["height"], inSizeResults[inSizeKey]["width"]))
+
+
+# *****
+# RunBenchmarks
+#
+# Description: Benchmarks the backends, each mode of each backend in its own process
+#
+# Parameters:
+#    inBackendNames : Backends to benchmark
+#    inModes : Benchmark modes to run
+#    inCorpusDir : Directory of the synthetic corpus
+#    inMegapixels : Image sizes in megapixels
+#    inRepeats : Number of timed runs per image
+#
+# Returns: Dictionary of results keyed by backend then mode, backends that cannot be imported are skipped
+# *****
+def RunBenchmarks(inBackendNames, inModes, inCorpusDir, inMegapixels, inRepeats):
+
+    CreateSyntheticCorpus(inCorpusDir, inMegapixels)
+
+    benchmarkResults = {}
+
+    for backendName in inBackendNames:
+        for mode in inModes:
+
+            print("Benchmarking backend " + backendName + ", mode " + mode)
+
+            benchmarkCommand = [sys.executable, os.path.abspath(__file__), "--run-backend", backendName, "--run-mode", mode,
+                                "--corpus-dir", inCorpusDir, "--repeats", str(inRepeats), "--megapixels"] + [str(megapixels) for megapixels in inMegapixels]
+            benchmarkProcess = subprocess.run(benchmarkCommand, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+            if benchmarkProcess.returncode != 0:
+                errorLines = benchmarkProcess.stderr.strip().splitlines()
+                print("Unable to benchmark backend " + backendName + ", mode " + mode + ": " + (errorLines[-1] if errorLines else "exit code " + str(benchmarkProcess.returncode)))
+                continue
+
+            benchmarkResults.setdefault(backendName, {})[mode] = json.loads(benchmarkProcess.stdout.strip().splitlines()[-1])
+
+    return benchmarkResults
+
+
+# *****
+# PrintBenchmarkResults
+#
+# Description: Prints the benchmark results as a table, followed by the peak memory of each backend
+# and mode
+#
+# Parameters:
+#    inBenchmarkResults : Results returned by RunBenchmarks
+# *****
+def PrintBenchmarkResults(inBenchmarkResults):
+
+    print("%-8s %-11s %12s %8s %10s %10s %10s %10s %10s" % ("backend", "mode", "size", "MP", "images/s", "MP/s", "p50 ms", "p90 ms", "p99 ms"))
+
+    for backendName in sorted(inBenchmarkResults):
+        for mode in benchmarkModes:
+
+            modeResults = inBenchmarkResults[backendName].get(mode)
+            if modeResults is None:
+                continue
+
+            for sizeKey in SortSizeKeys(modeResults["sizes"]):
+
+                sizeResult = modeResults["sizes"][sizeKey]
+                print("%-8s %-11s %12s %8.2f %10.2f %10.1f %10.1f %10.1f %10.1f" % (backendName, mode, sizeKey, sizeResult["megapixels"], sizeResult["imagesPerSecond"], sizeResult["megapixelsPerSecond"],
+                                                                                    1000 * sizeResult["latencySeconds"]["50"], 1000 * sizeResult["latencySeconds"]["90"], 1000 * sizeResult["latencySeconds"]["99"]))
+
+    print("")
+    print("%-8s %-11s %10s" % ("backend", "mode", "peak MB"))
+
+    for backendName in sorted(inBenchmarkResults):
+        for mode in benchmarkModes:
+
+            modeResults = inBenchmarkResults[backendName].get(mode)
+            if modeResults is not None:
+                print("%-8s %-11s %10s" % (backendName, mode, "-" if modeResults["peakRSSBytes"] is None else str(modeResults["peakRSSBytes"] // (1024 * 1024))))
+
+
+# *****
+# CompareWithBaseline
+#
+# Description: Compares benchmark results with a baseline
+#
+# Parameters:
+#    inBenchmarkResults : Results returned by RunBenchmarks
+#    inBaselineResults : Results of an earlier run
+#    inThreshold : Relative change (e.g. 0.1 for 10%) above which a result is reported as regressed
+#
+# Returns: List of regression descriptions, empty if nothing regressed
+# *****
+def CompareWithBaseline(inBenchmarkResults, inBaselineResults, inThreshold):
+
+    regressions = []
+
+    for backendName, backendResults in sorted(inBenchmarkResults.items()):
+        for mode, modeResults in sorted(backendResults.items()):
+
+            baselineModeResults = inBaselineResults.get(backendName, {}).get(mode)
+            if baselineModeResults is None:
+                continue
+
+            resultName = backendName + " " + mode
+
+            for sizeKey in SortSizeKeys(modeResults["sizes"]):
+
+                # Baselines keyed by megapixels only, of earlier versions, have no matching sizes
+                sizeResult = modeResults["sizes"][sizeKey]
+                baselineSizeResult = baselineModeResults["sizes"].get(sizeKey)
+                if baselineSizeResult is None:
+                    continue
+
+                throughputChange = sizeResult["megapixelsPerSecond"] / baselineSizeResult["megapixelsPerSecond"] - 1
+                if throughputChange < -inThreshold:
+                    regressions.append(resultName + " " + sizeKey + ": throughput " + "%+.1f%%" % (100 * throughputChange))
+
+                latencyChange = sizeResult["latencySeconds"]["90"] / baselineSizeResult["latencySeconds"]["90"] - 1
+                if latencyChange > inThreshold:
+                    regressions.append(resultName + " " + sizeKey + ": p90 latency " + "%+.1f%%" % (100 * latencyChange))
+
+            if modeResults["peakRSSBytes"] and baselineModeResults["peakRSSBytes"]:
+
+                memoryChange = modeResults["peakRSSBytes"] / baselineModeResults["peakRSSBytes"] - 1
+                if memoryChange > inThreshold:
+                    regressions.append(resultName + ": peak memory " + "%+.1f%%" % (100 * memoryChange))
+
+    return regressions
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the PIL, OpenCV and ImageMagick resize and sepia tone effect batch processing")
+    parser.add_argument("--backends", nargs="+", choices=sorted(benchmarkBackends), default=sorted(benchmarkBackends), help="Backends to benchmark (default: all)")
+    parser.add_argument("--modes", nargs="+", choices=benchmarkModes, default=list(benchmarkModes), help="Benchmark modes to run (default: all)")
+    parser.add_argument("--corpus-dir", default=os.path.join("..","images","bench"), help="Directory of the synthetic jpg corpus, created if needed")
+    parser.add_argument("--megapixels", nargs="+", type=float, default=list(corpusMegapixels), help="Image sizes of the corpus in megapixels")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of timed runs per image (default: 3)")
+    parser.add_argument("--save-baseline", help="Save the results as a JSON baseline to this file")
+    parser.add_argument("--compare-baseline", help="Compare the results with the JSON baseline in this file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change reported as a regression (default: 0.1)")
+    parser.add_argument("--run-backend", choices=sorted(benchmarkBackends), help=argparse.SUPPRESS)
+    parser.add_argument("--run-mode", choices=benchmarkModes, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Sizes are given as 0.3 or 2 rather than 2.0, so that the file names of the corpus are stable
+    megapixelSizes = [int(megapixels) if megapixels == int(megapixels) else megapixels for megapixels in args.megapixels]
+
+    if args.run_backend:
+
+        # Benchmark process of a single backend and mode, results are printed as JSON for the parent process
+        corpusImages = CreateSyntheticCorpus(args.corpus_dir, megapixelSizes)
+        print(json.dumps(RunBenchmarkMode(args.run_backend, args.run_mode, corpusImages, args.repeats)))
+
+    else:
+
+        benchmarkResults = RunBenchmarks(args.backends, args.modes, args.corpus_dir, megapixelSizes, args.repeats)
+        PrintBenchmarkResults(benchmarkResults)
+
+        if args.save_baseline:
+            with open(args.save_baseline, "w") as baselineFile:
+                json.dump(benchmarkResults, baselineFile, indent=2, sort_keys=True)
+
+        if args.compare_baseline:
+
+            with open(args.compare_baseline) as baselineFile:
+                regressions = CompareWithBaseline(benchmarkResults, json.load(baselineFile), args.threshold)
+
+            for regression in regressions:
+                print("Regression: " + regression)
+
+            if regressions:
+                sys.exit(1)
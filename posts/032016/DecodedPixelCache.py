@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to cache the decoded pixels of images on disk across runs (developed with
+# & tested against Python 3.5 and NumPy 1.10.4)
+# Cache
+# The pixels decoded from an image are saved uncompressed as a .npy file, named after the content hash
+# of the image and the layout of the pixels (the backend and its decoding flags), so that a renamed or
+# copied image is found and a modified one is not. Later runs memory map the .npy file copy on write
+# instead of decoding the image: only the pages of the pixels used are read, and the pixels can still be
+# written over in place without changing the cache.
+# Size
+# The cache is capped to a number of bytes on disk, the least recently used files (by modification time,
+# touched on each use) are removed once a new file makes it exceed the cap. Files are written to a
+# temporary file then renamed, so worker processes sharing the cache never map a partial file.
+#
+# Usage: Imported by BatchProcessingPIL.py and BatchProcessingOpenCV.py when run with the
+# --pixel-cache-dir option
+# *****
+
+
+
+import os
+import numpy as np
+from StageTimer import TimeStage
+from IncrementalManifest import HashImageFile
+
+
+
+pixelCacheExtension = ".npy"
+
+
+
+# *****
+# DecodedPixelCache
+#
+# Description: Directory of the decoded pixels of images, keyed by content hash and capped in size
+# *****
+class DecodedPixelCache(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inCacheDir : Directory of the cache, created if missing
+    #    inMaxBytes : Size of the cache on disk above which the least recently used files are removed
+    # *****
+    def __init__(self, inCacheDir, inMaxBytes):
+
+        self.cacheDir = inCacheDir
+        self.maxBytes = inMaxBytes
+
+        if not os.path.isdir(inCacheDir):
+            os.makedirs(inCacheDir)
+
+    # *****
+    # GetFrameFN
+    #
+    # Description: Path and file name of the cached pixels of an image
+    #
+    # Parameters:
+    #    inContentHash : Content hash of the image file
+    #    inLayoutName : Name of the layout of the pixels, such as the backend and its decoding flags
+    #
+    # Returns: Path and file name of the .npy file
+    # *****
+    def GetFrameFN(self, inContentHash, inLayoutName):
+
+        return os.path.join(self.cacheDir, inContentHash + "_" + inLayoutName + pixelCacheExtension)
+
+    # *****
+    # LoadFrame
+    #
+    # Description: Maps the cached pixels of an image, or decodes the image and caches its pixels
+    #
+    # Parameters:
+    #    inImageFN : Path and file name of the image
+    #    inLayoutName : Name of the layout of the pixels, such as the backend and its decoding flags
+    #    inLoadFrameFunc : Function decoding the image to a NumPy array, given its path and file name
+    #
+    # Returns: NumPy array of the pixels, memory mapped copy on write if they were cached
+    # *****
+    def LoadFrame(self, inImageFN, inLayoutName, inLoadFrameFunc):
+
+        frameFN = self.GetFrameFN(HashImageFile(inImageFN), inLayoutName)
+
+        try:
+
+            with TimeStage("cacheLoad") as stageRecord:
+
+                frame = np.load(frameFN, mmap_mode="c")
+                stageRecord["pixels"] = frame.shape[0] * frame.shape[1]
+
+            # Most recently used
+            os.utime(frameFN, None)
+
+            return frame
+
+        except (IOError, OSError, ValueError):
+
+            # Not cached, removed by another process or unreadable, decoded again
+            pass
+
+        frame = inLoadFrameFunc(inImageFN)
+        self.StoreFrame(frameFN, frame)
+
+        return frame
+
+    # *****
+    # StoreFrame
+    #
+    # Description: Saves pixels to the cache, then removes the least recently used files above the cap
+    #
+    # Parameters:
+    #    inFrameFN : Path and file name of the .npy file, see GetFrameFN
+    #    inFrame : NumPy array of the pixels
+    # *****
+    def StoreFrame(self, inFrameFN, inFrame):
+
+        tempFrameFN = inFrameFN + "." + str(os.getpid()) + ".tmp"
+
+        with open(tempFrameFN, "wb") as frameFile:
+            np.save(frameFile, np.ascontiguousarray(inFrame))
+
+        os.replace(tempFrameFN, inFrameFN)
+
+        self.EvictFrames()
+
+    # *****
+    # EvictFrames
+    #
+    # Description: Removes the least recently used files until the cache fits its cap
+    # *****
+    def EvictFrames(self):
+
+        cacheFiles = []
+
+        for cacheEntry in os.scandir(self.cacheDir):
+            if cacheEntry.name.endswith(pixelCacheExtension):
+                try:
+                    cacheStat = cacheEntry.stat()
+                except OSError:
+                    continue
+                cacheFiles.append((cacheStat.st_mtime, cacheStat.st_size, cacheEntry.path))
+
+        cacheBytes = sum(cacheFileBytes for lastUsedTime, cacheFileBytes, cacheFN in cacheFiles)
+
+        for lastUsedTime, cacheFileBytes, cacheFN in sorted(cacheFiles):
+
+            if cacheBytes <= self.maxBytes:
+                break
+
+            # Another process may have removed it already, mapped pixels stay readable once removed
+            try:
+                os.remove(cacheFN)
+            except OSError:
+                pass
+
+            cacheBytes -= cacheFileBytes
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to find the images of an input directory as a stream (developed with
+# & tested against Python 3.5)
+# Scan
+# The input directory, and optionally its subdirectories, are read with os.scandir one entry at
+# a time, so the first images are processed while the rest of the directory is still being read,
+# instead of after a complete listing of directories with millions of entries. Extensions are
+# matched case insensitively and images can be selected with include and exclude glob patterns.
+# Subdirectories reached through symbolic links are followed, each directory being scanned once, so
+# that links back to a parent directory do not loop. The results of an image are named after its file
+# name without extension, so an image whose results would be named as those of an image of the same
+# directory already found (x.jpeg or x.JPG after x.jpg) is skipped with a message rather than
+# overwriting them.
+# Output
+# The results of an image are saved in the subdirectory of the output directory matching the
+# subdirectory of the input directory where the image resides. They are written to a temporary file
+# renamed over the result, so that other processes and hosts never read a partial result.
+#
+# Usage: Imported by BatchProcessingDriver.py
+# *****
+
+
+
+import os
+import socket
+import fnmatch
+import threading
+import contextlib
+
+
+
+imageExtensions = (".jpg", ".jpeg")     # Extensions of the images to process, in lower case
+resultExtension = ".jpg"                # Extension of the results of the images of imageExtensions, other images keeping theirs in lower case
+
+
+
+# *****
+# MatchesGlobPatterns
+#
+# Description: Tells whether a path matches any of the glob patterns. A pattern without a path
+# separator is matched against the file name only, other patterns against the whole relative path
+#
+# Parameters:
+#    inRelativePath : Path relative to the input directory, with / separators
+#    inGlobPatterns : Iterable of glob patterns
+#
+# Returns: True if the path matches one of the patterns
+# *****
+def MatchesGlobPatterns(inRelativePath, inGlobPatterns):
+
+    fileName = inRelativePath.rsplit("/", 1)[-1]
+
+    for globPattern in inGlobPatterns:
+        if fnmatch.fnmatch(inRelativePath if "/" in globPattern else fileName, globPattern):
+            return True
+
+    return False
+
+
+# *****
+# ScanImageFiles
+#
+# Description: Generator of the images of an input directory, yielded as the directory is read
+#
+# Parameters:
+#    inInputDir : Input directory where the images reside
+#    inRecursive : Also scan the subdirectories of the input directory
+#    inIncludePatterns : Glob patterns of the images to process, all images if empty
+#    inExcludePatterns : Glob patterns of the images and subdirectories to skip
+#    inOutputDir : Output directory, skipped if it is within the input directory, and in which the
+#                  subdirectories of the input directory holding images are created
+#    inExtensions : Extensions of the images, in lower case
+#
+# Returns: Generator of the paths and file names of the images
+# *****
+def ScanImageFiles(inInputDir, inRecursive=False, inIncludePatterns=(), inExcludePatterns=(), inOutputDir=None, inExtensions=imageExtensions):
+
+    outputDirRealPath = os.path.realpath(inOutputDir) if inOutputDir is not None else None
+    scanDirs = [(inInputDir, "")]     # Directories left to scan, with their path relative to the input directory
+    scannedDirRealPaths = {os.path.realpath(inInputDir)}     # Directories scanned or left to scan, once each
+
+    while scanDirs:
+
+        scanDir, relativeDir = scanDirs.pop()
+        outputDirCreated = False
+        resultNames = {}    # File name of the image of each results name (name without extension and result extension)
+
+        with os.scandir(scanDir) as dirEntries:
+
+            for dirEntry in dirEntries:
+
+                relativePath = relativeDir + dirEntry.name
+
+                if inExcludePatterns and MatchesGlobPatterns(relativePath, inExcludePatterns):
+                    continue
+
+                if dirEntry.is_dir():
+
+                    # A directory linked from several places, or from within itself, is scanned once
+                    dirRealPath = os.path.realpath(dirEntry.path)
+                    if inRecursive and dirRealPath != outputDirRealPath and dirRealPath not in scannedDirRealPaths:
+                        scannedDirRealPaths.add(dirRealPath)
+                        scanDirs.append((dirEntry.path, relativePath + "/"))
+
+                elif dirEntry.name.lower().endswith(inExtensions) and dirEntry.is_file():
+
+                    if inIncludePatterns and not MatchesGlobPatterns(relativePath, inIncludePatterns):
+                        continue
+
+                    # Images of the same name up to the extension would overwrite each other's results
+                    imageName, imageExt = os.path.splitext(dirEntry.name)
+                    resultName = (imageName, resultExtension if imageExt.lower() in imageExtensions else imageExt.lower())
+                    if resultName in resultNames:
+                        print("Skipping " + dirEntry.path + ", its results would overwrite those of " + resultNames[resultName])
+                        continue
+                    resultNames[resultName] = dirEntry.name
+
+                    # Mirror the subdirectory in the output directory before its first image is processed
+                    if inOutputDir is not None and not outputDirCreated:
+                        os.makedirs(os.path.join(inOutputDir, relativeDir), exist_ok=True)
+                        outputDirCreated = True
+
+                    yield dirEntry.path
+
+
+# *****
+# GetOutputImageDir
+#
+# Description: Output directory of the results of an image, mirroring the subdirectory of the input
+# directory where the image resides
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the input image
+#    inBatchInputImageDir : Input directory that was scanned, None to save all results in the output directory
+#    inBatchOutputImageDir : Output directory where results are saved
+#
+# Returns: The output directory of the results of the image
+# *****
+def GetOutputImageDir(inBatchInImageFN, inBatchInputImageDir, inBatchOutputImageDir):
+
+    if inBatchInputImageDir is None:
+        return inBatchOutputImageDir
+
+    return os.path.join(inBatchOutputImageDir, os.path.dirname(os.path.relpath(inBatchInImageFN, inBatchInputImageDir)))
+
+
+# *****
+# AtomicOutputFile
+#
+# Description: Context manager yielding a temporary path and file name next to an output file, renamed
+# to the output file once the context ends, or removed on error
+#
+# Parameters:
+#    inImageFN : Path and file name of the output file
+#
+# Returns: The temporary path and file name, hidden, unique to the host, process and thread, and with
+# the extension of the output file for the encoders choosing the format from it
+# *****
+@contextlib.contextmanager
+def AtomicOutputFile(inImageFN):
+
+    imageDir, imageName = os.path.split(inImageFN)
+    imageRoot, imageExt = os.path.splitext(imageName)
+    tempImageFN = os.path.join(imageDir, "." + imageRoot + "." + socket.gethostname() + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp" + imageExt)
+
+    try:
+        yield tempImageFN
+        os.replace(tempImageFN, inImageFN)
+    finally:
+        if os.path.exists(tempImageFN):
+            os.remove(tempImageFN)
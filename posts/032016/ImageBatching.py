@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to apply an effect to many same size images at once (developed with
+# & tested against Python 3.5 and NumPy 1.10.4)
+# Batches
+# For many small images, the per image Python and allocation overhead of the effect dominates.
+# The images of a batch are grouped by shape and each group is stacked into a single N x H x W (x C)
+# array, on which each step of the effect runs once, along the spatial axes only. Batches are
+# sized to a memory budget, counting the decoded images and the buffers of the effect.
+#
+# Usage: Imported by BatchProcessingPIL.py and BatchProcessingOpenCV.py when run with the
+# --sepia-batch-mb option
+# *****
+
+
+
+import collections
+
+
+
+sepiaBatchBytesPerPixel = 8     # Decoded image (3), grey (1), blurred grey (1) and result (3) bytes per pixel
+
+
+
+# *****
+# GroupImagesByShape
+#
+# Description: Groups images of the same shape
+#
+# Parameters:
+#    inImageShapes : List of the shapes (or sizes and modes) of the images
+#
+# Returns: List of the lists of indices of the images of each shape, in order of first appearance
+# *****
+def GroupImagesByShape(inImageShapes):
+
+    shapeGroups = collections.OrderedDict()
+
+    for imageIndex, imageShape in enumerate(inImageShapes):
+        shapeGroups.setdefault(imageShape, []).append(imageIndex)
+
+    return list(shapeGroups.values())
+
+
+# *****
+# StackImages
+#
+# Description: Stacks arrays of the same shape into a single array, reusing a buffer
+#
+# Parameters:
+#    inImageArrays : List of NumPy arrays of the same shape and type
+#    inStackBuffer : Uninitialized array of shape N x image shape for the result
+#
+# Returns: The stacked array, the buffer
+# *****
+def StackImages(inImageArrays, inStackBuffer):
+
+    for imageIndex, imageArray in enumerate(inImageArrays):
+        inStackBuffer[imageIndex] = imageArray
+
+    return inStackBuffer
+
+
+# *****
+# GetBatchBytes
+#
+# Description: Memory used by the batched sepia tone effect of an image
+#
+# Parameters:
+#    inImageWidth : Width of the image
+#    inImageHeight : Height of the image
+#
+# Returns: Number of bytes
+# *****
+def GetBatchBytes(inImageWidth, inImageHeight):
+
+    return inImageWidth * inImageHeight * sepiaBatchBytesPerPixel
+
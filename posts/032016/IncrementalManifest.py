@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to skip the images whose results are already up to date when a batch
+# is processed again (developed with & tested against Python 3.5)
+# Manifest
+# A JSON manifest kept in the output directory records, for each input image, its size, modification
+# time and content hash (SHA-256), and for each content hash and set of processing parameters, the
+# results that were saved. An image is:
+#    skipped : when it was already processed with the same content and parameters and its results exist
+#    copied : when an image with identical content was processed with the same parameters under another
+#             name, and that image has not changed since, its results are copied instead of being
+#             encoded again
+#    processed : otherwise
+# The content hash is only computed again when the size or modification time of an image changes,
+# unless a full check is requested.
+#
+# Usage: Imported by BatchProcessingDriver.py when run with the --incremental option
+# *****
+
+
+
+import os
+import json
+import shutil
+import hashlib
+import collections
+
+
+
+manifestFileName = ".batch_manifest.json"     # File name of the manifest within the output directory
+manifestVersion = 1
+hashChunkSize = 1024 * 1024                    # Bytes read at a time when hashing an image
+
+# Images to process, to copy (with the key of the results they are copied from) and to skip
+IncrementalPlan = collections.namedtuple("IncrementalPlan", ["processImageFNs", "copyImageFNs", "skipImageFNs", "resultKeys"])
+
+
+
+# *****
+# LoadManifest
+#
+# Description: Loads a manifest, an empty manifest is returned if the file does not exist
+#
+# Parameters:
+#    inManifestFN : Path and file name of the manifest
+#
+# Returns: The manifest as a dictionary
+# *****
+def LoadManifest(inManifestFN):
+
+    if os.path.exists(inManifestFN):
+        with open(inManifestFN) as manifestFile:
+            manifest = json.load(manifestFile)
+        if manifest.get("version") == manifestVersion:
+            return manifest
+
+    return {"version": manifestVersion, "files": {}, "results": {}, "processed": {}}
+
+
+# *****
+# SaveManifest
+#
+# Description: Saves a manifest, written to a temporary file then renamed so it is never left partial
+#
+# Parameters:
+#    inManifest : The manifest as a dictionary
+#    inManifestFN : Path and file name of the manifest
+# *****
+def SaveManifest(inManifest, inManifestFN):
+
+    with open(inManifestFN + ".tmp", "w") as manifestFile:
+        json.dump(inManifest, manifestFile, sort_keys=True)
+
+    os.replace(inManifestFN + ".tmp", inManifestFN)
+
+
+# *****
+# GetProcessingParamsKey
+#
+# Description: Key identifying a set of processing parameters
+#
+# Parameters:
+#    inProcessingParams : Dictionary of the parameters the results depend on (backend, resize
+#                         percentages, sepia color, blur...), with JSON serializable values
+#
+# Returns: The key as a hexadecimal string
+# *****
+def GetProcessingParamsKey(inProcessingParams):
+
+    return hashlib.sha256(json.dumps(inProcessingParams, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# *****
+# HashImageFile
+#
+# Description: SHA-256 hash of the content of an image file
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#
+# Returns: The hash as a hexadecimal string
+# *****
+def HashImageFile(inImageFN):
+
+    contentHash = hashlib.sha256()
+
+    with open(inImageFN, "rb") as imageFile:
+        for hashChunk in iter(lambda: imageFile.read(hashChunkSize), b""):
+            contentHash.update(hashChunk)
+
+    return contentHash.hexdigest()
+
+
+# *****
+# GetImageHash
+#
+# Description: Content hash of an image, reusing the hash of the manifest if its size and modification
+# time have not changed
+#
+# Parameters:
+#    inManifest : The manifest as a dictionary, updated with the image
+#    inImageFN : Path and file name of the image
+#    inFastCheck : Reuse the hash of the manifest when the size and modification time match
+#
+# Returns: The hash as a hexadecimal string
+# *****
+def GetImageHash(inManifest, inImageFN, inFastCheck=True):
+
+    imageStat = os.stat(inImageFN)
+    fileRecord = inManifest["files"].get(inImageFN)
+
+    if inFastCheck and fileRecord and fileRecord["size"] == imageStat.st_size and fileRecord["mtime"] == imageStat.st_mtime:
+        return fileRecord["hash"]
+
+    imageHash = HashImageFile(inImageFN)
+    inManifest["files"][inImageFN] = {"size": imageStat.st_size, "mtime": imageStat.st_mtime, "hash": imageHash}
+
+    return imageHash
+
+
+# *****
+# PlanIncrementalRun
+#
+# Description: Decides which images are to be processed, copied from identical images or skipped
+#
+# Parameters:
+#    inManifest : The manifest as a dictionary
+#    inImageFNs : Iterable of paths and file names of the images of the batch
+#    inParamsKey : Key of the processing parameters, from GetProcessingParamsKey
+#    inOutputImageFNsFunc : Function returning the list of output paths and file names of an image
+#    inFastCheck : Reuse the hashes of the manifest when sizes and modification times match
+#
+# Returns: IncrementalPlan
+# *****
+def PlanIncrementalRun(inManifest, inImageFNs, inParamsKey, inOutputImageFNsFunc, inFastCheck=True):
+
+    processImageFNs = []
+    copyImageFNs = []
+    skipImageFNs = []
+    resultKeys = collections.OrderedDict()
+    resultKeysToProcess = set()
+
+    # Every key is known before deciding, the results of an image changed in this run are not copied
+    for imageFN in inImageFNs:
+        resultKeys[imageFN] = GetImageHash(inManifest, imageFN, inFastCheck) + ":" + inParamsKey
+
+    for imageFN, resultKey in resultKeys.items():
+
+        if inManifest["processed"].get(imageFN) == resultKey and all(os.path.exists(outputFN) for outputFN in inOutputImageFNsFunc(imageFN)):
+            skipImageFNs.append(imageFN)
+        elif resultKey in resultKeysToProcess:
+            copyImageFNs.append(imageFN)    # Identical to an image processed in this run
+        elif IsResultRecordCurrent(inManifest, resultKey, resultKeys):
+            copyImageFNs.append(imageFN)    # Identical to an image processed in an earlier run
+        else:
+            processImageFNs.append(imageFN)
+            resultKeysToProcess.add(resultKey)
+
+    return IncrementalPlan(processImageFNs, copyImageFNs, skipImageFNs, resultKeys)
+
+
+# *****
+# IsResultRecordCurrent
+#
+# Description: Tells whether the results recorded for a key can be copied, those of an image that was
+# processed again since, or that changes in this run, hold the results of another content
+#
+# Parameters:
+#    inManifest : The manifest as a dictionary
+#    inResultKey : Key of the results
+#    inResultKeys : Dictionary of the keys of the images of this run, keyed by path and file name
+#
+# Returns: True if the results exist and are still those of the key
+# *****
+def IsResultRecordCurrent(inManifest, inResultKey, inResultKeys):
+
+    resultRecord = inManifest["results"].get(inResultKey)
+    if not resultRecord:
+        return False
+
+    sourceImageFN = resultRecord["imageFN"]
+
+    return (inManifest["processed"].get(sourceImageFN) == inResultKey and inResultKeys.get(sourceImageFN, inResultKey) == inResultKey
+            and all(os.path.exists(outputFN) for outputFN in resultRecord["outputFNs"]))
+
+
+# *****
+# CompleteIncrementalRun
+#
+# Description: Records the processed images in the manifest, then copies the results of identical images
+#
+# Parameters:
+#    inManifest : The manifest as a dictionary, updated
+#    inIncrementalPlan : IncrementalPlan returned by PlanIncrementalRun
+#    inFailedImageFNs : Paths and file names of the images that could not be processed
+#    inOutputImageFNsFunc : Function returning the list of output paths and file names of an image
+#
+# Returns: List of (path and file name, error) for the images whose results could not be copied
+# *****
+def CompleteIncrementalRun(inManifest, inIncrementalPlan, inFailedImageFNs, inOutputImageFNsFunc):
+
+    failedImageFNs = set(inFailedImageFNs)
+    failedCopies = []
+
+    for imageFN in inIncrementalPlan.processImageFNs:
+
+        if imageFN in failedImageFNs:
+
+            # Some of its results may have been saved, they are no longer those of the recorded key
+            inManifest["processed"].pop(imageFN, None)
+
+        else:
+
+            resultKey = inIncrementalPlan.resultKeys[imageFN]
+            inManifest["results"][resultKey] = {"imageFN": imageFN, "outputFNs": inOutputImageFNsFunc(imageFN)}
+            inManifest["processed"][imageFN] = resultKey
+
+    for imageFN in inIncrementalPlan.copyImageFNs:
+
+        resultKey = inIncrementalPlan.resultKeys[imageFN]
+        resultRecord = inManifest["results"].get(resultKey)
+
+        # The record of an identical image that failed in this run may be that of older results
+        if resultRecord is None or inManifest["processed"].get(resultRecord["imageFN"]) != resultKey:
+            failedCopies.append((imageFN, "Identical image could not be processed"))
+            continue
+
+        try:
+            for sourceFN, outputFN in zip(resultRecord["outputFNs"], inOutputImageFNsFunc(imageFN)):
+                if sourceFN != outputFN:
+                    shutil.copyfile(sourceFN, outputFN)
+            inManifest["processed"][imageFN] = resultKey
+        except (IOError, OSError) as err:
+            failedCopies.append((imageFN, type(err).__name__ + ": " + str(err)))
+
+    return failedCopies
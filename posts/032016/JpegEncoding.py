@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to control the jpg encoding of the results: quality, progressive scans,
+# optimized Huffman tables and chroma subsampling (developed with & tested against Python 3.5 and
+# NumPy 1.10.4)
+# Quality
+# The quality can be set for all results, and lowered for the smaller ones by width thresholds, as
+# small thumbnails are viewed at their pixel size where artifacts are less visible than in large ones.
+# Search
+# Rather than a fixed quality, the lowest quality whose result keeps a target SSIM against the image
+# to encode, and/or the highest quality whose result fits a byte budget, is searched by bisection
+# between a minimum quality and the set quality. The SSIM is estimated on the luma of both images,
+# downscaled by block averaging as the reference implementation of the SSIM does for large images,
+# and the bisection stops early once an encoding is within a tolerance of the target. Each encoding of the search is kept, the chosen one is written without encoding again.
+#
+# Usage: Imported by BatchProcessingDriver.py, which adds the --jpeg-* options, and by the backends
+# when encoding the results
+# *****
+
+
+
+import argparse
+import collections
+import numpy as np
+from FastGaussianBlur import BoxFilterAxis
+
+
+
+jpegSubsamplings = ("444", "422", "420")   # Chroma subsampling, none, horizontal, horizontal and vertical
+
+jpegSearchQualities = (30, 95)      # Default quality range of the search
+ssimDownsampleSide = 256            # The luma is downscaled by its shorter side over this, rounded, as by the reference SSIM
+ssimWindowSize = 7                  # Width of the uniform window of the SSIM
+ssimTolerance = 0.002               # The search stops at an encoding within this SSIM above the target
+byteBudgetTolerance = 0.02          # The search stops at an encoding within this fraction below the byte budget
+
+# Jpg encoding settings of the results, None fields keep the default of the backend
+JpegSettings = collections.namedtuple("JpegSettings", ["quality", "qualityByWidth", "progressive", "optimize", "subsampling", "targetSSIM", "maxBytes", "minQuality"])
+
+
+
+# *****
+# ParseQualityByWidth
+#
+# Description: Parses a width threshold of the quality, for argparse
+#
+# Parameters:
+#    inArgument : String MAXWIDTH:QUALITY
+#
+# Returns: Tuple (maximum width, quality)
+# *****
+def ParseQualityByWidth(inArgument):
+
+    try:
+        maxWidth, quality = (int(value) for value in inArgument.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected MAXWIDTH:QUALITY, got " + inArgument)
+
+    return (maxWidth, quality)
+
+
+# *****
+# AddJpegArguments
+#
+# Description: Adds the options of the jpg encoding to a command line parser
+#
+# Parameters:
+#    inParser : argparse.ArgumentParser
+# *****
+def AddJpegArguments(inParser):
+
+    inParser.add_argument("--jpeg-quality", type=int, help="Jpg quality of the results, the highest quality searched with --jpeg-target-ssim or --jpeg-max-kb (default: the backend's)")
+    inParser.add_argument("--jpeg-quality-by-width", type=ParseQualityByWidth, nargs="+", default=[], metavar="MAXWIDTH:QUALITY", help="Jpg quality of the results up to a width, replacing --jpeg-quality for them")
+    inParser.add_argument("--jpeg-progressive", action="store_true", help="Encode progressive jpgs")
+    inParser.add_argument("--jpeg-optimize", action="store_true", help="Encode jpgs with optimized Huffman tables")
+    inParser.add_argument("--jpeg-subsampling", choices=jpegSubsamplings, help="Chroma subsampling of the jpgs (default: the backend's)")
+    inParser.add_argument("--jpeg-target-ssim", type=float, help="Search the lowest jpg quality keeping this SSIM against the image, e.g. 0.95")
+    inParser.add_argument("--jpeg-max-kb", type=int, help="Search the highest jpg quality fitting in this many KB")
+    inParser.add_argument("--jpeg-min-quality", type=int, default=jpegSearchQualities[0], help="Lowest jpg quality searched (default: " + str(jpegSearchQualities[0]) + ")")
+
+
+# *****
+# GetJpegSettings
+#
+# Description: Jpg encoding settings set by the command line options
+#
+# Parameters:
+#    inArgs : Parsed command line options, see AddJpegArguments
+#
+# Returns: JpegSettings, None if no option is set and the results are saved as before
+# *****
+def GetJpegSettings(inArgs):
+
+    jpegSettings = JpegSettings(inArgs.jpeg_quality, tuple(sorted(inArgs.jpeg_quality_by_width)), inArgs.jpeg_progressive, inArgs.jpeg_optimize, inArgs.jpeg_subsampling, inArgs.jpeg_target_ssim, inArgs.jpeg_max_kb * 1024 if inArgs.jpeg_max_kb else None, inArgs.jpeg_min_quality)
+
+    if jpegSettings._replace(minQuality=None) == JpegSettings(None, (), False, False, None, None, None, None):
+        return None
+
+    return jpegSettings
+
+
+# *****
+# GetJpegQuality
+#
+# Description: Quality of the result of a width, the first width threshold it is within or the set quality
+#
+# Parameters:
+#    inJpegSettings : JpegSettings
+#    inImageWidth : Width of the result
+#
+# Returns: Quality, None for the default of the backend
+# *****
+def GetJpegQuality(inJpegSettings, inImageWidth):
+
+    for maxWidth, quality in inJpegSettings.qualityByWidth:
+        if inImageWidth <= maxWidth:
+            return quality
+
+    return inJpegSettings.quality
+
+
+# *****
+# DownscaleGrey
+#
+# Description: Downscales a greyscale image by averaging blocks, of the shorter side over a size, rounded
+#
+# Parameters:
+#    inGreyArray : 2D array of the greyscale image
+#    inDownsampleSide : Shorter side at which the image is not downscaled
+#
+# Returns: float32 array of the downscaled image
+# *****
+def DownscaleGrey(inGreyArray, inDownsampleSide=ssimDownsampleSide):
+
+    imgHeight, imgWidth = inGreyArray.shape
+    blockSize = max(1, int(round(min(imgHeight, imgWidth) / float(inDownsampleSide))))
+
+    # Drop the last rows and columns not filling a block
+    blockRows = inGreyArray[:imgHeight // blockSize * blockSize, :imgWidth // blockSize * blockSize].astype(np.float32)
+
+    return blockRows.reshape(imgHeight // blockSize, blockSize, imgWidth // blockSize, blockSize).mean(axis=(1, 3), dtype=np.float32)
+
+
+# *****
+# ComputeSSIM
+#
+# Description: Mean structural similarity of two greyscale images of the same size, over uniform windows
+#
+# Parameters:
+#    inGreyArrayX : float32 array of the first image
+#    inGreyArrayY : float32 array of the second image
+#
+# Returns: The mean SSIM, 1 for identical images
+# *****
+def ComputeSSIM(inGreyArrayX, inGreyArrayY):
+
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    def WindowMean(inArray):
+        for windowAxis in (0, 1):
+            BoxFilterAxis(inArray, ssimWindowSize, windowAxis)
+        return inArray
+
+    meanX = WindowMean(inGreyArrayX.copy())
+    meanY = WindowMean(inGreyArrayY.copy())
+    varianceX = WindowMean(inGreyArrayX * inGreyArrayX) - meanX * meanX
+    varianceY = WindowMean(inGreyArrayY * inGreyArrayY) - meanY * meanY
+    covarianceXY = WindowMean(inGreyArrayX * inGreyArrayY) - meanX * meanY
+
+    ssimArray = ((2 * meanX * meanY + c1) * (2 * covarianceXY + c2)) / ((meanX * meanX + meanY * meanY + c1) * (varianceX + varianceY + c2))
+
+    return float(ssimArray.mean())
+
+
+# *****
+# SearchJpegQuality
+#
+# Description: Searches the jpg quality of an image by bisection, for a target SSIM and/or a byte budget
+#
+# Parameters:
+#    inEncodeFunc : Function encoding the image as jpg, given the quality, returning the bytes
+#    inDecodeGreyFunc : Function decoding jpg bytes to a 2D uint8 array of the luma
+#    inReferenceGrey : 2D array of the luma of the image
+#    inTargetSSIM : Lowest SSIM kept, None for none
+#    inMaxBytes : Byte budget, None for none
+#    inMinQuality : Lowest quality searched
+#    inMaxQuality : Highest quality searched
+#
+# Returns: Tuple (quality, jpg bytes), the lowest quality keeping the target SSIM, the highest if none
+# does, lowered to the highest quality fitting the budget, the lowest if none does
+# *****
+def SearchJpegQuality(inEncodeFunc, inDecodeGreyFunc, inReferenceGrey, inTargetSSIM=None, inMaxBytes=None, inMinQuality=jpegSearchQualities[0], inMaxQuality=jpegSearchQualities[1]):
+
+    encodings = {}
+
+    def Encode(inQuality):
+        if inQuality not in encodings:
+            encodings[inQuality] = inEncodeFunc(inQuality)
+        return encodings[inQuality]
+
+    lowQuality = min(inMinQuality, inMaxQuality)
+    highQuality = inMaxQuality
+
+    if inTargetSSIM is not None:
+
+        referenceGrey = DownscaleGrey(inReferenceGrey)
+
+        while lowQuality < highQuality:
+
+            midQuality = (lowQuality + highQuality) // 2
+            encodedSSIM = ComputeSSIM(referenceGrey, DownscaleGrey(inDecodeGreyFunc(Encode(midQuality))))
+
+            if encodedSSIM >= inTargetSSIM:
+                highQuality = midQuality
+                if encodedSSIM - inTargetSSIM <= ssimTolerance:
+                    break
+            else:
+                lowQuality = midQuality + 1
+
+    quality = highQuality
+
+    if inMaxBytes is not None and len(Encode(quality)) > inMaxBytes:
+
+        lowQuality = min(inMinQuality, quality)
+        highQuality = quality - 1
+
+        while lowQuality < highQuality:
+
+            midQuality = (lowQuality + highQuality + 1) // 2
+            encodedBytes = len(Encode(midQuality))
+
+            if encodedBytes <= inMaxBytes:
+                lowQuality = midQuality
+                if inMaxBytes - encodedBytes <= inMaxBytes * byteBudgetTolerance:
+                    break
+            else:
+                highQuality = midQuality - 1
+
+        quality = lowQuality
+
+    return (quality, Encode(quality))
+
+
+# *****
+# EncodeJpeg
+#
+# Description: Encodes a result as jpg with the quality of its width, or the searched quality
+#
+# Parameters:
+#    inImage : Image of the backend
+#    inImageWidth : Width of the image
+#    inJpegSettings : JpegSettings
+#    inEncodeJpegFunc : Function of the backend encoding an image, given the image, the quality (None
+#                       for the default) and the JpegSettings, returning the jpg bytes
+#    inImageGreyFunc : Function of the backend returning the luma of an image as a 2D uint8 array
+#    inDecodeJpegGreyFunc : Function of the backend decoding jpg bytes to a 2D uint8 array of the luma
+#
+# Returns: Tuple (quality, jpg bytes)
+# *****
+def EncodeJpeg(inImage, inImageWidth, inJpegSettings, inEncodeJpegFunc, inImageGreyFunc, inDecodeJpegGreyFunc):
+
+    quality = GetJpegQuality(inJpegSettings, inImageWidth)
+
+    if inJpegSettings.targetSSIM is None and inJpegSettings.maxBytes is None:
+        return (quality, inEncodeJpegFunc(inImage, quality, inJpegSettings))
+
+    encodeFunc = lambda inQuality: inEncodeJpegFunc(inImage, inQuality, inJpegSettings)
+    referenceGrey = inImageGreyFunc(inImage) if inJpegSettings.targetSSIM is not None else None
+
+    return SearchJpegQuality(encodeFunc, inDecodeJpegGreyFunc, referenceGrey, inJpegSettings.targetSSIM, inJpegSettings.maxBytes, inJpegSettings.minQuality, quality or jpegSearchQualities[1])
+
+
+# *****
+# WriteJpegFile
+#
+# Description: Writes encoded jpg bytes to a file
+#
+# Parameters:
+#    inJpegBytes : The jpg bytes
+#    inImageFN : Path and file name of the file
+# *****
+def WriteJpegFile(inJpegBytes, inImageFN):
+
+    with open(inImageFN, "wb") as imageFile:
+        imageFile.write(inJpegBytes)
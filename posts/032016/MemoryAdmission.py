@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to bound the memory used by images processed at the same time
+# (developed with & tested against Python 3.5)
+# Estimate
+# The peak working set of an image is estimated from the size read in its jpg header, or in its
+# header read by PIL for the other formats, without decoding it: the decoded image, its resized
+# versions and the buffers of the effect, each scaled by the pixel count, plus the temporaries of the
+# blend kernel and, for multi-frame images, the frame composed so far.
+# Admission
+# Images (or chunks of images) are only started while the estimates of those in flight fit in a
+# memory budget, one is always started when none is in flight. The images are ordered largest
+# first, so the huge images do not end up last, running alone and holding up the end of the batch.
+#
+# Usage: Imported by BatchProcessingDriver.py when run with the --memory-budget-mb option
+# *****
+
+
+
+import threading
+from MultiScaleResize import ReadJpegSize
+
+
+
+decodedBytesPerPixel = 3    # Bytes per pixel of a decoded RGB image
+multiFrameHeldFrames = 2    # Frames of a multi-frame image held at once, the frame composed so far and the one decoded
+
+
+
+# *****
+# ReadImageSize
+#
+# Description: Reads the size of an image from its jpg header, or from its header read by PIL for the
+# other formats, without decoding it
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#
+# Returns: Tuple of the width, height and number of frames of the image, None if they cannot be read
+# *****
+def ReadImageSize(inImageFN):
+
+    try:
+        imageSize = ReadJpegSize(inImageFN)
+    except (IOError, OSError):
+        return None
+
+    if imageSize is not None:
+        return imageSize + (1,)
+
+    # PIL is only imported for the images that are not jpg, as ImageMagick does not need it
+    from PIL import Image
+
+    try:
+        with Image.open(inImageFN) as img:
+            return (img.width, img.height, getattr(img, "n_frames", 1))
+    except (IOError, OSError, SyntaxError, ValueError):
+        return None
+
+
+# *****
+# EstimateImageBytes
+#
+# Description: Estimates the peak memory used to process an image from its header
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#    inResizePercentages : Percentages by which the image is resized
+#    inEffectBytesPerPixel : Bytes per pixel of the image used by the buffers of the effect
+#    inDecodedBytesPerPixel : Bytes per pixel of the decoded and resized images
+#    inBlendBytesFunc : Optional function estimating the memory of the temporaries of the blend of the
+#                       effect, given the width and height of the image, see SoftLightKernel.GetSoftLightBlendBytes
+#
+# Returns: Number of bytes, 0 if the size of the image cannot be read
+# *****
+def EstimateImageBytes(inImageFN, inResizePercentages, inEffectBytesPerPixel, inDecodedBytesPerPixel=decodedBytesPerPixel, inBlendBytesFunc=None):
+
+    imageSize = ReadImageSize(inImageFN)
+
+    # Processing reports the error of an unreadable image
+    if imageSize is None:
+        return 0
+
+    imgWidth, imgHeight, imgFrames = imageSize
+    resizedPixels = sum(int(imgWidth * resizePercentage / 100) * int(imgHeight * resizePercentage / 100) for resizePercentage in inResizePercentages)
+
+    imageBytes = imgWidth * imgHeight * (inDecodedBytesPerPixel + inEffectBytesPerPixel) + resizedPixels * inDecodedBytesPerPixel
+
+    if inBlendBytesFunc is not None:
+        imageBytes += inBlendBytesFunc(imgWidth, imgHeight)
+
+    # The frames of a multi-frame image are processed one at a time, over the frame composed so far
+    return imageBytes + (min(imgFrames, multiFrameHeldFrames) - 1) * imgWidth * imgHeight * inDecodedBytesPerPixel
+
+
+# *****
+# OrderImagesLargestFirst
+#
+# Description: Estimates the memory of each image and orders the images by decreasing estimate
+#
+# Parameters:
+#    inImageFNs : Iterable of paths and file names of the images, read to the end
+#    inEstimateImageBytesFunc : Function returning the estimate of an image, given its path and file name
+#
+# Returns: Tuple of the ordered list of paths and file names and the dictionary of the estimates
+# keyed by path and file name
+# *****
+def OrderImagesLargestFirst(inImageFNs, inEstimateImageBytesFunc):
+
+    imageBytes = dict((imageFN, inEstimateImageBytesFunc(imageFN)) for imageFN in inImageFNs)
+
+    # Stable, images of the same estimate keep the scan order
+    return (sorted(imageBytes, key=lambda imageFN: -imageBytes[imageFN]), imageBytes)
+
+
+# *****
+# MemoryAdmission
+#
+# Description: Admits work while the memory estimates of the work in flight fit in a budget
+# *****
+class MemoryAdmission(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inBudgetBytes : Memory budget in bytes
+    #    inImageBytes : Dictionary of the estimates of the images keyed by path and file name
+    # *****
+    def __init__(self, inBudgetBytes, inImageBytes):
+
+        self.budgetBytes = inBudgetBytes
+        self.imageBytes = inImageBytes
+        self.admittedBytes = 0
+        self.admittedCount = 0
+        self.admissionCondition = threading.Condition()
+
+    # *****
+    # GetImagesBytes
+    #
+    # Description: Estimate of images processed one after the other, or all held at once
+    #
+    # Parameters:
+    #    inImageFNs : Paths and file names of the images
+    #    inHeldAtOnce : The images are all held in memory at the same time
+    #
+    # Returns: Number of bytes
+    # *****
+    def GetImagesBytes(self, inImageFNs, inHeldAtOnce=False):
+
+        imagesBytes = [self.imageBytes.get(imageFN, 0) for imageFN in inImageFNs]
+
+        if inHeldAtOnce:
+            return sum(imagesBytes)
+
+        return max(imagesBytes) if imagesBytes else 0
+
+    # *****
+    # TryAdmit
+    #
+    # Description: Admits work if it fits in the budget, or if no work is in flight
+    #
+    # Parameters:
+    #    inBytes : Estimate of the work
+    #
+    # Returns: True if the work was admitted, to be released with Release
+    # *****
+    def TryAdmit(self, inBytes):
+
+        with self.admissionCondition:
+
+            if self.admittedCount and self.admittedBytes + inBytes > self.budgetBytes:
+                return False
+
+            self.admittedBytes += inBytes
+            self.admittedCount += 1
+
+            return True
+
+    # *****
+    # Admit
+    #
+    # Description: Waits until work fits in the budget, or until no work is in flight, and admits it
+    #
+    # Parameters:
+    #    inBytes : Estimate of the work, to be released with Release
+    # *****
+    def Admit(self, inBytes):
+
+        with self.admissionCondition:
+
+            while self.admittedCount and self.admittedBytes + inBytes > self.budgetBytes:
+                self.admissionCondition.wait()
+
+            self.admittedBytes += inBytes
+            self.admittedCount += 1
+
+    # *****
+    # Release
+    #
+    # Description: Releases admitted work once its memory is freed
+    #
+    # Parameters:
+    #    inBytes : Estimate the work was admitted with
+    # *****
+    def Release(self, inBytes):
+
+        with self.admissionCondition:
+
+            self.admittedBytes -= inBytes
+            self.admittedCount -= 1
+            self.admissionCondition.notify_all()
@@ -0,0 +1,592 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to process multi-page tif and animated gif and webp images frame by
+# frame, into results of the same format (developed with & tested against Python 3.5 and Pillow 3.1)
+# Frames
+# The frames of an image are decoded one at a time with PIL, whichever script processes them, each
+# composed over the previous ones as the image is played. A frame is processed as a still image of
+# the script, by its function computing the resized and sepia toned results, and each result is
+# encoded as a single frame image.
+# Parallel
+# With more than one worker process, the frames are processed across a pool of worker processes,
+# with a bounded number of frames in flight, and their results collected in frame order.
+# Muxing
+# The encoded frames of each result are appended to its file as they are collected, with the
+# duration, loop count and transparency of the input frames: gif frames keep their own color table,
+# the frames of the resized results being mapped to the palette of the input image, webp frames
+# are wrapped in ANMF chunks, and tif pages are linked by PIL's AppendingTiffWriter. Neither the
+# frames nor the results of an image are held in memory, whatever its number of frames.
+#
+# Usage: Imported by BatchProcessingDriver.py when run with the --multi-frame option
+# *****
+
+
+
+import io
+import os
+import struct
+import collections
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageSequence
+from PIL.TiffImagePlugin import AppendingTiffWriter
+from DirectoryScanner import AtomicOutputFile
+from StageTimer import EnableInstrumentation, GetInstrumentationSettings, SetCurrentImage, TimeStage, TakeStageTimes, AddStageTimes
+
+
+
+multiFrameFormats = {".gif": "GIF", ".webp": "WEBP", ".tif": "TIFF", ".tiff": "TIFF"}
+multiFrameExtensions = tuple(sorted(multiFrameFormats))    # Extensions of the multi-frame images, in lower case
+
+webpFrameQuality = 80           # Quality of the lossy webp frames
+tiffFrameCompressions = ("raw", "packbits", "tiff_lzw", "tiff_adobe_deflate")  # Compressions of the input pages kept, others written with tiff_lzw
+framesInFlightPerWorker = 2     # Frames submitted to each worker process ahead of the one collected
+
+
+
+# *****
+# IsMultiFrameImage
+#
+# Description: Tells whether an image is processed frame by frame, from its file name extension
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#
+# Returns: True for the extensions of multiFrameExtensions
+# *****
+def IsMultiFrameImage(inImageFN):
+
+    return os.path.splitext(inImageFN)[1].lower() in multiFrameFormats
+
+
+# *****
+# GetOutputImageExt
+#
+# Description: File name extension of the results of an image
+#
+# Parameters:
+#    inImageFN : Path and file name of the input image
+#
+# Returns: The extension of a multi-frame image in lower case, .jpg for the other images
+# *****
+def GetOutputImageExt(inImageFN):
+
+    imageExt = os.path.splitext(inImageFN)[1].lower()
+
+    return imageExt if imageExt in multiFrameFormats else ".jpg"
+
+
+# *****
+# SetAsideMultiFrameImages
+#
+# Description: Passes the still images on, setting the multi-frame images aside
+#
+# Parameters:
+#    inImageFNs : Iterable of paths and file names of images, consumed lazily
+#    inMultiFrameImageFNs : List to which the multi-frame images are appended
+#
+# Returns: Generator of the paths and file names of the other images
+# *****
+def SetAsideMultiFrameImages(inImageFNs, inMultiFrameImageFNs):
+
+    for imageFN in inImageFNs:
+
+        if IsMultiFrameImage(imageFN):
+            inMultiFrameImageFNs.append(imageFN)
+        else:
+            yield imageFN
+
+
+# *****
+# ReadImageFrames
+#
+# Description: Decodes the frames of an image one at a time
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#    inChannelOrder : Order of the color channels of the frames, "RGB" or "BGR"
+#
+# Returns: Generator of (uint8 array of the color pixels, uint8 array of the alpha values or None
+# if the frame is opaque, dictionary of the duration, loop, background, palette, compression and
+# dpi of the frame) for each frame, in order
+# *****
+def ReadImageFrames(inImageFN, inChannelOrder="RGB"):
+
+    with Image.open(inImageFN) as img:
+
+        # Palette of the image, as following gif frames are decoded to RGB once composed
+        imagePalette = img.getpalette() if img.mode == "P" else None
+
+        for frameImg in ImageSequence.Iterator(img):
+
+            with TimeStage("decode") as stageRecord:
+
+                frameAlpha = frameImg.mode in ("RGBA", "LA", "PA") or "transparency" in frameImg.info
+                frameArray = np.asarray(frameImg.convert("RGBA" if frameAlpha else "RGB"))
+
+                stageRecord["pixels"] = frameImg.width * frameImg.height
+
+            # The frame information is read once the frame is loaded
+            frameInfo = {
+                "duration": frameImg.info.get("duration", 0),
+                "loop": frameImg.info.get("loop"),
+                "background": frameImg.info.get("background"),
+                "palette": imagePalette,
+                "compression": frameImg.info.get("compression"),
+                "dpi": frameImg.info.get("dpi"),
+            }
+
+            colorArray = frameArray[:, :, 2::-1] if inChannelOrder == "BGR" else frameArray[:, :, :3]
+
+            yield (np.ascontiguousarray(colorArray), frameArray[:, :, 3].copy() if frameAlpha else None, frameInfo)
+
+
+# *****
+# EncodeFrame
+#
+# Description: Encodes a result frame as a single frame image
+#
+# Parameters:
+#    inImage : RGB PIL image of the result frame
+#    inAlphaArray : uint8 array of the alpha values of the input frame, None if opaque
+#    inImageFormat : PIL format of the image, one of the values of multiFrameFormats
+#    inFrameInfo : Dictionary of the frame information, see ReadImageFrames
+#    inFrameSize : (width, height) of the input frame
+#
+# Returns: The encoded bytes
+# *****
+def EncodeFrame(inImage, inAlphaArray, inImageFormat, inFrameInfo, inFrameSize):
+
+    alphaImg = None
+    if inAlphaArray is not None:
+        alphaImg = Image.fromarray(inAlphaArray)
+        if alphaImg.size != inImage.size:
+            alphaImg = alphaImg.resize(inImage.size, Image.LANCZOS)
+
+    frameFile = io.BytesIO()
+
+    if inImageFormat == "GIF":
+
+        if alphaImg is not None:
+            # One color less, the last index is transparent
+            frameImg = inImage.quantize(255)
+            frameImg.paste(255, mask=alphaImg.point(lambda alphaValue: 255 if alphaValue < 128 else 0))
+            frameImg.save(frameFile, "GIF", transparency=255)
+        elif inFrameInfo["palette"] is not None and inImage.size != inFrameSize:
+            # Resized frames keep the colors of the input, effects of the size of the input need their own
+            paletteImg = Image.new("P", (1, 1))
+            paletteImg.putpalette(inFrameInfo["palette"])
+            inImage.quantize(palette=paletteImg, dither=Image.NONE).save(frameFile, "GIF")
+        else:
+            inImage.quantize(256).save(frameFile, "GIF")
+
+    else:
+
+        frameImg = inImage
+        if alphaImg is not None:
+            frameImg = inImage.copy()
+            frameImg.putalpha(alphaImg)
+
+        if inImageFormat == "WEBP":
+            frameImg.save(frameFile, "WEBP", quality=webpFrameQuality)
+        else:
+            saveOptions = {"compression": inFrameInfo["compression"] if inFrameInfo["compression"] in tiffFrameCompressions else "tiff_lzw"}
+            if inFrameInfo["dpi"]:
+                # Resized pages keep the printed size of the input
+                saveOptions["dpi"] = tuple(float(dpiValue) * inImage.width / inFrameSize[0] for dpiValue in inFrameInfo["dpi"])
+            frameImg.save(frameFile, "TIFF", **saveOptions)
+
+    return frameFile.getvalue()
+
+
+# *****
+# ProcessFrame
+#
+# Description: Computes and encodes the results of a frame, within a worker process or not
+#
+# Parameters:
+#    inComputeOutputsFunc : Function computing the (output path and file name, image) of each result,
+#                           given an image and the path and file name of the input image
+#    inFrameToImageFunc : Function wrapping a NumPy array as an image, None if the images are NumPy arrays
+#    inChannelOrder : Order of the color channels of the images of the script, "RGB" or "BGR"
+#    inImageFN : Path and file name of the input image
+#    inImageFormat : PIL format of the image
+#    inFrameArray : uint8 array of the color pixels of the frame
+#    inAlphaArray : uint8 array of the alpha values of the frame, None if opaque
+#    inFrameInfo : Dictionary of the frame information, see ReadImageFrames
+#    inRecordStages : Settings of the timing of the stages of the frame, see GetInstrumentationSettings,
+#                     the stage times returned with the results
+#
+# Returns: Tuple of the list of (output path and file name, encoded bytes, (width, height), alpha)
+# of each result and the stage times, see TakeStageTimes
+# *****
+def ProcessFrame(inComputeOutputsFunc, inFrameToImageFunc, inChannelOrder, inImageFN, inImageFormat, inFrameArray, inAlphaArray, inFrameInfo, inRecordStages=(False, False)):
+
+    EnableInstrumentation(*inRecordStages)
+    SetCurrentImage(inImageFN)
+
+    frameImage = inFrameArray if inFrameToImageFunc is None else inFrameToImageFunc(inFrameArray)
+    frameSize = (inFrameArray.shape[1], inFrameArray.shape[0])
+    frameResults = []
+
+    for outImageFN, imgOut in inComputeOutputsFunc(frameImage, inImageFN):
+
+        if isinstance(imgOut, Image.Image):
+            outImg = imgOut.convert("RGB")
+        else:
+            # NumPy arrays, or images exposing their pixels as arrays (Wand)
+            outArray = np.asarray(imgOut)[:, :, :3]
+            outImg = Image.fromarray(np.ascontiguousarray(outArray[:, :, ::-1] if inChannelOrder == "BGR" else outArray))
+
+        # Images of the scripts that are to be closed by the caller (Wand)
+        if hasattr(imgOut, "close"):
+            imgOut.close()
+
+        with TimeStage("encode", outImg.width * outImg.height) as stageRecord:
+            frameBytes = EncodeFrame(outImg, inAlphaArray, inImageFormat, inFrameInfo, frameSize)
+            stageRecord["bytesWritten"] = len(frameBytes)
+
+        frameResults.append((outImageFN, frameBytes, outImg.size, inAlphaArray is not None))
+
+    return (frameResults, TakeStageTimes())
+
+
+# *****
+# GifFrameWriter
+#
+# Description: Writes an animated gif one frame at a time, from single frame gifs
+# *****
+class GifFrameWriter(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inFile : File opened for writing
+    #    inFrameInfo : Dictionary of the information of the first frame, see ReadImageFrames
+    # *****
+    def __init__(self, inFile, inFrameInfo):
+
+        self.file = inFile
+        self.loop = inFrameInfo["loop"]
+        self.headerWritten = False
+
+    # *****
+    # AddFrame
+    #
+    # Description: Appends a frame, with a local color table
+    #
+    # Parameters:
+    #    inFrameBytes : Single frame gif
+    #    inFrameSize : (width, height) of the frame
+    #    inFrameInfo : Dictionary of the frame information
+    #    inFrameAlpha : The frame is transparent, it then replaces the previous frame rather than being drawn over it
+    # *****
+    def AddFrame(self, inFrameBytes, inFrameSize, inFrameInfo, inFrameAlpha):
+
+        if not self.headerWritten:
+            # Logical screen without a global color table
+            self.file.write(b"GIF89a" + struct.pack("<HHBBB", inFrameSize[0], inFrameSize[1], 0x70, 0, 0))
+            if self.loop is not None:
+                self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00")
+            self.headerWritten = True
+
+        # The global color table of the single frame gif, if any, is its color table
+        colorTableFlags = inFrameBytes[10]
+        blockOffset = 13
+        colorTable = b""
+        if colorTableFlags & 0x80:
+            colorTable = inFrameBytes[blockOffset:blockOffset + 3 * (2 << (colorTableFlags & 0x07))]
+            blockOffset += len(colorTable)
+
+        transparencyIndex = None
+
+        while inFrameBytes[blockOffset] == 0x21:
+
+            # Extensions, keeping the transparent index of the graphic control extension
+            if inFrameBytes[blockOffset + 1] == 0xf9 and inFrameBytes[blockOffset + 3] & 0x01:
+                transparencyIndex = inFrameBytes[blockOffset + 6]
+
+            blockOffset += 2
+            while inFrameBytes[blockOffset]:
+                blockOffset += inFrameBytes[blockOffset] + 1
+            blockOffset += 1
+
+        imageDescriptor = inFrameBytes[blockOffset:blockOffset + 10]
+        imageDataOffset = blockOffset + 10
+        if imageDescriptor[9] & 0x80:
+            colorTable = inFrameBytes[imageDataOffset:imageDataOffset + 3 * (2 << (imageDescriptor[9] & 0x07))]
+            colorTableFlags = imageDescriptor[9]
+            imageDataOffset += len(colorTable)
+
+        # Image data, the LZW minimum code size then data sub-blocks up to the trailer ending the gif
+        imageData = inFrameBytes[imageDataOffset:-1]
+
+        disposalMethod = 2 if inFrameAlpha else 1
+        self.file.write(b"\x21\xf9\x04" + struct.pack("<BHB", (disposalMethod << 2) | (transparencyIndex is not None), int(round(inFrameInfo["duration"] / 10.0)), transparencyIndex or 0) + b"\x00")
+        self.file.write(imageDescriptor[:9] + struct.pack("<B", 0x80 | (imageDescriptor[9] & 0x40) | (colorTableFlags & 0x07)) + colorTable + imageData)
+
+    # *****
+    # Finish
+    #
+    # Description: Ends the gif, once its last frame is added
+    # *****
+    def Finish(self):
+
+        self.file.write(b"\x3b")
+
+
+# *****
+# WebPFrameWriter
+#
+# Description: Writes an animated webp one frame at a time, from single frame webps
+# *****
+class WebPFrameWriter(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inFile : File opened for writing and seeking
+    #    inFrameInfo : Dictionary of the information of the first frame, see ReadImageFrames
+    # *****
+    def __init__(self, inFile, inFrameInfo):
+
+        self.file = inFile
+        self.loop = inFrameInfo["loop"] or 0
+        self.background = inFrameInfo["background"] if isinstance(inFrameInfo["background"], tuple) else (0, 0, 0, 0)
+        self.headerWritten = False
+        self.hasAlpha = False
+
+    # *****
+    # AddFrame
+    #
+    # Description: Appends a frame, in an ANMF chunk replacing the previous frame
+    #
+    # Parameters:
+    #    inFrameBytes : Single frame webp
+    #    inFrameSize : (width, height) of the frame
+    #    inFrameInfo : Dictionary of the frame information
+    #    inFrameAlpha : The frame is transparent
+    # *****
+    def AddFrame(self, inFrameBytes, inFrameSize, inFrameInfo, inFrameAlpha):
+
+        frameWidth, frameHeight = inFrameSize
+
+        if not self.headerWritten:
+            # The RIFF size and the VP8X flags are written once the frames are known
+            self.file.write(b"RIFF\x00\x00\x00\x00WEBP")
+            self.file.write(b"VP8X" + struct.pack("<I", 10) + b"\x00\x00\x00\x00" + struct.pack("<I", frameWidth - 1)[:3] + struct.pack("<I", frameHeight - 1)[:3])
+            backgroundRed, backgroundGreen, backgroundBlue, backgroundAlpha = self.background
+            self.file.write(b"ANIM" + struct.pack("<IBBBBH", 6, backgroundBlue, backgroundGreen, backgroundRed, backgroundAlpha, self.loop))
+            self.headerWritten = True
+
+        self.hasAlpha = self.hasAlpha or inFrameAlpha
+
+        # The alpha and bitstream chunks of the single frame webp, padded to an even size
+        frameChunks = []
+        chunkOffset = 12
+        while chunkOffset < len(inFrameBytes):
+            chunkSize = struct.unpack("<I", inFrameBytes[chunkOffset + 4:chunkOffset + 8])[0]
+            chunkEnd = chunkOffset + 8 + chunkSize + (chunkSize & 1)
+            if inFrameBytes[chunkOffset:chunkOffset + 4] in (b"ALPH", b"VP8 ", b"VP8L"):
+                frameChunks.append(inFrameBytes[chunkOffset:chunkEnd])
+            chunkOffset = chunkEnd
+
+        # Frame at the origin, for its duration, not blended with the previous frame
+        frameHeader = b"\x00" * 6 + struct.pack("<I", frameWidth - 1)[:3] + struct.pack("<I", frameHeight - 1)[:3] + struct.pack("<I", inFrameInfo["duration"])[:3] + b"\x02"
+        frameData = frameHeader + b"".join(frameChunks)
+        self.file.write(b"ANMF" + struct.pack("<I", len(frameData)) + frameData)
+
+    # *****
+    # Finish
+    #
+    # Description: Writes the RIFF size and the VP8X flags, once the last frame is added
+    # *****
+    def Finish(self):
+
+        riffSize = self.file.tell() - 8
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", riffSize))
+        self.file.seek(20)
+        self.file.write(struct.pack("<B", 0x02 | (0x10 if self.hasAlpha else 0)))
+        self.file.seek(0, os.SEEK_END)
+
+
+# *****
+# TiffFrameWriter
+#
+# Description: Writes a multi-page tif one page at a time, from single page tifs
+# *****
+class TiffFrameWriter(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inFile : File opened for reading, writing and seeking
+    #    inFrameInfo : Dictionary of the information of the first frame, see ReadImageFrames
+    # *****
+    def __init__(self, inFile, inFrameInfo):
+
+        self.tiffWriter = AppendingTiffWriter(inFile)
+
+    # *****
+    # AddFrame
+    #
+    # Description: Appends a page, its offsets moved past the previous pages
+    #
+    # Parameters:
+    #    inFrameBytes : Single page tif
+    #    inFrameSize : (width, height) of the page
+    #    inFrameInfo : Dictionary of the page information
+    #    inFrameAlpha : The page is transparent
+    # *****
+    def AddFrame(self, inFrameBytes, inFrameSize, inFrameInfo, inFrameAlpha):
+
+        self.tiffWriter.write(inFrameBytes)
+        self.tiffWriter.newFrame()
+
+    # *****
+    # Finish
+    #
+    # Description: Ends the tif, once its last page is added
+    # *****
+    def Finish(self):
+
+        pass
+
+
+frameWriterClasses = {"GIF": GifFrameWriter, "WEBP": WebPFrameWriter, "TIFF": TiffFrameWriter}
+
+
+# *****
+# ComputeFrameResults
+#
+# Description: Processes the frames of an image, one after the other or across a pool of worker processes
+#
+# Parameters:
+#    inFrameFuncArgs : Arguments of ProcessFrame before those of the frame
+#    inFrames : Iterable of the frames, see ReadImageFrames, consumed lazily
+#    inWorkers : Number of worker processes, 0 for one per CPU core, 1 to process the frames in this process
+#
+# Returns: Generator of (list of (output path and file name, encoded bytes, (width, height), alpha),
+# dictionary of the frame information) of each frame, in order
+# *****
+def ComputeFrameResults(inFrameFuncArgs, inFrames, inWorkers):
+
+    recordStages = GetInstrumentationSettings()
+
+    if inWorkers == 1:
+
+        for frameArray, alphaArray, frameInfo in inFrames:
+            frameResults, frameStageTimes = ProcessFrame(*(inFrameFuncArgs + (frameArray, alphaArray, frameInfo, recordStages)))
+            AddStageTimes(frameStageTimes)
+            yield (frameResults, frameInfo)
+
+        return
+
+    numWorkers = inWorkers if inWorkers else os.cpu_count()
+    maxFramesInFlight = framesInFlightPerWorker * numWorkers
+
+    framesInFlight = collections.deque()    # (future, frame information) of each frame
+
+    with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+
+        for frameArray, alphaArray, frameInfo in inFrames:
+
+            framesInFlight.append((executor.submit(ProcessFrame, *(inFrameFuncArgs + (frameArray, alphaArray, frameInfo, recordStages))), frameInfo))
+
+            # Collect the oldest frame once enough are in flight, the frames decoded being bounded
+            if len(framesInFlight) >= maxFramesInFlight:
+                frameFuture, oldestFrameInfo = framesInFlight.popleft()
+                frameResults, frameStageTimes = frameFuture.result()
+                AddStageTimes(frameStageTimes)
+                yield (frameResults, oldestFrameInfo)
+
+        while framesInFlight:
+            frameFuture, oldestFrameInfo = framesInFlight.popleft()
+            frameResults, frameStageTimes = frameFuture.result()
+            AddStageTimes(frameStageTimes)
+            yield (frameResults, oldestFrameInfo)
+
+
+# *****
+# ProcessMultiFrameImage
+#
+# Description: Processes the frames of an image and saves its results, in the format of the image
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#    inComputeOutputsFunc : Function computing the (output path and file name, image) of each result,
+#                           given an image and the path and file name of the input image, must be picklable
+#    inFrameToImageFunc : Function wrapping a NumPy array as an image of the script, None if the images
+#                         are NumPy arrays, must be picklable
+#    inChannelOrder : Order of the color channels of the images of the script, "RGB" or "BGR"
+#    inWorkers : Number of worker processes processing the frames, 0 for one per CPU core
+# *****
+def ProcessMultiFrameImage(inImageFN, inComputeOutputsFunc, inFrameToImageFunc=None, inChannelOrder="RGB", inWorkers=1):
+
+    SetCurrentImage(inImageFN)
+
+    imageFormat = multiFrameFormats[os.path.splitext(inImageFN)[1].lower()]
+    frameFuncArgs = (inComputeOutputsFunc, inFrameToImageFunc, inChannelOrder, inImageFN, imageFormat)
+    frameWriters = collections.OrderedDict()    # Writer of each result, keyed by output path and file name
+
+    # Results written to temporary files renamed once complete, removed on error
+    with contextlib.ExitStack() as resultFiles:
+
+        for frameResults, frameInfo in ComputeFrameResults(frameFuncArgs, ReadImageFrames(inImageFN, inChannelOrder), inWorkers):
+
+            for outImageFN, frameBytes, frameSize, frameAlpha in frameResults:
+
+                if outImageFN not in frameWriters:
+                    tempImageFN = resultFiles.enter_context(AtomicOutputFile(outImageFN))
+                    frameWriters[outImageFN] = frameWriterClasses[imageFormat](resultFiles.enter_context(open(tempImageFN, "w+b")), frameInfo)
+
+                frameWriters[outImageFN].AddFrame(frameBytes, frameSize, frameInfo, frameAlpha)
+
+        for frameWriter in frameWriters.values():
+            frameWriter.Finish()
+
+
+# *****
+# ProcessMultiFrameImages
+#
+# Description: Processes multi-frame images one after the other, with their frames across worker processes
+#
+# Parameters:
+#    inImageFNs : Paths and file names of the images
+#    inProcessMultiFrameImageFunc : ProcessMultiFrameImage with all but the image and the workers bound
+#    inWorkers : Number of worker processes processing the frames, 0 for one per CPU core
+#    inProcessedImageFNs : List to which the images are appended as they are processed
+#
+# Returns: List of (path and file name, error) for the images that could not be processed
+# *****
+def ProcessMultiFrameImages(inImageFNs, inProcessMultiFrameImageFunc, inWorkers, inProcessedImageFNs):
+
+    failedImages = []
+
+    for imageFN in inImageFNs:
+
+        print("Currently processing multi-frame image: " + imageFN)
+
+        # Isolate errors as the still images processed alongside do
+        try:
+            inProcessMultiFrameImageFunc(imageFN, inWorkers=inWorkers)
+        except Exception as err:
+            failedImages.append((imageFN, type(err).__name__ + ": " + str(err)))
+            print("Unable to process image: " + imageFN + " (" + failedImages[-1][1] + ")")
+
+        inProcessedImageFNs.append(imageFN)
+
+    return failedImages
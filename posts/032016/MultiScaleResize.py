@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to plan the resizing of an image to several percentages at once
+# (developed with & tested against Python 3.5)
+# Resize quality
+# The resize quality trades exactness for speed:
+#    exact : every percentage is resampled from the full resolution image
+#    balanced : a percentage is resampled from an already resized (larger) percentage when that
+#               is at least twice the size, and jpgs are decoded at a reduced resolution that
+#               is at least twice the largest percentage
+#    fast : a percentage is resampled from the nearest already resized (larger) percentage, and
+#           jpgs are decoded at the smallest reduced resolution at least as large as the largest percentage
+# The reduced resolution decoding uses the DCT scaling of the jpg decoder (1/2, 1/4 or 1/8).
+# Reduced decodes per percentage
+# When a jpg is resized from its file, a smaller percentage may also be resampled from a decode of
+# its own at a reduced resolution (large enough by the same rule), when decoding the jpg again costs
+# less than resampling the larger image it would otherwise be resampled from. The cost of a decode is
+# given by the backend, as the fraction of the full resolution pixels resampled in the same time: a
+# second decode pays off with the Lanczos resampling of PIL (the 50% of a fast resize to 75 50 25 is
+# then decoded at 1/2 rather than resampled from the 75%), hardly ever with the resampling of OpenCV.
+#
+# Usage: Imported by BatchProcessingPIL.py and BatchProcessingOpenCV.py
+# *****
+
+
+
+import struct
+import collections
+
+
+
+resizeQualities = ("exact", "balanced", "fast")    # Supported resize qualities
+decodeScaleDenominators = (8, 4, 2)                 # Reduced resolutions supported by jpg decoders (1/8, 1/4 and 1/2)
+
+# A single resize of the plan, sourceIndex is the index of the step resized from or None for the decoded
+# image, decoded at 1 / decodeScaleDenominator of the full resolution (None when resized from a step)
+ResizeStep = collections.namedtuple("ResizeStep", ["percentage", "sourceIndex", "width", "height", "decodeScaleDenominator"])
+
+
+
+# *****
+# ReadJpegSize
+#
+# Description: Reads the width and height of a jpg image from its header without decoding the image
+#
+# Parameters:
+#    inImageFN : Path and file name of the jpg image
+#
+# Returns: Tuple of width and height, None if the file is not a jpg image
+# *****
+def ReadJpegSize(inImageFN):
+
+    with open(inImageFN, "rb") as jpgFile:
+
+        if jpgFile.read(2) != b"\xff\xd8":
+            return None
+
+        while True:
+
+            # Find the next marker, skipping any fill bytes
+            markerByte = jpgFile.read(1)
+            if not markerByte:
+                return None
+            if markerByte != b"\xff":
+                continue
+
+            marker = jpgFile.read(1)
+            while marker == b"\xff":
+                marker = jpgFile.read(1)
+            if not marker:
+                return None
+
+            markerCode = ord(marker)
+
+            # Markers without a segment
+            if markerCode == 0x01 or 0xd0 <= markerCode <= 0xd9:
+                continue
+
+            segmentLengthBytes = jpgFile.read(2)
+            if len(segmentLengthBytes) != 2:
+                return None
+            segmentLength = struct.unpack(">H", segmentLengthBytes)[0]
+
+            # Start of frame markers (except DHT, JPG and DAC) hold the image size
+            if 0xc0 <= markerCode <= 0xcf and markerCode not in (0xc4, 0xc8, 0xcc):
+                sofBytes = jpgFile.read(5)
+                if len(sofBytes) != 5:
+                    return None
+                imgHeight, imgWidth = struct.unpack(">xHH", sofBytes)
+                return (imgWidth, imgHeight)
+
+            jpgFile.seek(segmentLength - 2, 1)
+
+
+# *****
+# ChooseDecodeScaleDenominator
+#
+# Description: Chooses the reduced resolution at which to decode a jpg image for the given percentages
+#
+# Parameters:
+#    inResizePercentages : Percentages by which to resize the image
+#    inResizeQuality : One of resizeQualities
+#
+# Returns: Denominator of the decode scale (1 for full resolution, 2, 4 or 8)
+# *****
+def ChooseDecodeScaleDenominator(inResizePercentages, inResizeQuality):
+
+    if inResizeQuality not in resizeQualities:
+        raise ValueError("Unknown resize quality: " + str(inResizeQuality))
+
+    if inResizeQuality == "exact":
+        return 1
+
+    # Keep the decoded image at least as large as the largest percentage (twice as large when balanced)
+    minSourceFactor = 2 if inResizeQuality == "balanced" else 1
+    minDecodeFraction = minSourceFactor * max(inResizePercentages) / 100
+
+    for scaleDenominator in decodeScaleDenominators:
+        if 1 / scaleDenominator >= minDecodeFraction:
+            return scaleDenominator
+
+    return 1
+
+
+# *****
+# GetDecodeSize
+#
+# Description: Size of a jpg image decoded at a reduced resolution, the DCT scaling rounding up
+#
+# Parameters:
+#    inImageSize : Width and height of the full resolution image
+#    inScaleDenominator : Denominator of the decode scale (1 for full resolution, 2, 4 or 8)
+#
+# Returns: Tuple of width and height
+# *****
+def GetDecodeSize(inImageSize, inScaleDenominator):
+
+    return (-(-inImageSize[0] // inScaleDenominator), -(-inImageSize[1] // inScaleDenominator))
+
+
+# *****
+# PlanMultiScaleResize
+#
+# Description: Plans the resizes of an image to several percentages, largest percentage first
+#
+# Parameters:
+#    inImageSize : Width and height of the full resolution image
+#    inResizePercentages : Percentages by which to resize the image
+#    inResizeQuality : One of resizeQualities
+#    inRoundSizes : Round the resized width and height to the nearest pixel (as cv2.resize does),
+#                   otherwise truncate them
+#    inDecodeCost : Cost of decoding the jpg image at a reduced resolution, as a fraction of the full
+#                   resolution pixels resampled in the same time, None for an image already decoded at
+#                   full resolution
+#
+# Returns: List of ResizeStep
+# *****
+def PlanMultiScaleResize(inImageSize, inResizePercentages, inResizeQuality, inRoundSizes=False, inDecodeCost=None):
+
+    if inResizeQuality not in resizeQualities:
+        raise ValueError("Unknown resize quality: " + str(inResizeQuality))
+
+    imgWidth, imgHeight = inImageSize
+    minSourceFactor = 2 if inResizeQuality == "balanced" else 1
+    sizeFunc = (lambda inSize: int(round(inSize))) if inRoundSizes else int
+
+    # Sizes of the decoded images, keyed by scale denominator, the first one at the reduced resolution
+    # the largest percentage allows
+    firstScaleDenominator = ChooseDecodeScaleDenominator(inResizePercentages, inResizeQuality) if inDecodeCost is not None and inResizePercentages else 1
+    decodeSizes = {firstScaleDenominator: GetDecodeSize(inImageSize, firstScaleDenominator)}
+
+    resizePlan = []
+
+    for resizePercentage in sorted(set(inResizePercentages), reverse=True):
+
+        resizeWidth = sizeFunc(resizePercentage * imgWidth / 100)
+        resizeHeight = sizeFunc(resizePercentage * imgHeight / 100)
+
+        if inResizeQuality == "exact":
+            resizePlan.append(ResizeStep(resizePercentage, None, resizeWidth, resizeHeight, firstScaleDenominator))
+            continue
+
+        # Resample from the smallest image large enough, among the decoded images then the already
+        # resized ones, the resampling cost growing with the number of source pixels (from the first
+        # decoded image if none is large enough)
+        sourceIndex, scaleDenominator = None, firstScaleDenominator
+        sourceCost = decodeSizes[firstScaleDenominator][0] * decodeSizes[firstScaleDenominator][1]
+        for decodeScaleDenominator, (decodeWidth, decodeHeight) in decodeSizes.items():
+            if decodeWidth >= minSourceFactor * resizeWidth and decodeHeight >= minSourceFactor * resizeHeight and decodeWidth * decodeHeight < sourceCost:
+                scaleDenominator, sourceCost = decodeScaleDenominator, decodeWidth * decodeHeight
+        for stepIndex, resizeStep in enumerate(resizePlan):
+            if resizeStep.width >= minSourceFactor * resizeWidth and resizeStep.height >= minSourceFactor * resizeHeight and resizeStep.width * resizeStep.height <= sourceCost:
+                sourceIndex, scaleDenominator, sourceCost = stepIndex, None, resizeStep.width * resizeStep.height
+
+        # Or from a decode of its own at the smallest reduced resolution large enough, when decoding
+        # again costs less (nothing is resampled when the decode has the size of the percentage)
+        if inDecodeCost is not None:
+            for decodeScaleDenominator in decodeScaleDenominators:
+                decodeWidth, decodeHeight = GetDecodeSize(inImageSize, decodeScaleDenominator)
+                if decodeScaleDenominator in decodeSizes or decodeWidth < minSourceFactor * resizeWidth or decodeHeight < minSourceFactor * resizeHeight:
+                    continue
+                resampleCost = 0 if (decodeWidth, decodeHeight) == (resizeWidth, resizeHeight) else decodeWidth * decodeHeight
+                if inDecodeCost * imgWidth * imgHeight + resampleCost < sourceCost:
+                    decodeSizes[decodeScaleDenominator] = (decodeWidth, decodeHeight)
+                    sourceIndex, scaleDenominator = None, decodeScaleDenominator
+                break
+
+        resizePlan.append(ResizeStep(resizePercentage, sourceIndex, resizeWidth, resizeHeight, scaleDenominator))
+
+    return resizePlan
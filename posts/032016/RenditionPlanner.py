@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to plan the renditions of an image for responsive web pages and write
+# their srcset manifest (developed with & tested against Python 3.5)
+# Renditions
+# Renditions are planned at target pixel widths (the CSS widths of the page layout) multiplied by
+# device pixel ratios. Widths above the image width are not upscaled, the image width is used once
+# instead (a 100% rendition, copied from the image rather than encoded again by ResponsiveImageSet.py),
+# and a width less than a minimum step narrower than the previous (larger) rendition is a
+# near duplicate and skipped, as it would cost an encode and bytes for no visible difference.
+# Each rendition is expressed as an exact fractional percentage of the image, so that it is resized
+# by the percentage resizing of the backends to exactly its width.
+# Manifest
+# The width, height and byte size of each saved rendition are written as JSON, and as an HTML page of
+# img elements with srcset attributes using width descriptors.
+#
+# Usage: Imported by ResponsiveImageSet.py
+# *****
+
+
+
+import os
+import json
+import html
+import fractions
+import collections
+from MultiScaleResize import ReadJpegSize
+
+
+
+renditionMinWidthStep = 0.1     # Relative width difference below which two renditions are near duplicates
+
+# A planned rendition of an image
+Rendition = collections.namedtuple("Rendition", ["width", "percentage"])
+
+
+
+# *****
+# PlanRenditions
+#
+# Description: Plans the renditions of an image for target widths and device pixel ratios
+#
+# Parameters:
+#    inImageSize : Tuple of the width and height of the image
+#    inTargetWidths : Target widths in CSS pixels
+#    inPixelRatios : Device pixel ratios each target width is multiplied by
+#    inMinWidthStep : Relative width difference below which a rendition is a near duplicate of a larger one
+#
+# Returns: List of Rendition, the largest first
+# *****
+def PlanRenditions(inImageSize, inTargetWidths, inPixelRatios=(1,), inMinWidthStep=renditionMinWidthStep):
+
+    imgWidth = inImageSize[0]
+
+    # Never upscale, a target wider than the image is served by the image width
+    renditionWidths = set(min(int(round(targetWidth * pixelRatio)), imgWidth) for targetWidth in inTargetWidths for pixelRatio in inPixelRatios)
+
+    renditions = []
+
+    for renditionWidth in sorted(renditionWidths, reverse=True):
+
+        if renditionWidth < 1:
+            continue
+        if renditions and renditionWidth > renditions[-1].width * (1 - inMinWidthStep):
+            continue
+
+        # The percentage resizes the width exactly, the height is rounded as the backend does
+        renditions.append(Rendition(renditionWidth, fractions.Fraction(100 * renditionWidth, imgWidth)))
+
+    return renditions
+
+
+# *****
+# GetRenditionFN
+#
+# Description: Output path and file name of a rendition
+#
+# Parameters:
+#    inOutputImageDir : Output directory of the results of the image
+#    inImageName : File name of the image, without extension
+#    inRendition : The Rendition
+#
+# Returns: Path and file name, suffixed with the width of the rendition
+# *****
+def GetRenditionFN(inOutputImageDir, inImageName, inRendition):
+
+    return os.path.join(inOutputImageDir, inImageName + "_" + str(inRendition.width) + "w.jpg")
+
+
+# *****
+# GetSrcsetEntry
+#
+# Description: Manifest entry of the renditions of an image, with the dimensions and byte sizes
+# read from the saved files
+#
+# Parameters:
+#    inImageFN : Path and file name of the image, as listed in the manifest
+#    inImageSize : Tuple of the width and height of the image
+#    inRenditionFNs : List of output paths and file names of the renditions, the largest first
+#    inBaseDir : Directory the rendition paths of the manifest are relative to
+#
+# Returns: Dictionary of the image and its renditions, None if a rendition is missing
+# *****
+def GetSrcsetEntry(inImageFN, inImageSize, inRenditionFNs, inBaseDir):
+
+    renditionEntries = []
+
+    for renditionFN in inRenditionFNs:
+
+        renditionSize = ReadJpegSize(renditionFN) if os.path.isfile(renditionFN) else None
+        if renditionSize is None:
+            return None
+
+        renditionEntries.append({"file": os.path.relpath(renditionFN, inBaseDir).replace(os.sep, "/"), "width": renditionSize[0], "height": renditionSize[1], "bytes": os.path.getsize(renditionFN)})
+
+    return {"image": inImageFN, "width": inImageSize[0], "height": inImageSize[1], "renditions": renditionEntries}
+
+
+# *****
+# WriteSrcsetManifest
+#
+# Description: Writes the srcset manifest of the renditions as JSON and optionally as HTML
+#
+# Parameters:
+#    inSrcsetEntries : List of the entries returned by GetSrcsetEntry
+#    inJSONFN : Path and file name of the JSON manifest, None for none
+#    inHTMLFN : Path and file name of the HTML manifest, None for none
+#    inSizes : Value of the sizes attribute of the img elements
+# *****
+def WriteSrcsetManifest(inSrcsetEntries, inJSONFN=None, inHTMLFN=None, inSizes="100vw"):
+
+    if inJSONFN:
+        with open(inJSONFN, "w") as jsonFile:
+            json.dump({"images": inSrcsetEntries}, jsonFile, indent=2)
+
+    if inHTMLFN:
+        with open(inHTMLFN, "w") as htmlFile:
+
+            htmlFile.write("<!DOCTYPE html>\n<html>\n<body>\n")
+
+            for srcsetEntry in inSrcsetEntries:
+
+                renditionEntries = srcsetEntry["renditions"]
+                if not renditionEntries:
+                    continue
+
+                # The smallest rendition is the fallback of browsers without srcset support
+                srcset = ", ".join(renditionEntry["file"] + " " + str(renditionEntry["width"]) + "w" for renditionEntry in renditionEntries)
+                htmlFile.write('<img src="%s" srcset="%s" sizes="%s" width="%d" height="%d" alt="%s">\n' % (html.escape(renditionEntries[-1]["file"]), html.escape(srcset), html.escape(inSizes), renditionEntries[0]["width"], renditionEntries[0]["height"], html.escape(os.path.basename(srcsetEntry["image"]))))
+
+            htmlFile.write("</body>\n</html>\n")
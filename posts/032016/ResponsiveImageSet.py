@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python script to generate the renditions of images for responsive web pages using the
+# PIL, OpenCV or ImageMagick (Wand) implementation (developed with & tested against Python 3.5)
+# Renditions
+# The jpg image files of the specified input directory are resized to target widths multiplied by
+# device pixel ratios, without upscaling and skipping near duplicate widths (see RenditionPlanner.py).
+# Each image is decoded once and all its renditions resized from it, planned together by the
+# percentage resizing of the backend, and saved as name_<width>w.jpg to the output directory. With
+# PIL and OpenCV, jpgs are decoded at the reduced resolutions the resize quality allows instead.
+# A rendition at the full width of a jpg (a target at least as wide as the image) is a copy of the
+# image, as encoding it again would only add bytes and artifacts, unless --jpeg-* options are given
+# that every rendition is encoded with, such as a quality or a byte budget.
+# Manifest
+# Once all images are processed, a JSON manifest of the renditions of each image (dimensions and
+# byte sizes) is written to the output directory, and optionally an HTML page of img elements with
+# their srcset attributes, the images sorted by path.
+#
+# Usage: python ResponsiveImageSet.py --backend opencv --widths 320 640 1024 --pixel-ratios 1 2
+# *****
+
+
+
+import os
+import sys
+import shutil
+import functools
+import importlib
+from BatchProcessingDriver import CreateBatchArgumentParser, RunBatch
+from DirectoryScanner import ScanImageFiles, GetOutputImageDir, AtomicOutputFile
+from StageTimer import SetCurrentImage
+from MultiScaleResize import resizeQualities, ReadJpegSize
+from MemoryAdmission import EstimateImageBytes
+from JpegEncoding import GetJpegSettings
+from RenditionPlanner import renditionMinWidthStep, PlanRenditions, GetRenditionFN, GetSrcsetEntry, WriteSrcsetManifest
+
+
+
+renditionBackends = {"pil": "BatchProcessingPIL", "opencv": "BatchProcessingOpenCV", "wand": "BatchProcessingImageMagick"}
+
+srcsetManifestFileName = "srcset.json"      # Default JSON manifest, in the output directory
+
+
+
+# *****
+# GetImageSize
+#
+# Description: Size of a decoded image of any backend
+#
+# Parameters:
+#    inImage : A PIL, OpenCV or Wand image
+#
+# Returns: Tuple of the width and height of the image
+# *****
+def GetImageSize(inImage):
+
+    # OpenCV images are NumPy arrays of shape height x width (x channels)
+    if hasattr(inImage, "shape"):
+        return (inImage.shape[1], inImage.shape[0])
+
+    return tuple(inImage.size)
+
+
+# *****
+# GetRenditionFNs
+#
+# Description: Output paths and file names of the renditions of an image, planned from its jpg header
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the jpg image
+#    inBatchOutputImageDir : Output directory where renditions are saved
+#    inTargetWidths : Target widths in CSS pixels
+#    inPixelRatios : Device pixel ratios each target width is multiplied by
+#    inMinWidthStep : Relative width difference below which a rendition is a near duplicate of a larger one
+#    inBatchInputImageDir : Input directory of the batch, None to save the renditions directly in the output directory
+#
+# Returns: List of output paths and file names, the largest rendition first, empty if the size of the image cannot be read
+# *****
+def GetRenditionFNs(inBatchInImageFN, inBatchOutputImageDir, inTargetWidths, inPixelRatios, inMinWidthStep=renditionMinWidthStep, inBatchInputImageDir=None):
+
+    imageSize = ReadJpegSize(inBatchInImageFN)
+    if imageSize is None:
+        return []
+
+    imageName = os.path.splitext(os.path.basename(inBatchInImageFN))[0]
+    outputImageDir = GetOutputImageDir(inBatchInImageFN, inBatchInputImageDir, inBatchOutputImageDir)
+
+    return [GetRenditionFN(outputImageDir, imageName, rendition) for rendition in PlanRenditions(imageSize, inTargetWidths, inPixelRatios, inMinWidthStep)]
+
+
+# *****
+# EstimateRenditionBytes
+#
+# Description: Estimates the peak memory used to generate the renditions of an image from its jpg header
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the jpg image
+#    inTargetWidths : Target widths in CSS pixels
+#    inPixelRatios : Device pixel ratios each target width is multiplied by
+#    inMinWidthStep : Relative width difference below which a rendition is a near duplicate of a larger one
+#
+# Returns: Number of bytes, 0 if the size of the image cannot be read
+# *****
+def EstimateRenditionBytes(inBatchInImageFN, inTargetWidths, inPixelRatios, inMinWidthStep=renditionMinWidthStep):
+
+    imageSize = ReadJpegSize(inBatchInImageFN)
+    if imageSize is None:
+        return 0
+
+    renditionPercentages = [rendition.percentage for rendition in PlanRenditions(imageSize, inTargetWidths, inPixelRatios, inMinWidthStep)]
+
+    return EstimateImageBytes(inBatchInImageFN, renditionPercentages, 0)
+
+
+# *****
+# ComputeRenditions
+#
+# Description: Resizes an image to each of its renditions, the full width rendition of a jpg image
+# being copied from it when the renditions are saved with the backend's jpg defaults
+#
+# Parameters:
+#    inImage : An image decoded by the backend, None for the PIL and OpenCV backends to decode the jpg
+#              image at the reduced resolutions the resize quality allows
+#    inBatchInImageFN : Path and file name of the image, used to name the renditions
+#    inBatchOutputImageDir : Output directory where renditions are saved
+#    inBackendName : Key of renditionBackends
+#    inTargetWidths : Target widths in CSS pixels
+#    inPixelRatios : Device pixel ratios each target width is multiplied by
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inMinWidthStep : Relative width difference below which a rendition is a near duplicate of a larger one
+#    inBatchInputImageDir : Input directory of the batch, None to save the renditions directly in the output directory
+#    inJpegSettings : JpegEncoding.JpegSettings the renditions are saved with, the full width rendition
+#                     being resized and saved with them too, None for the backend's defaults
+#
+# Returns: Generator of (output path and file name, image) for each resized rendition, the largest first
+# *****
+def ComputeRenditions(inImage, inBatchInImageFN, inBatchOutputImageDir, inBackendName, inTargetWidths, inPixelRatios, inResizeQuality="exact", inMinWidthStep=renditionMinWidthStep, inBatchInputImageDir=None, inJpegSettings=None):
+
+    backendModule = importlib.import_module(renditionBackends[inBackendName])
+
+    imageName = os.path.splitext(os.path.basename(inBatchInImageFN))[0]
+    outputImageDir = GetOutputImageDir(inBatchInImageFN, inBatchInputImageDir, inBatchOutputImageDir)
+
+    # Planned from the full resolution image, the renditions are its exact fractional percentages
+    jpegSize = ReadJpegSize(inBatchInImageFN)
+    imageSize = GetImageSize(inImage) if inImage is not None else jpegSize
+    renditions = dict((rendition.percentage, rendition) for rendition in PlanRenditions(imageSize, inTargetWidths, inPixelRatios, inMinWidthStep))
+
+    # The full width rendition of a jpg is the jpg itself, encoding it again would make it larger, unless
+    # it is to respect the quality or byte budget of the jpg settings
+    if jpegSize is not None and inJpegSettings is None and 100 in renditions:
+        with AtomicOutputFile(GetRenditionFN(outputImageDir, imageName, renditions.pop(100))) as tempRenditionFN:
+            shutil.copyfile(inBatchInImageFN, tempRenditionFN)
+
+    if inImage is None:
+        imgResizes = backendModule.ResizeImageFileByPercentages(inBatchInImageFN, list(renditions), inResizeQuality)
+    else:
+        imgResizes = backendModule.ResizeImageByPercentages(inImage, list(renditions), inResizeQuality)
+
+    for renditionPercentage, imgResize in imgResizes:
+
+        yield (GetRenditionFN(outputImageDir, imageName, renditions[renditionPercentage]), imgResize)
+
+
+# *****
+# ProcessImage
+#
+# Description: Decodes an image once, resizes it to each of its renditions and saves them
+#
+# Parameters:
+#    inBatchInImageFN : Path and file name of the jpg image to process
+#    inBatchOutputImageDir : Output directory where renditions are saved
+#    inBackendName : Key of renditionBackends
+#    inTargetWidths : Target widths in CSS pixels
+#    inPixelRatios : Device pixel ratios each target width is multiplied by
+#    inResizeQuality : One of MultiScaleResize.resizeQualities
+#    inMinWidthStep : Relative width difference below which a rendition is a near duplicate of a larger one
+#    inBatchInputImageDir : Input directory of the batch, None to save the renditions directly in the output directory
+#    inJpegSettings : JpegEncoding.JpegSettings of the renditions, None for the backend's defaults
+# *****
+def ProcessImage(inBatchInImageFN, inBatchOutputImageDir, inBackendName, inTargetWidths, inPixelRatios, inResizeQuality="exact", inMinWidthStep=renditionMinWidthStep, inBatchInputImageDir=None, inJpegSettings=None):
+
+    backendModule = importlib.import_module(renditionBackends[inBackendName])
+
+    SetCurrentImage(inBatchInImageFN)
+
+    # PIL and OpenCV decode jpgs while resizing, at reduced resolutions when the resize quality allows
+    img = backendModule.LoadImage(inBatchInImageFN) if inBackendName == "wand" or ReadJpegSize(inBatchInImageFN) is None else None
+
+    try:
+
+        # Save each rendition as soon as it is resized, Wand images are closed once saved
+        for renditionFN, imgResize in ComputeRenditions(img, inBatchInImageFN, inBatchOutputImageDir, inBackendName, inTargetWidths, inPixelRatios, inResizeQuality, inMinWidthStep, inBatchInputImageDir, inJpegSettings):
+
+            backendModule.SaveImage(imgResize, renditionFN, inJpegSettings)
+
+            if inBackendName == "wand":
+                imgResize.close()
+
+    finally:
+
+        if inBackendName == "wand":
+            img.close()
+
+
+# *****
+# WriteRenditionManifest
+#
+# Description: Writes the srcset manifest of the renditions saved for the images of the input directory
+#
+# Parameters:
+#    inArgs : Parsed command line options
+#    inBatchInputImageDir : Input directory where jpg files reside
+#    inBatchOutputImageDir : Output directory where renditions are saved, skipped by the scan
+#    inRenditionFNsFunc : Function returning the output paths and file names of the renditions of an image
+#    inJSONFN : Path and file name of the JSON manifest, the rendition paths are relative to its directory
+#    inHTMLFN : Path and file name of the HTML manifest, None for none
+#    inSizes : Value of the sizes attribute of the img elements
+# *****
+def WriteRenditionManifest(inArgs, inBatchInputImageDir, inBatchOutputImageDir, inRenditionFNsFunc, inJSONFN, inHTMLFN=None, inSizes="100vw"):
+
+    manifestDir = os.path.dirname(os.path.abspath(inJSONFN))
+    srcsetEntries = []
+
+    # Images whose renditions could not all be saved are left out, the others listed by path as the
+    # scan order depends on the file system
+    for batchInImageFN in sorted(ScanImageFiles(inBatchInputImageDir, inArgs.recursive, inArgs.include, inArgs.exclude, inBatchOutputImageDir)):
+
+        imageSize = ReadJpegSize(batchInImageFN)
+        srcsetEntry = GetSrcsetEntry(batchInImageFN, imageSize, inRenditionFNsFunc(batchInImageFN), manifestDir) if imageSize else None
+
+        if srcsetEntry is not None:
+            srcsetEntries.append(srcsetEntry)
+
+    if not os.path.isdir(manifestDir):
+        os.makedirs(manifestDir)
+
+    WriteSrcsetManifest(srcsetEntries, inJSONFN, inHTMLFN, inSizes)
+
+    print("Wrote the srcset manifest of " + str(len(srcsetEntries)) + " jpg images to: " + inJSONFN)
+
+
+# *****
+# Main
+#
+# Description: Resizes the jpg images of the input directory to responsive renditions and writes
+# their srcset manifest, as set by the command line options
+#
+# Parameters:
+#    inArgv : Command line options, None for those of the script
+#
+# Returns: List of (path and file name, error) of the images that could not be processed
+# *****
+def Main(inArgv=None):
+
+    parser = CreateBatchArgumentParser("Resize jpg images to responsive renditions and write their srcset manifest")
+    parser.add_argument("--backend", choices=sorted(renditionBackends), default="opencv", help="Implementation resizing the images (default: opencv)")
+    parser.add_argument("--widths", type=int, nargs="+", default=[320, 640, 960, 1280, 1920], help="Target widths in CSS pixels (default: 320 640 960 1280 1920)")
+    parser.add_argument("--pixel-ratios", type=float, nargs="+", default=[1, 2], help="Device pixel ratios each target width is multiplied by (default: 1 2)")
+    parser.add_argument("--min-width-step", type=float, default=renditionMinWidthStep, help="Skip renditions less than this fraction narrower than a larger one (default: " + str(renditionMinWidthStep) + ")")
+    parser.add_argument("--resize-quality", choices=resizeQualities, default="exact", help="Trade resize exactness for speed (default: exact)")
+    parser.add_argument("--manifest-json", help="Write the JSON srcset manifest to this file (default: " + srcsetManifestFileName + " in the output directory)")
+    parser.add_argument("--manifest-html", help="Also write an HTML page of img elements with srcset attributes to this file")
+    parser.add_argument("--sizes", default="100vw", help="Value of the sizes attribute of the img elements of the HTML manifest (default: 100vw)")
+    parser.set_defaults(output_dir=os.path.join("..","images","responsive"))
+    args = parser.parse_args(inArgv)
+
+    batchInputImageDir = args.input_dir         # Input directory where jpg files reside
+    batchOutputImageDir = args.output_dir       # Output directory where renditions are saved as jpg image files
+
+    # The results depend on these, for --incremental
+    processingParams = {"backend": args.backend, "targetWidths": args.widths, "pixelRatios": args.pixel_ratios, "minWidthStep": args.min_width_step, "resizeQuality": args.resize_quality}
+    jpegSettings = GetJpegSettings(args)
+    if jpegSettings:
+        processingParams["jpegSettings"] = jpegSettings._asdict()
+
+    backendModule = importlib.import_module(renditionBackends[args.backend])
+
+    processImageFunc = functools.partial(ProcessImage, inBatchOutputImageDir=batchOutputImageDir, inBackendName=args.backend, inTargetWidths=args.widths, inPixelRatios=args.pixel_ratios, inResizeQuality=args.resize_quality, inMinWidthStep=args.min_width_step, inBatchInputImageDir=batchInputImageDir, inJpegSettings=jpegSettings)
+    computeOutputsFunc = functools.partial(ComputeRenditions, inBatchOutputImageDir=batchOutputImageDir, inBackendName=args.backend, inTargetWidths=args.widths, inPixelRatios=args.pixel_ratios, inResizeQuality=args.resize_quality, inMinWidthStep=args.min_width_step, inBatchInputImageDir=batchInputImageDir, inJpegSettings=jpegSettings)
+    estimateImageBytesFunc = functools.partial(EstimateRenditionBytes, inTargetWidths=args.widths, inPixelRatios=args.pixel_ratios, inMinWidthStep=args.min_width_step)
+    renditionFNsFunc = functools.partial(GetRenditionFNs, inBatchOutputImageDir=batchOutputImageDir, inTargetWidths=args.widths, inPixelRatios=args.pixel_ratios, inMinWidthStep=args.min_width_step, inBatchInputImageDir=batchInputImageDir)
+    saveImageFunc = functools.partial(backendModule.SaveImage, inJpegSettings=jpegSettings)
+
+    failedImages = RunBatch(args, batchInputImageDir, batchOutputImageDir, processImageFunc, backendModule.LoadImage, computeOutputsFunc, saveImageFunc, renditionFNsFunc, processingParams, inEstimateImageBytesFunc=estimateImageBytesFunc)
+
+    WriteRenditionManifest(args, batchInputImageDir, batchOutputImageDir, renditionFNsFunc, args.manifest_json or os.path.join(batchOutputImageDir, srcsetManifestFileName), args.manifest_html, args.sizes)
+
+    return failedImages
+
+
+
+if __name__ == "__main__":
+
+    # Exit with an error status when images could not be processed
+    sys.exit(1 if Main() else 0)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module keeping preallocated NumPy scratch buffers for reuse from one image
+# to the next (developed with & tested against Python 3.5 and NumPy 1.10.4)
+# Scratch buffers
+# A buffer is kept per name and per thread, and is reallocated only when an image of a different
+# shape or type is processed. A batch of same size images therefore allocates its working
+# buffers once.
+#
+# Usage: Imported by BatchProcessingPIL.py and BatchProcessingOpenCV.py
+# *****
+
+
+
+import threading
+import numpy as np
+
+
+
+scratchBuffers = threading.local()     # Buffers of the current thread, keyed by name
+
+
+
+# *****
+# GetScratchBuffer
+#
+# Description: Returns the scratch buffer of the given name, (re)allocating it if its shape or type differs
+#
+# Parameters:
+#    inName : Name of the buffer, unique within the calling code
+#    inShape : Shape of the buffer
+#    inDtype : NumPy type of the buffer
+#
+# Returns: Uninitialized array of the given shape and type
+# *****
+def GetScratchBuffer(inName, inShape, inDtype):
+
+    threadBuffers = getattr(scratchBuffers, "buffers", None)
+    if threadBuffers is None:
+        threadBuffers = scratchBuffers.buffers = {}
+
+    scratchBuffer = threadBuffers.get(inName)
+    if scratchBuffer is None or scratchBuffer.shape != tuple(inShape) or scratchBuffer.dtype != np.dtype(inDtype):
+        scratchBuffer = threadBuffers[inName] = np.empty(inShape, inDtype)
+
+    return scratchBuffer
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to hand decoded images to worker processes through shared memory
+# instead of pickling them (developed with & tested against Python 3.8 and NumPy 1.10.4)
+# Frame pool
+# Decoded images (frames) are copied once into one of a fixed number of reusable shared memory
+# slots. Worker processes map the slots and process array views of them, so no pixels are
+# serialized between processes, and the number of slots bounds the memory held by frames waiting
+# to be processed. Each slot is reference counted and recycled once every consumer of its frame
+# has released it. A slot is grown when a frame does not fit in it.
+# Processing
+# Reader threads of the main process decode the images into the slots (decoding releases the GIL),
+# while the worker processes compute and encode the results of the frames.
+#
+# Usage: Imported by BatchProcessingDriver.py when run with the --shared-frames option
+# *****
+
+
+
+import os
+import threading
+import collections
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from BatchProcessingParallel import ReportProgress
+from StageTimer import EnableInstrumentation, GetInstrumentationSettings, SetCurrentImage, TakeStageTimes, AddStageTimes
+
+
+
+# Reference to a frame written in a slot, passed to the worker processes
+FrameRef = collections.namedtuple("FrameRef", ["slotIndex", "slotName", "shape", "dtype"])
+
+attachedSlots = {}      # (name, shared memory) of the slots mapped by a worker process, keyed by slot index
+
+
+
+# *****
+# SharedFramePool
+#
+# Description: Fixed number of reusable shared memory slots holding decoded frames, owned by the
+# main process
+# *****
+class SharedFramePool(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inNumSlots : Number of slots, the maximum number of frames held at once
+    # *****
+    def __init__(self, inNumSlots):
+
+        self.slotMemories = [None] * inNumSlots
+        self.slotRefCounts = [0] * inNumSlots
+        self.freeSlots = collections.deque(range(inNumSlots))
+        self.slotsCondition = threading.Condition()
+
+    # *****
+    # WriteFrame
+    #
+    # Description: Copies a frame into a free slot, waiting for a slot to be released if none is free
+    #
+    # Parameters:
+    #    inFrame : NumPy array of the decoded image
+    #    inRefCount : Number of consumers that will release the frame
+    #
+    # Returns: FrameRef of the slot
+    # *****
+    def WriteFrame(self, inFrame, inRefCount=1):
+
+        with self.slotsCondition:
+            while not self.freeSlots:
+                self.slotsCondition.wait()
+            slotIndex = self.freeSlots.popleft()
+
+        # Grow the slot if the frame does not fit in it
+        slotMemory = self.slotMemories[slotIndex]
+        if slotMemory is None or slotMemory.size < inFrame.nbytes:
+            if slotMemory is not None:
+                slotMemory.close()
+                slotMemory.unlink()
+            slotMemory = self.slotMemories[slotIndex] = shared_memory.SharedMemory(create=True, size=max(inFrame.nbytes, 1))
+
+        slotFrame = np.ndarray(inFrame.shape, inFrame.dtype, buffer=slotMemory.buf)
+        np.copyto(slotFrame, inFrame)
+        del slotFrame
+
+        with self.slotsCondition:
+            self.slotRefCounts[slotIndex] = inRefCount
+
+        return FrameRef(slotIndex, slotMemory.name, inFrame.shape, inFrame.dtype.str)
+
+    # *****
+    # ReleaseFrame
+    #
+    # Description: Releases a frame for one of its consumers, recycling its slot after the last one
+    #
+    # Parameters:
+    #    inFrameRef : FrameRef returned by WriteFrame
+    # *****
+    def ReleaseFrame(self, inFrameRef):
+
+        with self.slotsCondition:
+            self.slotRefCounts[inFrameRef.slotIndex] -= 1
+            if self.slotRefCounts[inFrameRef.slotIndex] == 0:
+                self.freeSlots.append(inFrameRef.slotIndex)
+                self.slotsCondition.notify()
+
+    # *****
+    # Close
+    #
+    # Description: Frees the shared memory of the slots, once all frames are released
+    # *****
+    def Close(self):
+
+        for slotMemory in self.slotMemories:
+            if slotMemory is not None:
+                slotMemory.close()
+                slotMemory.unlink()
+
+        self.slotMemories = [None] * len(self.slotMemories)
+
+
+# *****
+# GetFrameView
+#
+# Description: Array view of a frame within a worker process, mapping its slot on first use
+#
+# Parameters:
+#    inFrameRef : FrameRef of the frame
+#
+# Returns: NumPy array sharing the memory of the slot
+# *****
+def GetFrameView(inFrameRef):
+
+    slotName, slotMemory = attachedSlots.get(inFrameRef.slotIndex, (None, None))
+
+    # The slot was grown since it was mapped, the previous mapping is no longer used
+    if slotName != inFrameRef.slotName:
+        if slotMemory is not None:
+            slotMemory.close()
+        slotMemory = shared_memory.SharedMemory(name=inFrameRef.slotName)
+        attachedSlots[inFrameRef.slotIndex] = (inFrameRef.slotName, slotMemory)
+
+    return np.ndarray(inFrameRef.shape, np.dtype(inFrameRef.dtype), buffer=slotMemory.buf)
+
+
+# *****
+# ProcessSharedFrame
+#
+# Description: Computes and saves the results of a frame within a worker process
+#
+# Parameters:
+#    inFrameRef : FrameRef of the decoded image
+#    inImageFN : Path and file name of the image
+#    inFrameToImageFunc : Function wrapping the frame array view as an image of the backend without copy, None
+#                         if the backend processes NumPy arrays
+#    inComputeOutputsFunc : Function given an image and its path and file name, returning the
+#                           (output path and file name, image) of each result
+#    inSaveImageFunc : Function encoding and saving a result, given the image and its output path and file name
+#    inRecordStages : Settings of the timing of the stages of the image, see GetInstrumentationSettings,
+#                     the stage times returned with the result
+#
+# Returns: Tuple of the error (or None) and the stage times, see TakeStageTimes
+# *****
+def ProcessSharedFrame(inFrameRef, inImageFN, inFrameToImageFunc, inComputeOutputsFunc, inSaveImageFunc, inRecordStages=(False, False)):
+
+    EnableInstrumentation(*inRecordStages)
+    SetCurrentImage(inImageFN)
+    errorStr = None
+
+    try:
+        img = GetFrameView(inFrameRef)
+        if inFrameToImageFunc is not None:
+            img = inFrameToImageFunc(img)
+
+        for outImageFN, imgOut in inComputeOutputsFunc(img, inImageFN):
+            inSaveImageFunc(imgOut, outImageFN)
+    except Exception as err:
+        errorStr = type(err).__name__ + ": " + str(err)
+
+    return (errorStr, TakeStageTimes())
+
+
+# *****
+# ProcessImagesWithSharedFrames
+#
+# Description: Decodes images into shared memory slots and processes them across a pool of worker processes
+#
+# Parameters:
+#    inImageFNs : Iterable of paths and file names of the images to process
+#    inLoadFrameFunc : Function decoding an image to a NumPy array, given its path and file name
+#    inFrameToImageFunc : Function wrapping a frame array view as an image of the backend without copy, None
+#                         if the backend processes NumPy arrays
+#    inComputeOutputsFunc : Function given an image and its path and file name, returning the
+#                           (output path and file name, image) of each result
+#    inSaveImageFunc : Function encoding and saving a result, given the image and its output path and file name
+#    inWorkers : Number of worker processes, None for one per CPU core
+#    inNumSlots : Number of shared memory slots, None for two per worker process
+#    inReaderThreads : Number of threads decoding images
+#    inReportProgressFunc : Function called with each image, its error (or None) and the number of
+#                           images processed so far
+#
+# Returns: List of (path and file name, error) for the images that could not be processed
+# *****
+def ProcessImagesWithSharedFrames(inImageFNs, inLoadFrameFunc, inFrameToImageFunc, inComputeOutputsFunc, inSaveImageFunc, inWorkers=None, inNumSlots=None, inReaderThreads=2, inReportProgressFunc=ReportProgress):
+
+    numWorkers = inWorkers if inWorkers else os.cpu_count()
+    framePool = SharedFramePool(inNumSlots if inNumSlots else 2 * numWorkers)
+
+    imageFNIter = iter(inImageFNs)
+    imageFNLock = threading.Lock()
+
+    failedImages = []
+    progressState = {"processed": 0}
+    progressLock = threading.Lock()
+
+    def ReportImage(inImageFN, inErrorStr):
+
+        with progressLock:
+            progressState["processed"] += 1
+            if inErrorStr is not None:
+                failedImages.append((inImageFN, inErrorStr))
+            if inReportProgressFunc is not None:
+                inReportProgressFunc(inImageFN, inErrorStr, progressState["processed"])
+
+    def CompleteFrame(inFrameRef, inImageFN, inFuture):
+
+        framePool.ReleaseFrame(inFrameRef)
+
+        try:
+            errorStr, frameStageTimes = inFuture.result()
+            AddStageTimes(frameStageTimes)
+        except Exception as err:
+            errorStr = type(err).__name__ + ": " + str(err)
+
+        ReportImage(inImageFN, errorStr)
+
+    def ReadFrames(inExecutor):
+
+        while True:
+
+            with imageFNLock:
+                imageFN = next(imageFNIter, None)
+            if imageFN is None:
+                return
+
+            SetCurrentImage(imageFN)
+
+            try:
+                frameRef = framePool.WriteFrame(inLoadFrameFunc(imageFN))
+            except Exception as err:
+                ReportImage(imageFN, type(err).__name__ + ": " + str(err))
+                continue
+
+            frameFuture = inExecutor.submit(ProcessSharedFrame, frameRef, imageFN, inFrameToImageFunc, inComputeOutputsFunc, inSaveImageFunc, GetInstrumentationSettings())
+            frameFuture.add_done_callback(lambda inFuture, inFrameRef=frameRef, inImageFN=imageFN: CompleteFrame(inFrameRef, inImageFN, inFuture))
+
+    # Worker processes share the resource tracker of the main process when it runs before they start,
+    # so the slots they map are only tracked, and freed, once
+    resource_tracker.ensure_running()
+
+    try:
+
+        with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+
+            # Start the worker processes before the reader threads, as forking while they decode is unsafe
+            executor.submit(os.getpid).result()
+
+            readerThreads = [threading.Thread(target=ReadFrames, args=(executor,), daemon=True) for threadIndex in range(inReaderThreads)]
+            for readerThread in readerThreads:
+                readerThread.start()
+            for readerThread in readerThreads:
+                readerThread.join()
+
+    finally:
+
+        framePool.Close()
+
+    return failedImages
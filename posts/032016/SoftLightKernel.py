@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module implementing the soft light blend of two uint8 images, for top layers
+# that are not a constant color and so cannot be looked up per grey level (developed with & tested
+# against Python 3.5, NumPy 1.10.4 and Numba 0.28)
+# Compiled kernel (numba)
+# The w3c soft light formula is evaluated per pixel in a single pass from the uint8 layers to the
+# uint8 result, the rows being blended in parallel. The kernel is compiled by Numba on first use,
+# and cached on disk next to this module. Numba is optional, the NumPy kernel is used without it.
+# NumPy kernel (numpy)
+# The SoftLight function of the calling script is applied to a few rows at a time, bounding the
+# float64 temporaries it creates to those of the rows, about 192 bytes per pixel of the rows, which
+# GetSoftLightBlendBytes estimates for the memory budget of the calling script.
+# Both kernels give the same values as SoftLight, converted to uint8 as the calling script does.
+#
+# Usage: Imported by BatchProcessingPIL.py and BatchProcessingOpenCV.py when run with the
+# --blend-kernel option
+#        python SoftLightKernel.py (checks the kernels against the SoftLight of the PIL and OpenCV
+#        scripts, and times them)
+# *****
+
+
+
+import sys
+import time
+import importlib
+import importlib.util
+import numpy as np
+
+
+
+softLightKernels = ("numpy", "numba")
+
+softLightKernelRows = 64        # Rows blended at once by the NumPy kernel
+softLightRowBytesPerPixel = 192 # Bytes per pixel of the float64 temporaries (about 8 of 3 channels) of the rows blended at once by the NumPy kernel
+
+compiledKernels = {}            # Kernel compiled by Numba, None if Numba is not installed
+
+kernelCheckBackends = {"pil": ("BatchProcessingPIL", False), "opencv": ("BatchProcessingOpenCV", True)}     # Module and rounding of the SoftLight checked
+kernelTimingMegapixels = 4      # Size of the overlay blended to time the kernels
+
+
+
+# *****
+# GetCompiledSoftLightKernel
+#
+# Description: Compiles the soft light kernel with Numba on first use, Numba being imported then
+#
+# Returns: Compiled function (top array, bottom array, round values, out array) over three dimensional
+# arrays of the same shape, or None if Numba is not installed
+# *****
+def GetCompiledSoftLightKernel():
+
+    if "softLight" in compiledKernels:
+        return compiledKernels["softLight"]
+
+    try:
+        import numba
+    except ImportError:
+        print("Numba is not installed, the numpy soft light kernel is used instead")
+        compiledKernels["softLight"] = None
+        return None
+
+    @numba.njit(parallel=True, cache=True)
+    def SoftLightKernel(inTopArray, inBottomArray, inRoundValues, outArray):
+
+        numRows, numColumns, numChannels = outArray.shape
+
+        for y in numba.prange(numRows):
+            for x in range(numColumns):
+                for c in range(numChannels):
+
+                    # Same operations, in the same order, as SoftLightF and SoftLightG
+                    top = inTopArray[y, x, c] / 255.0
+                    bottom = inBottomArray[y, x, c] / 255.0
+
+                    if bottom <= 0.25:
+                        softLightG = ((16 * bottom - 12) * bottom + 4) * bottom
+                    else:
+                        softLightG = np.sqrt(bottom)
+
+                    if top <= 0.5:
+                        softLight = bottom - ((1 - (2 * top)) * bottom * (1 - bottom))
+                    else:
+                        softLight = bottom + (2 * top - 1) * (softLightG - bottom)
+
+                    softLight = softLight * 255.0
+                    if inRoundValues:
+                        softLight = np.rint(softLight)
+
+                    outArray[y, x, c] = np.uint8(min(max(softLight, 0.0), 255.0))
+
+    compiledKernels["softLight"] = SoftLightKernel
+
+    return SoftLightKernel
+
+
+# *****
+# SoftLightBlend
+#
+# Description: Blends two uint8 layers using soft light
+#
+# Parameters:
+#    inSoftLightFunc : SoftLight function of the calling script, taking top and bottom arrays with
+#                      color values between 0 and 255, used by the NumPy kernel
+#    inTopArray : Top layer as a uint8 array, of at least three dimensions once broadcast with the
+#                 bottom layer (e.g. a (height, width, 3) overlay, or a color of shape (3,))
+#    inBottomArray : Bottom layer as a uint8 array (e.g. an image, or a greyscale image of shape
+#                    (height, width, 1))
+#    inRoundValues : Round blended values to the nearest integer (as cv2.imwrite does), otherwise
+#                    truncate them (as astype('uint8') does)
+#    inOutArray : Optional preallocated uint8 array of the broadcast shape for the result
+#    inKernel : One of softLightKernels
+#
+# Returns: Blended image as a uint8 array of the broadcast shape of the layers
+# *****
+def SoftLightBlend(inSoftLightFunc, inTopArray, inBottomArray, inRoundValues=False, inOutArray=None, inKernel="numba"):
+
+    blendShape = np.broadcast(inTopArray, inBottomArray).shape
+    blendArray = np.empty(blendShape, np.uint8) if inOutArray is None else inOutArray
+
+    # Leading dimensions (images of a stack) are blended as more rows
+    rowsShape = (-1,) + blendShape[-2:]
+    topRows = np.broadcast_to(inTopArray, blendShape).reshape(rowsShape)
+    bottomRows = np.broadcast_to(inBottomArray, blendShape).reshape(rowsShape)
+    blendRows = blendArray.reshape(rowsShape)
+
+    softLightKernel = GetCompiledSoftLightKernel() if inKernel == "numba" else None
+
+    if softLightKernel is not None:
+        softLightKernel(topRows, bottomRows, inRoundValues, blendRows)
+        return blendArray
+
+    for rowY0 in range(0, blendRows.shape[0], softLightKernelRows):
+
+        rowY1 = rowY0 + softLightKernelRows
+        softLightArray = inSoftLightFunc(topRows[rowY0:rowY1], bottomRows[rowY0:rowY1])
+
+        if inRoundValues:
+            np.rint(softLightArray, out=softLightArray)
+
+        blendRows[rowY0:rowY1] = np.clip(softLightArray, 0, 255, out=softLightArray)
+
+    return blendArray
+
+
+# *****
+# GetSoftLightBlendBytes
+#
+# Description: Estimates the memory of the temporaries of a kernel blending an image, those of the
+# NumPy kernel being bounded by the rows blended at once
+#
+# Parameters:
+#    inKernel : One of softLightKernels
+#    inWidth : Width of the image
+#    inHeight : Height of the image
+#
+# Returns: Number of bytes, 0 for the compiled kernel
+# *****
+def GetSoftLightBlendBytes(inKernel, inWidth, inHeight):
+
+    # Without Numba the numba kernel falls back to the NumPy kernel
+    if inKernel == "numba" and importlib.util.find_spec("numba") is not None:
+        return 0
+
+    return min(inHeight, softLightKernelRows) * inWidth * softLightRowBytesPerPixel
+
+
+# *****
+# CheckSoftLightKernel
+#
+# Description: Compares a kernel with a SoftLight function over every pair of top and bottom values
+#
+# Parameters:
+#    inSoftLightFunc : SoftLight function of a calling script
+#    inRoundValues : Rounding of the calling script, see SoftLightBlend
+#    inKernel : One of softLightKernels
+#
+# Returns: Number of the 65536 pairs of values blended differently
+# *****
+def CheckSoftLightKernel(inSoftLightFunc, inRoundValues, inKernel):
+
+    topArray, bottomArray = np.meshgrid(np.arange(256, dtype=np.uint8), np.arange(256, dtype=np.uint8), indexing="ij")
+    topArray = topArray[:, :, np.newaxis]
+    bottomArray = bottomArray[:, :, np.newaxis]
+
+    referenceArray = inSoftLightFunc(topArray, bottomArray)
+    if inRoundValues:
+        referenceArray = np.rint(referenceArray)
+    referenceArray = np.clip(referenceArray, 0, 255).astype(np.uint8)
+
+    return int(np.count_nonzero(SoftLightBlend(inSoftLightFunc, topArray, bottomArray, inRoundValues, inKernel=inKernel) != referenceArray))
+
+
+# *****
+# TimeSoftLightKernel
+#
+# Description: Times the blend of a random overlay with a random image
+#
+# Parameters:
+#    inSoftLightFunc : SoftLight function of a calling script
+#    inRoundValues : Rounding of the calling script, see SoftLightBlend
+#    inKernel : One of softLightKernels, None for the SoftLight function over the whole image
+#
+# Returns: Blend time in seconds, best of three
+# *****
+def TimeSoftLightKernel(inSoftLightFunc, inRoundValues, inKernel):
+
+    imgHeight = 1000
+    imgWidth = kernelTimingMegapixels * 1000
+    randomState = np.random.RandomState(2016)
+    topArray = randomState.randint(0, 256, (imgHeight, imgWidth, 3)).astype(np.uint8)
+    bottomArray = randomState.randint(0, 256, (imgHeight, imgWidth, 3)).astype(np.uint8)
+    blendArray = np.empty_like(topArray)
+
+    blendSeconds = []
+
+    for timingRun in range(3):
+
+        startTime = time.perf_counter()
+        if inKernel is None:
+            softLightArray = inSoftLightFunc(topArray, bottomArray)
+            if inRoundValues:
+                softLightArray = np.rint(softLightArray)
+            blendArray[...] = np.clip(softLightArray, 0, 255)
+        else:
+            SoftLightBlend(inSoftLightFunc, topArray, bottomArray, inRoundValues, blendArray, inKernel)
+        blendSeconds.append(time.perf_counter() - startTime)
+
+    return min(blendSeconds)
+
+
+# *****
+# Main
+#
+# Description: Checks the kernels against the SoftLight function of the PIL and OpenCV scripts,
+# those that can be imported, and times them
+# *****
+def Main():
+
+    kernelsMatch = True
+
+    for backendName in sorted(kernelCheckBackends):
+
+        backendModuleName, roundValues = kernelCheckBackends[backendName]
+
+        try:
+            backendModule = importlib.import_module(backendModuleName)
+        except ImportError as err:
+            print(backendName + ": not checked (" + str(err) + ")")
+            continue
+
+        # Compiled (and the compilation cached) before it is timed
+        for kernelName in softLightKernels:
+            numDiffs = CheckSoftLightKernel(backendModule.SoftLight, roundValues, kernelName)
+            kernelsMatch = kernelsMatch and numDiffs == 0
+            print("{}: {} kernel, {} of 65536 values differ from SoftLight".format(backendName, kernelName, numDiffs))
+
+        for kernelName in (None,) + softLightKernels:
+            blendSeconds = TimeSoftLightKernel(backendModule.SoftLight, roundValues, kernelName)
+            print("{}: {:<10} {:8.1f} ms per {} megapixels".format(backendName, kernelName or "SoftLight", blendSeconds * 1000, kernelTimingMegapixels))
+
+    sys.exit(0 if kernelsMatch else 1)
+
+
+
+if __name__ == "__main__":
+
+    Main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module implementing the soft light blend of a constant color with a
+# greyscale image as a lookup table using NumPy (developed with & tested against Python 3.5
+# and NumPy 1.10.4)
+# Lookup table
+# When the top layer is a constant color and the bottom layer is an 8 bit greyscale image, each
+# output channel depends only on the grey value. The blend is therefore evaluated once for the
+# 256 grey levels and applied to an image as a single uint8 indexing operation.
+#
+# Usage: Imported by BatchProcessingPIL.py and BatchProcessingOpenCV.py
+# *****
+
+
+
+import numpy as np
+
+
+
+softLightLUTCache = {}     # Lookup tables already built, keyed by blend function, color and rounding
+
+
+
+# *****
+# GetSoftLightLUT
+#
+# Description: Returns the lookup table of the soft light blend of a constant color (top) with every
+# grey level (bottom), building it on first use
+#
+# Parameters:
+#    inSoftLightFunc : SoftLight function of the calling script, taking top and bottom arrays with
+#                      color values between 0 and 255
+#    inTopColor : Blend color as three channel values, in the channel order of the output image
+#    inRoundValues : Round blended values to the nearest integer (as cv2.imwrite does), otherwise
+#                    truncate them (as astype('uint8') does)
+#
+# Returns: Lookup table as a 256 x 3 uint8 array, indexed by grey level
+# *****
+def GetSoftLightLUT(inSoftLightFunc, inTopColor, inRoundValues=False):
+
+    lutKey = (inSoftLightFunc, tuple(inTopColor), inRoundValues)
+
+    if lutKey not in softLightLUTCache:
+
+        # Blend every grey level with the color using the reference implementation
+        greyLevelArray = np.repeat(np.arange(256, dtype=np.float64).reshape(256, 1), 3, axis=1)
+        topColorArray = np.tile(np.asarray(inTopColor, dtype=np.float64), (256, 1))
+
+        softLightArray = inSoftLightFunc(topColorArray, greyLevelArray)
+
+        if inRoundValues:
+            softLightArray = np.rint(softLightArray)
+
+        softLightLUTCache[lutKey] = np.clip(softLightArray, 0, 255).astype(np.uint8)
+
+    return softLightLUTCache[lutKey]
+
+
+# *****
+# ApplySoftLightLUT
+#
+# Description: Blends a greyscale image with the color of a lookup table
+#
+# Parameters:
+#    inGreyArray : Greyscale image as a two dimensional uint8 array
+#    inSoftLightLUT : Lookup table returned by GetSoftLightLUT
+#    inOutArray : Optional preallocated uint8 array of shape (height, width, 3) for the result
+#
+# Returns: Blended image as a uint8 array of shape (height, width, 3)
+# *****
+def ApplySoftLightLUT(inGreyArray, inSoftLightLUT, inOutArray=None):
+
+    return np.take(inSoftLightLUT, inGreyArray, axis=0, out=inOutArray)
@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to time the stages of the batch processing of images and report
+# the results (developed with & tested against Python 3.5)
+# Instrumentation
+# Each stage (decode, resize, desaturate, blur, blend, sepia, encode) of each image is timed with its
+# wall time, CPU time of the running thread, bytes read and written and pixel count, and added as it
+# ends to running aggregates of its stage: counts, sums and a histogram of the wall times, so that
+# the memory used does not grow with the number of images. A stage ending on an error is counted too,
+# flagged as such. Timing costs two clock reads and a few additions per stage, and nothing when
+# instrumentation is disabled. The record of each stage of each image can be kept as well, on request.
+# Report
+# At the end of a run the aggregates are reported per stage, with wall time percentiles estimated
+# from the histogram, as a JSON report and/or as Prometheus text format metrics. The images are
+# counted by their first load, decode or cacheLoad when their pixels are mapped from the pixel cache.
+#
+# Usage: Imported by BatchProcessingPIL.py, BatchProcessingOpenCV.py and BatchProcessingImageMagick.py,
+# enabled by their --report-json and --report-prometheus options, --report-records keeping the records
+# *****
+
+
+
+import os
+import json
+import time
+import bisect
+import threading
+import contextlib
+
+
+
+threadCPUTime = getattr(time, "thread_time", time.process_time)    # CPU time of the running thread where available
+
+instrumentationState = {"enabled": False, "keepRecords": False, "runStartTime": None}
+stageTimes = {"images": 0, "stages": {}, "records": []}    # Aggregates per stage and kept records, updated under stageTimesLock
+stageTimesLock = threading.Lock()
+currentImage = threading.local()        # Path and file name of the image being processed, and last image loaded, by the running thread
+imageLoadStages = ("decode", "cacheLoad")   # Stages loading the pixels of an image, decoded or mapped from the pixel cache
+
+stageHistogramBounds = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)   # Upper bounds of the wall time buckets, in seconds
+stageSumKeys = ("wallSeconds", "cpuSeconds", "pixels", "bytesRead", "bytesWritten")                     # Summed per stage
+reportPercentiles = (50, 90, 99)        # Wall time percentiles reported per stage
+prometheusMetricPrefix = "mdt_batch_"   # Prefix of the Prometheus metric names
+
+
+
+# *****
+# EnableInstrumentation
+#
+# Description: Enables or disables the timing of stages, enabling starts timing the run
+#
+# Parameters:
+#    inEnabled : True to time stages
+#    inKeepRecords : True to also keep the record of each stage of each image, for the JSON report
+# *****
+def EnableInstrumentation(inEnabled=True, inKeepRecords=False):
+
+    instrumentationState["enabled"] = inEnabled
+    instrumentationState["keepRecords"] = inEnabled and inKeepRecords
+
+    if inEnabled and instrumentationState["runStartTime"] is None:
+        instrumentationState["runStartTime"] = time.time()
+
+
+# *****
+# ResetInstrumentation
+#
+# Description: Discards the stage times and the run start time, so that a process running many
+# batches reports each batch on its own
+# *****
+def ResetInstrumentation():
+
+    with stageTimesLock:
+        stageTimes["images"] = 0
+        stageTimes["stages"].clear()
+        del stageTimes["records"][:]
+
+    instrumentationState["runStartTime"] = None
+
+
+# *****
+# IsInstrumentationEnabled
+#
+# Description: Tells whether stages are being timed
+#
+# Returns: True if stages are being timed
+# *****
+def IsInstrumentationEnabled():
+
+    return instrumentationState["enabled"]
+
+
+# *****
+# GetInstrumentationSettings
+#
+# Description: Settings of the instrumentation, to enable it the same way in worker processes
+#
+# Returns: Tuple of the arguments of EnableInstrumentation
+# *****
+def GetInstrumentationSettings():
+
+    return (instrumentationState["enabled"], instrumentationState["keepRecords"])
+
+
+# *****
+# SetCurrentImage
+#
+# Description: Sets the image that the stages subsequently timed by the running thread belong to
+#
+# Parameters:
+#    inImageFN : Path and file name of the input image
+# *****
+def SetCurrentImage(inImageFN):
+
+    currentImage.imageFN = inImageFN
+
+
+# *****
+# NewStageAggregate
+#
+# Description: Empty aggregate of the times of a stage
+#
+# Returns: Dictionary of the count, error count, sums and wall time bucket counts of the stage
+# *****
+def NewStageAggregate():
+
+    stageAggregate = {"count": 0, "errors": 0, "wallSecondsBuckets": [0] * (len(stageHistogramBounds) + 1)}
+    for sumKey in stageSumKeys:
+        stageAggregate[sumKey] = 0
+
+    return stageAggregate
+
+
+# *****
+# AddStageRecord
+#
+# Description: Adds the record of a stage to the aggregates of its stage, and keeps it if requested
+#
+# Parameters:
+#    inStageRecord : Dictionary record of the stage, see TimeStage
+# *****
+def AddStageRecord(inStageRecord):
+
+    # An image is counted once its first load ends, an image may be decoded at many resolutions, or
+    # decoded once its cached pixels could not be mapped
+    isNewImage = inStageRecord["stage"] in imageLoadStages and getattr(currentImage, "loadedImageFN", None) != inStageRecord["image"]
+    if isNewImage:
+        currentImage.loadedImageFN = inStageRecord["image"]
+
+    bucketIndex = bisect.bisect_left(stageHistogramBounds, inStageRecord["wallSeconds"])
+
+    with stageTimesLock:
+
+        stageAggregate = stageTimes["stages"].get(inStageRecord["stage"])
+        if stageAggregate is None:
+            stageAggregate = stageTimes["stages"][inStageRecord["stage"]] = NewStageAggregate()
+
+        stageAggregate["count"] += 1
+        stageAggregate["errors"] += inStageRecord["error"]
+        stageAggregate["wallSecondsBuckets"][bucketIndex] += 1
+        for sumKey in stageSumKeys:
+            stageAggregate[sumKey] += inStageRecord[sumKey]
+
+        stageTimes["images"] += isNewImage
+
+        if instrumentationState["keepRecords"]:
+            stageTimes["records"].append(inStageRecord)
+
+
+# *****
+# TimeStage
+#
+# Description: Context manager timing a stage. The yielded record can be updated with the pixels
+# and bytes of the stage before the context ends. A stage raising an exception is recorded with its
+# error flag set, and the exception raised again
+#
+# Parameters:
+#    inStageName : Name of the stage (decode, resize, desaturate, blur, blend, sepia, encode)
+#    inPixels : Number of pixels processed by the stage, if already known
+#
+# Returns: Dictionary record of the stage with pixels, bytesRead and bytesWritten keys
+# *****
+@contextlib.contextmanager
+def TimeStage(inStageName, inPixels=0):
+
+    stageRecord = {"pixels": inPixels, "bytesRead": 0, "bytesWritten": 0}
+
+    if not instrumentationState["enabled"]:
+        yield stageRecord
+        return
+
+    startWallTime = time.perf_counter()
+    startCPUTime = threadCPUTime()
+    stageRecord["error"] = True
+
+    try:
+        yield stageRecord
+        stageRecord["error"] = False
+    finally:
+        stageRecord["wallSeconds"] = time.perf_counter() - startWallTime
+        stageRecord["cpuSeconds"] = threadCPUTime() - startCPUTime
+        stageRecord["stage"] = inStageName
+        stageRecord["image"] = getattr(currentImage, "imageFN", None)
+        AddStageRecord(stageRecord)
+
+
+# *****
+# TakeStageTimes
+#
+# Description: Removes and returns the stage times so far, used to pass them from worker processes
+#
+# Returns: Dictionary of the number of images, the aggregates per stage and the kept records
+# *****
+def TakeStageTimes():
+
+    with stageTimesLock:
+        takenTimes = {"images": stageTimes["images"], "stages": dict(stageTimes["stages"]), "records": list(stageTimes["records"])}
+        stageTimes["images"] = 0
+        stageTimes["stages"].clear()
+        del stageTimes["records"][:]
+
+    return takenTimes
+
+
+# *****
+# AddStageTimes
+#
+# Description: Adds stage times taken elsewhere (by a worker process)
+#
+# Parameters:
+#    inStageTimes : Dictionary of the stage times, see TakeStageTimes
+# *****
+def AddStageTimes(inStageTimes):
+
+    with stageTimesLock:
+
+        for stageName, addedAggregate in inStageTimes["stages"].items():
+
+            stageAggregate = stageTimes["stages"].get(stageName)
+            if stageAggregate is None:
+                stageAggregate = stageTimes["stages"][stageName] = NewStageAggregate()
+
+            for aggregateKey in ("count", "errors") + stageSumKeys:
+                stageAggregate[aggregateKey] += addedAggregate[aggregateKey]
+            for bucketIndex, bucketCount in enumerate(addedAggregate["wallSecondsBuckets"]):
+                stageAggregate["wallSecondsBuckets"][bucketIndex] += bucketCount
+
+        stageTimes["images"] += inStageTimes["images"]
+        stageTimes["records"].extend(inStageTimes["records"])
+
+
+# *****
+# ForgetParentStageTimes
+#
+# Description: Discards the stage times inherited by a forked worker process, which are its parent's
+# to report, with a new lock as the parent's may have been held by another of its threads
+# *****
+def ForgetParentStageTimes():
+
+    global stageTimesLock
+
+    stageTimesLock = threading.Lock()
+    stageTimes["images"] = 0
+    stageTimes["stages"].clear()
+    del stageTimes["records"][:]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ForgetParentStageTimes)
+
+
+# *****
+# GetPercentile
+#
+# Description: Nearest rank percentile of sorted values
+#
+# Parameters:
+#    inSortedValues : Values sorted in increasing order, not empty
+#    inPercentile : Percentile between 0 and 100
+#
+# Returns: The percentile value
+# *****
+def GetPercentile(inSortedValues, inPercentile):
+
+    rankIndex = max(0, int(-(-inPercentile * len(inSortedValues) // 100)) - 1)
+
+    return inSortedValues[min(rankIndex, len(inSortedValues) - 1)]
+
+
+# *****
+# GetBucketPercentile
+#
+# Description: Percentile of values counted in histogram buckets, interpolated linearly within the
+# bucket of its rank as Prometheus does
+#
+# Parameters:
+#    inBucketCounts : Number of values in each bucket of stageHistogramBounds, then above the last bound
+#    inPercentile : Percentile between 0 and 100
+#
+# Returns: The percentile value, the last bound for values above it, 0 if no values
+# *****
+def GetBucketPercentile(inBucketCounts, inPercentile):
+
+    rank = inPercentile / 100.0 * sum(inBucketCounts)
+    lowerBound = 0.0
+    lowerCount = 0
+
+    for upperBound, bucketCount in zip(stageHistogramBounds, inBucketCounts):
+
+        if bucketCount and lowerCount + bucketCount >= rank:
+            return lowerBound + (upperBound - lowerBound) * (rank - lowerCount) / bucketCount
+
+        lowerBound = upperBound
+        lowerCount += bucketCount
+
+    return lowerBound if lowerCount < rank else 0.0
+
+
+# *****
+# SummariseStages
+#
+# Description: Summarises the stage times per stage name
+#
+# Returns: Dictionary of stage summaries keyed by stage name
+# *****
+def SummariseStages():
+
+    with stageTimesLock:
+        stageSummaries = dict((stageName, dict(stageAggregate, wallSecondsBuckets=list(stageAggregate["wallSecondsBuckets"]))) for stageName, stageAggregate in stageTimes["stages"].items())
+
+    for stageSummary in stageSummaries.values():
+
+        stageSummary["wallSecondsPercentiles"] = dict((str(percentile), GetBucketPercentile(stageSummary["wallSecondsBuckets"], percentile)) for percentile in reportPercentiles)
+        stageSummary["megapixelsPerSecond"] = stageSummary["pixels"] / 1e6 / stageSummary["wallSeconds"] if stageSummary["wallSeconds"] > 0 else 0.0
+
+    return stageSummaries
+
+
+# *****
+# WriteJSONReport
+#
+# Description: Writes the run report, stage summaries and the kept per image stage records, as JSON
+#
+# Parameters:
+#    inReportFN : Path and file name of the report
+# *****
+def WriteJSONReport(inReportFN):
+
+    with stageTimesLock:
+        reportedImages = stageTimes["images"]
+        reportedRecords = list(stageTimes["records"])
+
+    runStartTime = instrumentationState["runStartTime"]
+    runReport = {
+        "runStartTime": runStartTime,
+        "runWallSeconds": time.time() - runStartTime if runStartTime is not None else 0.0,
+        "images": reportedImages,
+        "wallSecondsBucketBounds": list(stageHistogramBounds),
+        "stages": SummariseStages(),
+    }
+
+    if instrumentationState["keepRecords"]:
+        runReport["records"] = reportedRecords
+
+    with open(inReportFN, "w") as reportFile:
+        json.dump(runReport, reportFile, indent=2, sort_keys=True)
+
+
+# *****
+# WritePrometheusReport
+#
+# Description: Writes the stage summaries as Prometheus text format metrics
+#
+# Parameters:
+#    inReportFN : Path and file name of the report, e.g. in the directory of the node exporter textfile collector
+# *****
+def WritePrometheusReport(inReportFN):
+
+    stageSummaries = SummariseStages()
+    reportLines = []
+
+    reportLines.append("# HELP " + prometheusMetricPrefix + "stage_wall_seconds Wall time per image of each processing stage")
+    reportLines.append("# TYPE " + prometheusMetricPrefix + "stage_wall_seconds histogram")
+    for stageName in sorted(stageSummaries):
+        stageSummary = stageSummaries[stageName]
+        cumulativeCount = 0
+        for upperBound, bucketCount in zip(stageHistogramBounds + (float("inf"),), stageSummary["wallSecondsBuckets"]):
+            cumulativeCount += bucketCount
+            reportLines.append(prometheusMetricPrefix + "stage_wall_seconds_bucket{stage=\"" + stageName + "\",le=\"" + ("+Inf" if upperBound == float("inf") else repr(upperBound)) + "\"} " + str(cumulativeCount))
+        reportLines.append(prometheusMetricPrefix + "stage_wall_seconds_sum{stage=\"" + stageName + "\"} " + repr(stageSummary["wallSeconds"]))
+        reportLines.append(prometheusMetricPrefix + "stage_wall_seconds_count{stage=\"" + stageName + "\"} " + str(stageSummary["count"]))
+
+    counterMetrics = [
+        ("stage_errors_total", "errors", "Processing stages ended by an error"),
+        ("stage_cpu_seconds_total", "cpuSeconds", "CPU time of each processing stage"),
+        ("stage_pixels_total", "pixels", "Pixels processed by each processing stage"),
+        ("stage_read_bytes_total", "bytesRead", "Bytes read by each processing stage"),
+        ("stage_written_bytes_total", "bytesWritten", "Bytes written by each processing stage"),
+    ]
+
+    for metricName, summaryKey, metricHelp in counterMetrics:
+        reportLines.append("# HELP " + prometheusMetricPrefix + metricName + " " + metricHelp)
+        reportLines.append("# TYPE " + prometheusMetricPrefix + metricName + " counter")
+        for stageName in sorted(stageSummaries):
+            reportLines.append(prometheusMetricPrefix + metricName + "{stage=\"" + stageName + "\"} " + repr(stageSummaries[stageName][summaryKey]))
+
+    # Written to a temporary file then renamed, so a collector never reads a partial file
+    with open(inReportFN + ".tmp", "w") as reportFile:
+        reportFile.write("\n".join(reportLines) + "\n")
+    os.replace(inReportFN + ".tmp", inReportFN)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to apply an effect to an image in horizontal strips, bounding the
+# memory used by very large images (developed with & tested against Python 3.5 and NumPy 1.10.4)
+# Strips
+# The image is processed from top to bottom, one strip of rows at a time. A filter reaching
+# halo rows above and below each row (the blur of the sepia tone effect) is applied to the strip
+# extended by its halo, so the rows of the strip get the same values as when filtering the whole
+# image. The result of each strip overwrites the rows of the input image, which are no longer
+# needed: the halo rows above the strip were converted before being overwritten and are carried
+# over from the previous strip. Beyond the decoded image, memory is O(width x strip height).
+#
+# Usage: Imported by BatchProcessingPIL.py and BatchProcessingOpenCV.py when run with the
+# --strip-height option
+# *****
+
+
+
+import collections
+
+
+
+gaussianTruncate = 4.0      # Radius of scipy's gaussian_filter, in standard deviations
+
+# Rows [stripY0, stripY1) of a strip, extended to [haloY0, haloY1) by the halo within the image
+ImageStrip = collections.namedtuple("ImageStrip", ["stripY0", "stripY1", "haloY0", "haloY1"])
+
+
+
+# *****
+# GetGaussianHalo
+#
+# Description: Number of rows reached above and below each row by scipy's gaussian_filter
+#
+# Parameters:
+#    inSigma : Standard deviation of the Gaussian
+#
+# Returns: The halo as a number of rows
+# *****
+def GetGaussianHalo(inSigma):
+
+    return int(gaussianTruncate * inSigma + 0.5)
+
+
+# *****
+# IterateStrips
+#
+# Description: Splits the rows of an image into strips, from top to bottom
+#
+# Parameters:
+#    inImageHeight : Height of the image
+#    inStripHeight : Number of rows per strip, raised to the halo so that only the previous strip is carried over
+#    inHalo : Number of rows reached above and below each row by the filter
+#
+# Returns: Generator of ImageStrip
+# *****
+def IterateStrips(inImageHeight, inStripHeight, inHalo):
+
+    stripHeight = max(inStripHeight, inHalo, 1)
+
+    for stripY0 in range(0, inImageHeight, stripHeight):
+
+        stripY1 = min(stripY0 + stripHeight, inImageHeight)
+
+        yield ImageStrip(stripY0, stripY1, max(stripY0 - inHalo, 0), min(stripY1 + inHalo, inImageHeight))
+
+
+# *****
+# GetStripBufferShape
+#
+# Description: Shape of a buffer holding any strip of an image and its halo
+#
+# Parameters:
+#    inImageWidth : Width of the image
+#    inImageHeight : Height of the image
+#    inStripHeight : Number of rows per strip, as passed to IterateStrips
+#    inHalo : Number of rows reached above and below each row by the filter
+#
+# Returns: Tuple (rows, width)
+# *****
+def GetStripBufferShape(inImageWidth, inImageHeight, inStripHeight, inHalo):
+
+    return (min(max(inStripHeight, inHalo, 1) + 2 * inHalo, inImageHeight), inImageWidth)
+
+
+# *****
+# CarryHaloRows
+#
+# Description: Moves the rows above a strip, converted with the previous strip, to the top of the buffer
+#
+# Parameters:
+#    inStripRows : Buffer holding the rows of the previous strip and its halo from its first row
+#    inPrevStrip : The previous ImageStrip, None for the first strip
+#    inStrip : The ImageStrip about to be processed
+#
+# Returns: Number of rows carried over, the rows of the strip from stripY0 go after them
+# *****
+def CarryHaloRows(inStripRows, inPrevStrip, inStrip):
+
+    numCarriedRows = inStrip.stripY0 - inStrip.haloY0
+
+    if inPrevStrip is not None and numCarriedRows > 0:
+        carryRow = inStrip.haloY0 - inPrevStrip.haloY0
+        inStripRows[:numCarriedRows] = inStripRows[carryRow:carryRow + numCarriedRows]
+
+    return numCarriedRows
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2016, ytirahc, www.mobiledevtrek.com
+# All rights reserved. Copyright holder cannot be held liable for any damages.
+#
+# Distributed under the Apache License (ASL).
+# http://www.apache.org/licenses/
+# *****
+# Description: Python module to share the images of an input directory among many processes and
+# hosts through a work queue, an SQLite database on a shared filesystem (developed with & tested
+# against Python 3.5 and SQLite 3.24)
+# Queue
+# Every process scans the input directory and enqueues the images it finds, with their size and
+# modification time. Images already queued with the same processing parameters, size and modification
+# time are left as they are, those done or dead with other parameters or since changed are queued
+# again. Images are named relative to the input directory, which may be mounted at different paths on
+# each host.
+# Leases
+# A process claims a few pending images at a time, leased to it for a number of seconds and renewed
+# while it processes them. The images whose lease expires, such as those of a process that died, can
+# be claimed by another process. The size and modification time of an image are read again when it is
+# claimed, and it is done only if they are still those queued once it is processed, pending again
+# otherwise. Claims are serialised by the write lock of the database, which
+# needs a filesystem with working locks (local, or NFSv4), and the database is not used in WAL mode
+# as WAL does not work over network filesystems.
+# Failures
+# A failed image is pending again until it has been attempted a number of times, then it is a dead
+# letter, kept with its last error and not claimed again. An image whose leases keep expiring is a
+# dead letter too, so that an image crashing its processes does not crash every host in turn.
+#
+# Usage: Imported by BatchProcessingDriver.py when run with the --work-queue option
+# *****
+
+
+
+import os
+import time
+import socket
+import sqlite3
+import threading
+import contextlib
+
+
+
+workQueueStates = ("pending", "leased", "done", "dead")
+workQueueEnqueueChunkSize = 1000    # Images enqueued per transaction, other processes claim in between
+workQueueLockTimeout = 60           # Seconds waited for the write lock of the database
+workQueueSignatureColumns = (("imageSize", "INTEGER"), ("imageMtime", "REAL"))     # Columns of the file signature, added to older databases
+
+
+
+# *****
+# GetImageSignature
+#
+# Description: Size and modification time of an image, changed by any edit of the image
+#
+# Parameters:
+#    inImageFN : Path and file name of the image
+#
+# Returns: Tuple (size, modification time), (None, None) if the image cannot be read
+# *****
+def GetImageSignature(inImageFN):
+
+    try:
+        imageStat = os.stat(inImageFN)
+    except OSError:
+        return (None, None)
+
+    return (imageStat.st_size, imageStat.st_mtime)
+
+
+
+# *****
+# WorkQueue
+#
+# Description: Work queue of the images of an input directory, in an SQLite database
+# *****
+class WorkQueue(object):
+
+    # *****
+    # __init__
+    #
+    # Parameters:
+    #    inQueueFN : Path and file name of the database, created if missing
+    #    inImageDir : Input directory the images are named relative to
+    #    inLeaseSeconds : Duration of a lease, renewed while the images are processed
+    #    inMaxAttempts : Number of attempts after which an image is a dead letter
+    # *****
+    def __init__(self, inQueueFN, inImageDir, inLeaseSeconds=300, inMaxAttempts=3):
+
+        self.queueFN = inQueueFN
+        self.imageDir = inImageDir
+        self.leaseSeconds = inLeaseSeconds
+        self.maxAttempts = inMaxAttempts
+        self.ownerName = socket.gethostname() + ":" + str(os.getpid())
+        self.claimedSignatures = {}     # Signature of each image claimed by this process when claimed
+
+        with self.Transaction() as queueDB:
+            queueDB.execute("CREATE TABLE IF NOT EXISTS images (name TEXT PRIMARY KEY, paramsKey TEXT NOT NULL, state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, leaseOwner TEXT, leaseExpiry REAL, lastError TEXT, imageSize INTEGER, imageMtime REAL)")
+            queueDB.execute("CREATE INDEX IF NOT EXISTS imagesByState ON images (state, leaseExpiry)")
+
+            # Databases of earlier versions have no signatures, their images are queued again once
+            queueColumns = set(columnRow[1] for columnRow in queueDB.execute("PRAGMA table_info(images)"))
+            for columnName, columnType in workQueueSignatureColumns:
+                if columnName not in queueColumns:
+                    queueDB.execute("ALTER TABLE images ADD COLUMN " + columnName + " " + columnType)
+
+    # *****
+    # Transaction
+    #
+    # Description: Context manager of a write transaction on a new connection, committed when the context
+    # ends. A connection per transaction can be used from any thread and from forked worker processes
+    #
+    # Returns: sqlite3.Connection
+    # *****
+    @contextlib.contextmanager
+    def Transaction(self):
+
+        queueDB = sqlite3.connect(self.queueFN, timeout=workQueueLockTimeout, isolation_level=None)
+
+        try:
+            # Take the write lock right away, reads followed by writes could not upgrade their lock
+            queueDB.execute("BEGIN IMMEDIATE")
+            try:
+                yield queueDB
+            except BaseException:
+                queueDB.execute("ROLLBACK")
+                raise
+            queueDB.execute("COMMIT")
+        finally:
+            queueDB.close()
+
+    # *****
+    # EnqueueImages
+    #
+    # Description: Enqueues images, queued again if done or dead with other processing parameters or
+    # since changed
+    #
+    # Parameters:
+    #    inImageFNs : Iterable of the paths and file names of the images, within the input directory
+    #    inParamsKey : Key of the processing parameters, see IncrementalManifest.GetProcessingParamsKey
+    # *****
+    def EnqueueImages(self, inImageFNs, inParamsKey):
+
+        imageRows = []
+
+        for imageFN in inImageFNs:
+
+            imageRows.append((os.path.relpath(imageFN, self.imageDir),) + GetImageSignature(imageFN))
+
+            if len(imageRows) >= workQueueEnqueueChunkSize:
+                self.InsertImages(imageRows, inParamsKey)
+                imageRows = []
+
+        self.InsertImages(imageRows, inParamsKey)
+
+    # *****
+    # InsertImages
+    #
+    # Description: Inserts images in one transaction, see EnqueueImages
+    #
+    # Parameters:
+    #    inImageRows : List of (name relative to the input directory, size, modification time) of the images
+    #    inParamsKey : Key of the processing parameters
+    # *****
+    def InsertImages(self, inImageRows, inParamsKey):
+
+        if not inImageRows:
+            return
+
+        # Images pending or leased keep their state with the new signature, a leased image is then
+        # pending again once processed, see CompleteImages
+        with self.Transaction() as queueDB:
+            queueDB.executemany("INSERT INTO images (name, paramsKey, state, imageSize, imageMtime) VALUES (?, ?, 'pending', ?, ?) "
+                                "ON CONFLICT (name) DO UPDATE SET paramsKey = excluded.paramsKey, imageSize = excluded.imageSize, imageMtime = excluded.imageMtime, "
+                                "state = CASE WHEN state IN ('done', 'dead') THEN 'pending' ELSE state END, "
+                                "attempts = CASE WHEN state IN ('done', 'dead') THEN 0 ELSE attempts END, "
+                                "lastError = CASE WHEN state IN ('done', 'dead') THEN NULL ELSE lastError END "
+                                "WHERE paramsKey != excluded.paramsKey OR imageSize IS NOT excluded.imageSize OR imageMtime IS NOT excluded.imageMtime",
+                                [(imageName, inParamsKey, imageSize, imageMtime) for imageName, imageSize, imageMtime in inImageRows])
+
+    # *****
+    # RetryDeadImages
+    #
+    # Description: Makes the dead letters pending again, with their attempts reset
+    #
+    # Returns: Number of images made pending
+    # *****
+    def RetryDeadImages(self):
+
+        with self.Transaction() as queueDB:
+            return queueDB.execute("UPDATE images SET state = 'pending', attempts = 0 WHERE state = 'dead'").rowcount
+
+    # *****
+    # ClaimImages
+    #
+    # Description: Leases pending images, and images whose lease expired, to this process, with their
+    # signature read again as they may have changed since they were queued
+    #
+    # Parameters:
+    #    inNumImages : Maximum number of images claimed
+    #
+    # Returns: List of the paths and file names of the claimed images, empty once no image is left to
+    # claim (images leased to other processes may still be made pending by a failure)
+    # *****
+    def ClaimImages(self, inNumImages):
+
+        claimTime = time.time()
+
+        with self.Transaction() as queueDB:
+
+            # Images whose leases kept expiring are dead letters rather than claimed again
+            queueDB.execute("UPDATE images SET state = 'dead', lastError = 'lease expired' WHERE state = 'leased' AND leaseExpiry < ? AND attempts >= ?", (claimTime, self.maxAttempts))
+
+            imageNames = [imageRow[0] for imageRow in queueDB.execute("SELECT name FROM images WHERE state = 'pending' OR (state = 'leased' AND leaseExpiry < ?) ORDER BY rowid LIMIT ?", (claimTime, inNumImages))]
+
+            imageFNs = [os.path.join(self.imageDir, imageName) for imageName in imageNames]
+            for imageFN in imageFNs:
+                self.claimedSignatures[imageFN] = GetImageSignature(imageFN)
+
+            queueDB.executemany("UPDATE images SET state = 'leased', attempts = attempts + 1, leaseOwner = ?, leaseExpiry = ?, imageSize = ?, imageMtime = ? WHERE name = ?", [(self.ownerName, claimTime + self.leaseSeconds) + self.claimedSignatures[imageFN] + (imageName,) for imageFN, imageName in zip(imageFNs, imageNames)])
+
+        return imageFNs
+
+    # *****
+    # RenewLeases
+    #
+    # Description: Extends the leases of images still leased to this process
+    #
+    # Parameters:
+    #    inImageFNs : Paths and file names of the images
+    # *****
+    def RenewLeases(self, inImageFNs):
+
+        leaseExpiry = time.time() + self.leaseSeconds
+
+        with self.Transaction() as queueDB:
+            queueDB.executemany("UPDATE images SET leaseExpiry = ? WHERE name = ? AND state = 'leased' AND leaseOwner = ?", [(leaseExpiry, os.path.relpath(imageFN, self.imageDir), self.ownerName) for imageFN in inImageFNs])
+
+    # *****
+    # ReleaseImages
+    #
+    # Description: Makes images leased to this process but not attempted pending again, without
+    # counting an attempt
+    #
+    # Parameters:
+    #    inImageFNs : Paths and file names of the images
+    # *****
+    def ReleaseImages(self, inImageFNs):
+
+        with self.Transaction() as queueDB:
+            queueDB.executemany("UPDATE images SET state = 'pending', attempts = attempts - 1, leaseOwner = NULL, leaseExpiry = NULL WHERE name = ? AND state = 'leased' AND leaseOwner = ?", [(os.path.relpath(imageFN, self.imageDir), self.ownerName) for imageFN in inImageFNs])
+
+        for imageFN in inImageFNs:
+            self.claimedSignatures.pop(imageFN, None)
+
+    # *****
+    # CompleteImages
+    #
+    # Description: Records the outcome of the images processed by this process
+    #
+    # Parameters:
+    #    inDoneImageFNs : Paths and file names of the images processed, done even if their lease was
+    #                     taken over by another process as the results are the same, unless the image
+    #                     was queued again with another signature since it was claimed, then pending
+    #                     again without counting an attempt if still leased to this process
+    #    inFailedImages : List of (path and file name, error) of the images that could not be
+    #                     processed, pending again or dead letters if still leased to this process
+    # *****
+    def CompleteImages(self, inDoneImageFNs, inFailedImages=()):
+
+        doneImageRows = [(os.path.relpath(imageFN, self.imageDir),) + self.claimedSignatures.get(imageFN, (None, None)) for imageFN in inDoneImageFNs]
+
+        with self.Transaction() as queueDB:
+            queueDB.executemany("UPDATE images SET state = 'done', leaseOwner = NULL, leaseExpiry = NULL, lastError = NULL WHERE name = ? AND imageSize IS ? AND imageMtime IS ?", doneImageRows)
+            queueDB.executemany("UPDATE images SET state = 'pending', attempts = attempts - 1, leaseOwner = NULL, leaseExpiry = NULL WHERE name = ? AND state = 'leased' AND leaseOwner = ?", [(imageName, self.ownerName) for imageName, imageSize, imageMtime in doneImageRows])
+            queueDB.executemany("UPDATE images SET state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, leaseOwner = NULL, leaseExpiry = NULL, lastError = ? WHERE name = ? AND state = 'leased' AND leaseOwner = ?", [(self.maxAttempts, errorStr, os.path.relpath(imageFN, self.imageDir), self.ownerName) for imageFN, errorStr in inFailedImages])
+
+        for imageFN in list(inDoneImageFNs) + [imageFN for imageFN, errorStr in inFailedImages]:
+            self.claimedSignatures.pop(imageFN, None)
+
+    # *****
+    # GetStateCounts
+    #
+    # Description: Number of images per state
+    #
+    # Returns: Dictionary of the number of images per state of workQueueStates
+    # *****
+    def GetStateCounts(self):
+
+        with self.Transaction() as queueDB:
+            stateCounts = dict(queueDB.execute("SELECT state, COUNT(*) FROM images GROUP BY state").fetchall())
+
+        return {state: stateCounts.get(state, 0) for state in workQueueStates}
+
+
+# *****
+# KeepLeases
+#
+# Description: Context manager renewing the leases of images on a thread, every third of a lease,
+# while they are processed
+#
+# Parameters:
+#    inWorkQueue : WorkQueue
+#    inImageFNs : Paths and file names of the leased images
+# *****
+@contextlib.contextmanager
+def KeepLeases(inWorkQueue, inImageFNs):
+
+    leasesProcessed = threading.Event()
+
+    def RenewLeasesUntilProcessed():
+        while not leasesProcessed.wait(inWorkQueue.leaseSeconds / 3.0):
+            try:
+                inWorkQueue.RenewLeases(inImageFNs)
+            except sqlite3.Error as err:
+                print("Unable to renew the leases of the work queue (" + str(err) + ")")
+
+    renewThread = threading.Thread(target=RenewLeasesUntilProcessed, daemon=True)
+    renewThread.start()
+
+    try:
+        yield
+    finally:
+        leasesProcessed.set()
+        renewThread.join()
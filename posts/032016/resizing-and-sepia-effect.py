@@ -11,18 +11,70 @@
 # Description: This file is a script for Adobe Photoshop (tested with Photoshop CC 2015). 
 # The current active image in Photoshop will be resized by the specified percentages
 # in the array scaleFactor and will save those files to the specified directory,  
+# Batch
+# The batch procedures load one image at a time and delete it, and its single scaled duplicate, once
+# saved, with undo disabled, so that memory does not grow over a directory. Each scaled version is
+# scaled from the previous, larger one. The functions taking inPdb do not use gimpfu otherwise, and
+# the file can be loaded outside GIMP (imp.load_source) to run them against a fake pdb.
 #
 # Usage:	Filters -> MDT -> Create Scaled Versions in Batch (to select an input directory of multiple images)
 #			Filters -> MDT -> Create Scaled Versions (for current image)
 #			Filters -> MDT -> Create Sepia Effect
+#			gimp -i -b '(python-fu-batch-resize-and-sepia RUN-NONINTERACTIVE "in" "out" 0 0.9 "resize sepia")' -b '(gimp-quit 0)'
 # *****
 
 
 import os
-from gimpfu import * 
 import ntpath
 import string
 
+try:
+	from gimpfu import * 
+except ImportError:
+	# Loaded outside GIMP to run the batch functions against a fake pdb, with the enums they use (GIMP 2.8)
+	DESATURATE_LUMINOSITY = 1
+	SOFTLIGHT_MODE = 19
+	BACKGROUND_FILL = 1
+
+
+resizePercentages = [75, 50, 25]	# Percentages to scale input images
+sepiaToneColor = (226, 89, 42)		# Color of the soft light layer of the sepia effect
+
+# Jpg encoding of the results, see file_jpeg_save
+jpegQuality = 0.9		# Quality, from 0 to 1
+jpegOptimize = 1		# Optimized Huffman tables
+jpegProgressive = 0		# Progressive scans
+jpegSubsampling = 0		# Chroma subsampling: 0 = 4:2:0, 1 = 4:2:2 horizontal, 2 = 4:4:4, 3 = 4:2:2 vertical
+
+
+# *****
+# apply_sepia_effect
+#
+# Description: Applies sepia tone effect to an image, adding a soft light color layer above a layer
+#
+# Parameters:
+#		inPdb : Procedural database, pdb in GIMP
+# 		inImg : Image
+#		inLayer : Layer of the image desaturated and blurred
+# *****
+def apply_sepia_effect(inPdb, inImg, inLayer):
+	
+	# Convert image to greyscale
+	inPdb.gimp_desaturate_full(inLayer, DESATURATE_LUMINOSITY)
+	
+	# Blur the greyscale image
+	inPdb.plug_in_gauss_iir(inImg, inLayer, 2, True, True)
+	
+	# Add color layer with soft light mode, filled without changing the background color of the user
+	sepiaColorLayer = inPdb.gimp_layer_new(inImg, inLayer.width, inLayer.height, inLayer.type, "sepia color layer", 100, SOFTLIGHT_MODE)
+	inPdb.gimp_image_insert_layer(inImg, sepiaColorLayer, None, 0)
+	inPdb.gimp_context_push()
+	try:
+		inPdb.gimp_context_set_background(sepiaToneColor)
+		inPdb.gimp_edit_fill(sepiaColorLayer, BACKGROUND_FILL)
+	finally:
+		inPdb.gimp_context_pop()
+
 
 # *****
 # create_sepia_effect
@@ -36,19 +88,7 @@ import string
 def create_sepia_effect(inGimpImg, inLayerinGimpImg):
 		
 	try:
-		
-		# Convert image to greyscale
-		pdb.gimp_desaturate_full(inLayerinGimpImg, DESATURATE_LUMINOSITY)
-		
-		# Blur the greyscale image
-		pdb.plug_in_gauss_iir(inGimpImg, inLayerinGimpImg, 2, True, True)
-		
-		# Add color layer with soft light mode
-		sepiaColorLayer = gimp.Layer(inGimpImg, "sepia color layer", inLayerinGimpImg.width, inLayerinGimpImg.height, inLayerinGimpImg.type, 100, SOFTLIGHT_MODE)
-		inGimpImg.add_layer(sepiaColorLayer, 0) 
-		pdb.gimp_context_set_background((226,89,42))
-		pdb.gimp_edit_fill(sepiaColorLayer, BACKGROUND_FILL)
-		
+		apply_sepia_effect(pdb, inGimpImg, inLayerinGimpImg)
 	except Exception as err:
 		gimp.message("Unexpected error: " + str(err))
 
@@ -62,72 +102,208 @@ def create_sepia_effect(inGimpImg, inLayerinGimpImg):
 # 		inGimpImg : Current image
 #		inLayerinGimpImg : Current layer in current image (not used)
 #		inOutputDir : Directory to save resized images
+#		inQuality : Jpg quality, from 0 to 1
 # *****
-def create_scaled_versions(inGimpImg, inLayerinGimpImg, inOutputDir):
-	resizePercentageArray = [75, 50, 25]  # Percentages to scale input image
+def create_scaled_versions(inGimpImg, inLayerinGimpImg, inOutputDir, inQuality=jpegQuality):
 	
 	gimpImgRFN = get_root_name_from_filepath(inGimpImg.filename) 
 	
-	for resizePercentage in resizePercentageArray:
-		scaledHeight = int(inGimpImg.height * resizePercentage / 100)
-		scaledWidth = int(inGimpImg.width * resizePercentage / 100)
-		outputImgFN = os.path.join(inOutputDir, gimpImgRFN) + "_" + str(resizePercentage) + "percent.jpg"
-		scale_and_save_image(inGimpImg, scaledWidth, scaledHeight, outputImgFN)
+	scale_and_save_versions(pdb, inGimpImg, resizePercentages, os.path.join(inOutputDir, gimpImgRFN), inQuality)
 
 
 # *****
-# create_scaled_versions_batch
+# find_jpeg_files
 #
-# Description: Processes a directory of images to resize and save the results
+# Description: Generator of the jpgs of a directory, yielded as each directory is read rather than
+# after listing the whole tree
 #
 # Parameters:
-# 		inGimpImg : Current image (not used)
-#		inLayerinGimpImg : Current layer in current image (not used)
-#		inInputDir : Directory with images to be resized
-#		inOutputDir : Directory to save resized images
+# 		inInputDir : Directory with images
+#		inRecursive : Also look in the subdirectories of the input directory
+#		inSkipDir : Directory not to look in, such as an output directory within the input directory
+#
+# Returns: Generator of (path and filename, directory relative to the input directory)
 # *****
-def create_scaled_versions_batch(inGimpImg, inLayerinGimpImg, inInputDir, inOutputDir):
+def find_jpeg_files(inInputDir, inRecursive, inSkipDir):
+
+	skipDirRealPath = os.path.realpath(inSkipDir)
 	
-	for fileInDir in os.listdir(inInputDir):   # Look at all files in the input directory
+	for dirPath, dirNames, fileNames in os.walk(inInputDir):
 	
-		try:
+		if inRecursive:
+			dirNames[:] = [dirName for dirName in dirNames if os.path.realpath(os.path.join(dirPath, dirName)) != skipDirRealPath]
+		else:
+			del dirNames[:]   # Do not descend into subdirectories
+		
+		relativeDir = os.path.relpath(dirPath, inInputDir)
+		
+		for fileName in fileNames:
 			
-			inputImgFN = os.path.join(inInputDir, fileInDir)
+			# Process only images that are jpgs, whatever the case of their extension
+			if fileName.lower().endswith(('.jpeg', '.jpg')):
+				yield (os.path.join(dirPath, fileName), relativeDir)
+
+
+# *****
+# process_image_file
+#
+# Description: Loads a jpg, saves its scaled versions and its sepia version, then deletes it
+#
+# Parameters:
+#		inPdb : Procedural database, pdb in GIMP
+# 		inImgFN : Path and filename of the jpg
+#		inOutputDir : Directory to save the results
+#		inResizePercentages : Percentages to scale the image, empty for none
+#		inSepia : Also save the image with the sepia tone effect
+#		inQuality : Jpg quality, from 0 to 1
+# *****
+def process_image_file(inPdb, inImgFN, inOutputDir, inResizePercentages, inSepia, inQuality=jpegQuality):
+	
+	img = inPdb.file_jpeg_load(inImgFN, inImgFN)
+	
+	try:
+		
+		# No undo steps are kept for an image only saved
+		inPdb.gimp_image_undo_disable(img)
+		
+		outputImgFNBase = os.path.join(inOutputDir, get_root_name_from_filepath(inImgFN))
+		
+		if inResizePercentages:
+			scale_and_save_versions(inPdb, img, inResizePercentages, outputImgFNBase, inQuality)
+		
+		# Last, as it changes the image
+		if inSepia:
+			apply_sepia_effect(inPdb, img, img.layers[0])
+			save_jpeg_image(inPdb, img, outputImgFNBase + "_sepia.jpg", inQuality)
+	
+	finally:
+		inPdb.gimp_image_delete(img)
+
+
+# *****
+# batch_process_directory
+#
+# Description: Processes a directory of images one at a time, see process_image_file
+#
+# Parameters:
+#		inPdb : Procedural database, pdb in GIMP
+#		inInputDir : Directory with images to be processed
+#		inOutputDir : Directory to save the results, in subdirectories mirroring those of the input directory
+#		inRecursive : Also process the images in the subdirectories of the input directory
+#		inResizePercentages : Percentages to scale the images, empty for none
+#		inSepia : Also save the images with the sepia tone effect
+#		inQuality : Jpg quality, from 0 to 1
+#
+# Returns: List of (path and filename, error) of the images that could not be processed
+# *****
+def batch_process_directory(inPdb, inInputDir, inOutputDir, inRecursive, inResizePercentages, inSepia, inQuality=jpegQuality):
+	
+	failedImages = []
+	
+	for inputImgFN, relativeDir in find_jpeg_files(inInputDir, inRecursive, inOutputDir):   # Look at the jpgs as the input directory is read
+	
+		try:
 			
-			# Process only images that are jpgs
-			inputImage = None
-			if(inputImgFN.lower().endswith(('.jpeg', '.jpg'))):
-				inputImage = pdb.file_jpeg_load(inputImgFN, inputImgFN)
+			outputDir = os.path.normpath(os.path.join(inOutputDir, relativeDir))
+			if not os.path.isdir(outputDir):
+				os.makedirs(outputDir)
 			
-			# Scale and save jpgs images
-			if(inputImage != None):
-				if(len(inputImage.layers) > 0):
-					create_scaled_versions(inputImage, inputImage.layers[0], inOutputDir)
+			process_image_file(inPdb, inputImgFN, outputDir, inResizePercentages, inSepia, inQuality)
 		
 		except Exception as err:
-			gimp.message("Unexpected error: " + str(err))
+			failedImages.append((inputImgFN, str(err)))
+	
+	return failedImages
 
 
 # *****
-# scale_and_save_image
+# create_scaled_versions_batch
 #
-# Description: Scales and input image and saves the result
+# Description: Processes a directory of images to resize and save the results
 #
 # Parameters:
-# 		inImg : Image to be resized
-#		inWidth : Resize width
-#		inHeight : Resize height
-#		inFilePathName : Path and filename to save resized image
+# 		inGimpImg : Current image (not used)
+#		inLayerinGimpImg : Current layer in current image (not used)
+#		inInputDir : Directory with images to be resized
+#		inOutputDir : Directory to save resized images, in subdirectories mirroring those of the input directory
+#		inRecursive : Also resize the images in the subdirectories of the input directory
+#		inQuality : Jpg quality, from 0 to 1
 # *****
-def scale_and_save_image(inImg, inWidth, inHeight, inFilePathName):
+def create_scaled_versions_batch(inGimpImg, inLayerinGimpImg, inInputDir, inOutputDir, inRecursive=False, inQuality=jpegQuality):
+	
+	for inputImgFN, errorStr in batch_process_directory(pdb, inInputDir, inOutputDir, inRecursive, resizePercentages, False, inQuality):
+		gimp.message("Unexpected error: " + errorStr)
 
-	# Duplicate the image & resize
-	scaledImg = pdb.gimp_channel_ops_duplicate(inImg)  # use currently loaded image
-	pdb.gimp_image_scale(scaledImg, inWidth, inHeight)
+
+# *****
+# batch_resize_and_sepia
+#
+# Description: Processes a directory of images without user interaction, for gimp -i -b
+#
+# Parameters:
+#		inInputDir : Directory with images to be processed
+#		inOutputDir : Directory to save the results, in subdirectories mirroring those of the input directory
+#		inRecursive : Also process the images in the subdirectories of the input directory
+#		inQuality : Jpg quality, from 0 to 1
+#		inOperations : Space separated operations, resize and/or sepia
+# *****
+def batch_resize_and_sepia(inInputDir, inOutputDir, inRecursive=False, inQuality=jpegQuality, inOperations="resize sepia"):
+	
+	operations = inOperations.split()
 	
-	# Save the resized image as a jpg
-	flattenedImgLayer = pdb.gimp_image_flatten(scaledImg)
-	pdb.file_jpeg_save(scaledImg, flattenedImgLayer, inFilePathName, inFilePathName, 0.9, 0, 0, 0, "Created with GIMP", 0, 0, 0, 0)	
+	for inputImgFN, errorStr in batch_process_directory(pdb, inInputDir, inOutputDir, inRecursive, resizePercentages if "resize" in operations else [], "sepia" in operations, inQuality):
+		gimp.message("Unable to process image: " + inputImgFN + " (" + errorStr + ")")
+
+
+# *****
+# scale_and_save_versions
+#
+# Description: Scales an image by percentages and saves the results, each from the previous, larger
+# one, through a single duplicate of the image deleted once done
+#
+# Parameters:
+#		inPdb : Procedural database, pdb in GIMP
+# 		inImg : Image to be resized, unchanged
+#		inResizePercentages : Percentages to scale the image
+#		inOutputImgFNBase : Path and root filename of the results, followed by _<percentage>percent.jpg
+#		inQuality : Jpg quality, from 0 to 1
+# *****
+def scale_and_save_versions(inPdb, inImg, inResizePercentages, inOutputImgFNBase, inQuality=jpegQuality):
+
+	# Duplicate the image once, flattened to a single layer
+	scaledImg = inPdb.gimp_image_duplicate(inImg)
+	
+	try:
+		
+		inPdb.gimp_image_undo_disable(scaledImg)
+		inPdb.gimp_image_flatten(scaledImg)
+		
+		# Largest first, each scale starts from the smaller previous result rather than the full image
+		for resizePercentage in sorted(inResizePercentages, reverse=True):
+			scaledHeight = max(1, int(inImg.height * resizePercentage / 100))
+			scaledWidth = max(1, int(inImg.width * resizePercentage / 100))
+			inPdb.gimp_image_scale(scaledImg, scaledWidth, scaledHeight)
+			save_jpeg_image(inPdb, scaledImg, inOutputImgFNBase + "_" + str(resizePercentage) + "percent.jpg", inQuality)
+	
+	finally:
+		inPdb.gimp_image_delete(scaledImg)
+
+
+# *****
+# save_jpeg_image
+#
+# Description: Flattens an image and saves it as a jpg
+#
+# Parameters:
+#		inPdb : Procedural database, pdb in GIMP
+# 		inImg : Image to be saved
+#		inFilePathName : Path and filename of the jpg
+#		inQuality : Jpg quality, from 0 to 1
+# *****
+def save_jpeg_image(inPdb, inImg, inFilePathName, inQuality=jpegQuality):
+
+	flattenedImgLayer = inPdb.gimp_image_flatten(inImg)
+	inPdb.file_jpeg_save(inImg, flattenedImgLayer, inFilePathName, inFilePathName, inQuality, 0, jpegOptimize, jpegProgressive, "Created with GIMP", jpegSubsampling, 0, 0, 0)	
 
 
 # *****
@@ -148,53 +324,78 @@ def get_root_name_from_filepath(inFullFP):
 
 
 # *****
-# Description: Registration of resize and sepia tone functions
-# *****
-register(
-	"create_sepia_effect",
-	"Create Sepia Effect",
-	"Adds a sepia effect to an image",
-	"ytirahc",
-	"Proprietary",
-	"2016",
-	"<Image>/Filters/MDT/Create Sepia Effect",
-	"*",
-	[],
-	[],
-	create_sepia_effect)
-
-
-register(
-	"create_scaled_versions",
-	"Create Scaled Versions",
-	"Creates different scaled versions of an image",
-	"ytirahc",
-	"Proprietary",
-	"2016",
-	"<Image>/Filters/MDT/Create Scaled Versions",
-	"*",
-	[
-		(PF_DIRNAME, "outputFolder", "Output directory", "")
-	],
-	[],
-	create_scaled_versions)
-
-
-register(
-	"create_scaled_versions_batch",
-	"Create Scaled Versions in Batch",
-	"Creates different scaled versions of images in a directory",
-	"ytirahc",
-	"Proprietary",
-	"2016",
-	"<Image>/Filters/MDT/Create Scaled Versions in Batch",
-	"*",
-	[
-		(PF_DIRNAME, "inputFolder", "Input directory", ""),
-		(PF_DIRNAME, "outputFolder", "Output directory", "")
-	],
-	[],
-	create_scaled_versions_batch)
-
-
-main()
+# Description: Registration of resize and sepia tone functions, when run by GIMP
+# *****
+if __name__ == "__main__":
+
+	register(
+		"create_sepia_effect",
+		"Create Sepia Effect",
+		"Adds a sepia effect to an image",
+		"ytirahc",
+		"Proprietary",
+		"2016",
+		"<Image>/Filters/MDT/Create Sepia Effect",
+		"*",
+		[],
+		[],
+		create_sepia_effect)
+
+
+	register(
+		"create_scaled_versions",
+		"Create Scaled Versions",
+		"Creates different scaled versions of an image",
+		"ytirahc",
+		"Proprietary",
+		"2016",
+		"<Image>/Filters/MDT/Create Scaled Versions",
+		"*",
+		[
+			(PF_DIRNAME, "outputFolder", "Output directory", ""),
+			(PF_SLIDER, "jpegQuality", "Jpg quality", jpegQuality, (0, 1, 0.01))
+		],
+		[],
+		create_scaled_versions)
+
+
+	register(
+		"create_scaled_versions_batch",
+		"Create Scaled Versions in Batch",
+		"Creates different scaled versions of images in a directory",
+		"ytirahc",
+		"Proprietary",
+		"2016",
+		"<Image>/Filters/MDT/Create Scaled Versions in Batch",
+		"*",
+		[
+			(PF_DIRNAME, "inputFolder", "Input directory", ""),
+			(PF_DIRNAME, "outputFolder", "Output directory", ""),
+			(PF_TOGGLE, "recursive", "Include subdirectories", False),
+			(PF_SLIDER, "jpegQuality", "Jpg quality", jpegQuality, (0, 1, 0.01))
+		],
+		[],
+		create_scaled_versions_batch)
+
+
+	register(
+		"batch_resize_and_sepia",
+		"Resize and Sepia Effect in Batch",
+		"Creates scaled and sepia versions of the images in a directory, without user interaction",
+		"ytirahc",
+		"Proprietary",
+		"2016",
+		"",
+		"",
+		[
+			(PF_DIRNAME, "inputFolder", "Input directory", ""),
+			(PF_DIRNAME, "outputFolder", "Output directory", ""),
+			(PF_TOGGLE, "recursive", "Include subdirectories", False),
+			(PF_SLIDER, "jpegQuality", "Jpg quality", jpegQuality, (0, 1, 0.01)),
+			(PF_STRING, "operations", "Operations, resize and/or sepia", "resize sepia")
+		],
+		[],
+		batch_resize_and_sepia)
+
+
+	main()